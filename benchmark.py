@@ -0,0 +1,589 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+import main as dococr
+
+
+# Sentetik Fatura Üretimi
+# Bilinen tarih/tutar/belge_no/satici_adi değerleriyle Türkçe fatura ve fiş metinleri üretilir.
+SELLER_NAMES = ["ANADOLU GIDA", "KARADENİZ YAPI", "EGE TEKSTİL", "MARMARA ELEKTRONİK", "TOROS MOBİLYA",
+                "BOĞAZİÇİ LOJİSTİK", "ÇUKUROVA TARIM", "AKDENİZ TURİZM", "YILDIZ KIRTASİYE", "DOĞU MARKET"]
+SELLER_SUFFIXES = ["SAN. VE TİC. A.Ş.", "TİC. LTD. ŞTİ.", "A.Ş.", "İNŞAAT LTD. ŞTİ."]
+MONTHS_TR = ["Ocak", "Şubat", "Mart", "Nisan", "Mayıs", "Haziran", "Temmuz", "Ağustos", "Eylül", "Ekim", "Kasım", "Aralık"]
+ITEM_NAMES = ["Kağıt A4", "Toner", "Su 19L", "Kablo", "Vida Seti", "Deterjan", "Çay 1kg", "Kalem", "Klasör", "Matbu Form"]
+OCR_CONFUSIONS = {"0": "O", "1": "l", "5": "S", "8": "B", "ı": "i", "ş": "s", "ğ": "g"}
+
+def format_amount_tr(value):
+    integer_part, decimal_part = f"{value:.2f}".split(".")
+    groups = []
+    while len(integer_part) > 3:
+        groups.insert(0, integer_part[-3:])
+        integer_part = integer_part[:-3]
+    groups.insert(0, integer_part)
+    return ".".join(groups) + "," + decimal_part
+
+def make_synthetic_invoice(rng):
+    seller = f"{rng.choice(SELLER_NAMES)} {rng.choice(SELLER_SUFFIXES)}"
+    day, month, year = rng.randint(1, 28), rng.randint(1, 12), rng.randint(2019, 2025)
+    if rng.random() < 0.8:
+        date_text = f"{day:02d}.{month:02d}.{year}"
+    else:
+        date_text = f"{day} {MONTHS_TR[month - 1]} {year}"
+    doc_no = f"{rng.choice(['FTR', 'A', 'GIB', 'SF'])}{year}{rng.randint(10 ** 8, 10 ** 9 - 1)}"
+
+    items = []
+    for _ in range(rng.randint(2, 6)):
+        quantity = rng.randint(1, 20)
+        unit_price = round(rng.uniform(5, 2500), 2)
+        items.append((rng.choice(ITEM_NAMES), quantity, unit_price))
+    subtotal = sum(quantity * unit_price for _, quantity, unit_price in items)
+    vat = round(subtotal * 0.20, 2)
+    total = round(subtotal + vat, 2)
+
+    lines = [
+        seller,
+        f"{rng.choice(['Atatürk Cad.', 'Cumhuriyet Mah.', 'İnönü Sok.'])} No:{rng.randint(1, 250)} {rng.choice(['İstanbul', 'Ankara', 'İzmir', 'Bursa'])}",
+        f"{rng.choice(['Kadıköy', 'Çankaya', 'Konak', 'Nilüfer'])} VERGİ DAİRESİ {rng.randint(10 ** 9, 10 ** 10 - 1)}",
+        "E-ARŞİV FATURA" if rng.random() < 0.6 else "SATIŞ FİŞİ",
+        f"Fatura No: {doc_no}",
+        f"Tarih: {date_text}",
+    ]
+    for name, quantity, unit_price in items:
+        lines.append(f"{name} {quantity} x {format_amount_tr(unit_price)} {format_amount_tr(quantity * unit_price)}")
+    lines += [
+        f"Ara Toplam {format_amount_tr(subtotal)} TL",
+        f"KDV %20 {format_amount_tr(vat)} TL",
+        f"Genel Toplam {format_amount_tr(total)} TL",
+        "Bizi tercih ettiğiniz için teşekkür ederiz",
+    ]
+    fields = {"tarih": date_text, "tutar": format_amount_tr(total), "belge_no": doc_no.upper(), "satici_adi": seller}
+    return {"fields": fields, "lines": lines}
+
+def add_ocr_noise(text, rng, rate):
+    if rate <= 0:
+        return text
+    return "".join(OCR_CONFUSIONS[ch] if ch in OCR_CONFUSIONS and rng.random() < rate else ch for ch in text)
+
+def make_text_corpus(doc_count, seed, noise_rate=0.02):
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(doc_count):
+        invoice = make_synthetic_invoice(rng)
+        text = "\n".join(invoice["lines"])
+        texts.append(add_ocr_noise(text, rng, noise_rate) if rng.random() < 0.5 else text)
+    return texts
+
+
+# Regex Mikro Ölçümü
+# Karşılaştırma için FieldExtractor öncesindeki extract_info_from_text_regex birebir korunmuştur.
+def legacy_extract_info_from_text_regex(text):
+    extracted = {"tarih": None, "tutar": None, "belge_no": None, "satici_adi": None}
+    if not text or not isinstance(text, str):
+        return extracted
+
+    date_patterns = [
+        r'\b(\d{1,2}[./-]\d{1,2}[./-]\d{2,4})\b',
+        r'\b(\d{2,4}[./-]\d{1,2}[./-]\d{1,2})\b',
+        r'\b(\d{1,2}\s+(?:Ocak|Şubat|Mart|Nisan|Mayıs|Haziran|Temmuz|Ağustos|Eylül|Ekim|Kasım|Aralık|JAN|FEB|MAR|APR|MAY|JUN|JUL|AUG|SEP|OCT|NOV|DEC)\s+\d{2,4})\b'
+    ]
+    for pattern in date_patterns:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            extracted["tarih"] = match.group(1)
+            break
+
+    amount_patterns = [
+        r'(?:toplam|tutar|yek[üu]n|total|ara\s*toplam|genel\s*toplam)\s*[:\s]*([0-9.,]+)\s*(?:tl|try|eur|usd|€|\$)?',
+        r'([0-9.,]+)\s*(?:tl|try|eur|usd|€|\$)\s*(?:toplam|tutar|yek[üu]n|total|genel\s*toplam)',
+        r'\b([0-9.,]+)\s*(?:tl|try|eur|usd|€|\$)\b',
+        r'\b(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{1,2})?|\d+[.,]\d{1,2})\b(?!\s*\d)'
+    ]
+    best_amount_str = None
+    max_numeric_value = 0.0
+    for idx, pattern in enumerate(amount_patterns):
+        if idx == len(amount_patterns) - 1 and best_amount_str: continue
+        matches = re.finditer(pattern, text, re.IGNORECASE)
+        for match in matches:
+            amount_candidate_str = match.group(1)
+            try:
+                normalized_amount_str = amount_candidate_str.replace(' ', '').strip()
+                normalized_amount_str = re.sub(r'[^\d.,]', '', normalized_amount_str)
+
+                if not normalized_amount_str: continue
+
+                if '.' in normalized_amount_str and ',' in normalized_amount_str:
+                    if normalized_amount_str.rfind('.') > normalized_amount_str.rfind(','):
+                        normalized_amount_str = normalized_amount_str.replace('.', '').replace(',', '.')
+                    else:
+                        normalized_amount_str = normalized_amount_str.replace(',', '')
+                elif ',' in normalized_amount_str:
+                    normalized_amount_str = normalized_amount_str.replace(',', '.')
+
+                if normalized_amount_str.endswith('.') or normalized_amount_str.endswith(','):
+                    normalized_amount_str = normalized_amount_str[:-1]
+
+                if normalized_amount_str.count('.') > 1 :
+                     parts = normalized_amount_str.split('.')
+                     if len(parts[-1]) != 2 and len(parts) > 2:
+                         normalized_amount_str = "".join(parts[:-1]) + "." + parts[-1]
+
+
+                if not re.match(r'^\d+(\.\d+)?$', normalized_amount_str):
+                    continue
+
+                numeric_value = float(normalized_amount_str)
+
+                is_keyword_pattern = any(kw in pattern.lower() for kw in ["toplam", "tutar", "yekun", "total"])
+                if is_keyword_pattern:
+                    if numeric_value > max_numeric_value:
+                        max_numeric_value = numeric_value
+                        best_amount_str = amount_candidate_str.strip()
+                elif not best_amount_str and 0.01 < numeric_value < 100000000:
+                     if numeric_value > max_numeric_value:
+                        max_numeric_value = numeric_value
+                        best_amount_str = amount_candidate_str.strip()
+            except ValueError:
+                continue
+    extracted["tutar"] = best_amount_str
+
+    doc_no_patterns = [
+        r'(?:fatura\s*(?:no|numarası)|belge\s*no|fiş\s*no|seri\s*no|işlem\s*no|sipariş\s*no|doküman\s*no|invoice\s*n[o\.]?\.?|receipt\s*no)\s*[:\s]*([a-z0-9\-/]{5,30})',
+        r'\b([A-Z]{1,4}[-/]?\s?\d{6,25})\b',
+        r'\b([A-Z0-9]{8,25})\b'
+    ]
+    for pattern in doc_no_patterns:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            potential_no = match.group(1).upper().strip()
+            if "belge_no" not in extracted or not extracted["belge_no"]:
+                if not (potential_no.isdigit() and (len(potential_no) > 18 or len(potential_no) < 6)):
+                    if re.search(r'[A-Z]', potential_no) or len(potential_no) >= 7 :
+                        extracted["belge_no"] = potential_no
+                        break
+            elif len(potential_no) > len(extracted.get("belge_no", "")):
+                 extracted["belge_no"] = potential_no
+                 break
+
+    seller_patterns = [
+        r'^([A-ZÇĞİÖŞÜ][A-Za-zÇĞİÖŞÜçğıöşü\s.,&-]+(?:A\.Ş\.|LTD\.|ŞTİ\.|ANONİM ŞİRKETİ|LİMİTED ŞİRKETİ|CO\.|INC\.))\s*$',
+        r'([A-ZÇĞİÖŞÜ][A-Za-zÇĞİÖŞÜçğıöşü\s.,&-]{5,50}(?:A\.Ş\.|LTD\.|ŞTİ\.))',
+        r'MERKEZİ|ŞUBESİ'
+    ]
+    lines = text.split('\n')
+    for i, line in enumerate(lines[:5]):
+        if extracted["satici_adi"]: break
+        if any(skip_kw in line.upper() for skip_kw in ['MERKEZİ', 'ŞUBESİ', 'VERGİ DAİRESİ', 'V.D.']):
+            continue
+        for pattern in seller_patterns[:-1]:
+            match = re.search(pattern, line)
+            if match:
+                candidate_seller = match.group(1).strip()
+                if len(candidate_seller) > 4 and not re.match(r'^\d+\s|NO:|CAD\.|SOK\.', candidate_seller.upper()):
+                    extracted["satici_adi"] = candidate_seller
+                    break
+    return extracted
+
+def _docs_per_second(function, texts, repeats):
+    best_elapsed = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(texts)
+        elapsed = time.perf_counter() - start
+        best_elapsed = elapsed if best_elapsed is None else min(best_elapsed, elapsed)
+    return len(texts) / best_elapsed if best_elapsed else 0.0
+
+def run_regex_benchmark(doc_count, repeats, seed, engines_per_image=4, noise_rate=0.02):
+    # Her belge, ana döngüdeki gibi motor sayısı kadar okunur; motorlar birbirinden farklı hatalar yaptığından
+    # her kopyaya ayrı gürültü eklenir. Birebir aynı kalan kopyalar extract_deduplicated'in tekrar ayıklamasını ölçer.
+    corpus = make_text_corpus(doc_count, seed, noise_rate=0)
+    rng = random.Random(seed + 1)
+    texts = [add_ocr_noise(text, rng, noise_rate) for text in corpus for _ in range(engines_per_image)]
+    extractor = dococr.FieldExtractor()
+
+    mismatches = sum(1 for text in texts if legacy_extract_info_from_text_regex(text) != extractor.extract(text))
+    results = {
+        "legacy": _docs_per_second(lambda batch: [legacy_extract_info_from_text_regex(t) for t in batch], texts, repeats),
+        "field_extractor": _docs_per_second(lambda batch: [extractor.extract(t) for t in batch], texts, repeats),
+        "field_extractor_dedup": _docs_per_second(extractor.extract_deduplicated, texts, repeats),
+    }
+    return {
+        "benchmark": "regex",
+        "documents": len(texts),
+        "unique_documents": len(set(texts)),
+        "seed": seed,
+        "docs_per_second": results,
+        "speedup": {name: value / results["legacy"] for name, value in results.items()},
+        "mismatches": mismatches,
+    }
+
+def print_regex_report(report):
+    print(f"\n== Regex Alan Çıkarımı ({report['documents']} metin, {report['unique_documents']} benzersiz) ==")
+    for name, value in report["docs_per_second"].items():
+        print(f"  {name:<24} {value:>12.0f} belge/sn  (x{report['speedup'][name]:.2f})")
+    if report["mismatches"]:
+        print(f"  UYARI: {report['mismatches']} belgede eski ve yeni çıkarıcı farklı sonuç verdi!")
+    else:
+        print("  Eski ve yeni çıkarıcı tüm belgelerde aynı sonucu verdi.")
+
+
+# Sentetik Görüntü Üretimi
+# Faturalar PIL ile çizilir, ardından OpenCV ile hafif döndürme, bulanıklık ve gürültü eklenerek
+# taranmış belgeye benzetilir. Aynı tohum her zaman aynı veri setini üretir.
+FONT_CANDIDATES = ["DejaVuSans.ttf", "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+                   "/usr/share/fonts/dejavu/DejaVuSans.ttf", "LiberationSans-Regular.ttf", "arial.ttf"]
+
+def load_font(size):
+    for candidate in FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(candidate, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size=size)
+
+def render_invoice_image(invoice, rng, width=1240, font_size=28):
+    font = load_font(font_size)
+    line_height = int(font_size * 1.6)
+    margin = 60
+    height = margin * 2 + line_height * len(invoice["lines"])
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(invoice["lines"]):
+        x = margin + (rng.randint(0, 40) if i > 0 else 0)
+        draw.text((x, margin + i * line_height), line, fill=(20, 20, 20), font=font)
+    bgr = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+
+    angle = rng.uniform(-1.5, 1.5)
+    rotation = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    bgr = cv2.warpAffine(bgr, rotation, (width, height), borderValue=(255, 255, 255))
+    if rng.random() < 0.5:
+        bgr = cv2.GaussianBlur(bgr, (3, 3), 0)
+    noise = np.random.default_rng(rng.randint(0, 2 ** 31)).normal(0, 6, bgr.shape)
+    return np.clip(bgr.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+
+def build_image_dataset(dataset_dir, image_count, seed):
+    os.makedirs(dataset_dir, exist_ok=True)
+    rng = random.Random(seed)
+    samples = []
+    for i in range(image_count):
+        invoice = make_synthetic_invoice(rng)
+        file_name = f"sentetik_{seed}_{i:04d}.png"
+        cv2.imwrite(os.path.join(dataset_dir, file_name), render_invoice_image(invoice, rng))
+        samples.append({"image_file": file_name, "fields": invoice["fields"]})
+    with open(os.path.join(dataset_dir, "ground_truth.json"), 'w', encoding='utf-8') as f:
+        json.dump(samples, f, ensure_ascii=False, indent=4)
+    return samples
+
+
+# OCR Ölçüm Takımı
+def _parse_amount_for_comparison(value):
+    # Son ayırıcı ondalık kabul edilir (1.234,50 ve 1,234.50 -> 1234.5)
+    digits = re.sub(r'[^\d.,]', '', value)
+    last_separator = max(digits.rfind('.'), digits.rfind(','))
+    if last_separator != -1 and len(digits) - last_separator - 1 in (1, 2):
+        digits = digits[:last_separator].replace('.', '').replace(',', '') + '.' + digits[last_separator + 1:]
+    else:
+        digits = digits.replace('.', '').replace(',', '')
+    try:
+        return round(float(digits), 2)
+    except ValueError:
+        return None
+
+def _normalize_field(field_name, value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    if field_name == "tutar":
+        return _parse_amount_for_comparison(value)
+    if field_name == "tarih":
+        return re.sub(r'[./-]', '.', value.casefold())
+    return re.sub(r'\s+', ' ', value).casefold()
+
+def field_matches(field_name, predicted, expected):
+    predicted_norm = _normalize_field(field_name, predicted)
+    return predicted_norm is not None and predicted_norm == _normalize_field(field_name, expected)
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def latency_summary(latencies):
+    return {"p50_ms": percentile(latencies, 0.50) * 1000, "p90_ms": percentile(latencies, 0.90) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000, "mean_ms": (sum(latencies) / len(latencies) * 1000) if latencies else 0.0,
+            "max_ms": max(latencies) * 1000 if latencies else 0.0}
+
+def peak_rss_mb():
+    # Linux'ta ru_maxrss KB, macOS'ta bayt cinsindendir
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_ocr_benchmark(dataset_dir, samples, engine_names, preprocess_config=None, shared_detector=None):
+    field_names = ["tarih", "tutar", "belge_no", "satici_adi"]
+    report = {"benchmark": "ocr", "images": len(samples), "engines": {}, "engine_versions": {},
+              "preprocess": preprocess_config, "shared_detector": shared_detector}
+    images = []
+    preprocess_latencies = []
+    for sample in samples:
+        image_path = os.path.join(dataset_dir, sample["image_file"])
+        bgr = cv2.imread(image_path)
+        if preprocess_config:
+            # Ön işleme resim başına bir kez yapılır ve tüm motorlar aynı normalleştirilmiş görüntüyü alır
+            start = time.perf_counter()
+            bgr, _ = dococr.preprocess_image_for_ocr(bgr, preprocess_config)
+            preprocess_latencies.append(time.perf_counter() - start)
+        images.append((image_path, bgr, cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)))
+    if preprocess_latencies:
+        report["preprocess_latency"] = latency_summary(preprocess_latencies)
+        print(f"  Ön işleme: p50 {report['preprocess_latency']['p50_ms']:.0f} ms, "
+              f"p90 {report['preprocess_latency']['p90_ms']:.0f} ms")
+
+    # Ortak tespit: tüm tanıyıcılar aynı bölgeler üzerinde karşılaştırılır
+    regions_per_image = [None] * len(images)
+    if shared_detector:
+        detector = dococr.OCR_ENGINE_PLUGINS[shared_detector]
+        detector["loader"]()
+        detect_latencies = []
+        for index, (image_path, bgr, gray) in enumerate(images):
+            detector_input = dococr.build_engine_input(detector["input_type"], image_path, bgr, gray)
+            start = time.perf_counter()
+            quads = detector["detector"](detector_input, *detector["args"])
+            detect_latencies.append(time.perf_counter() - start)
+            regions_per_image[index] = dococr.sort_regions_reading_order(quads) if quads is not None else None
+        report["detect_latency"] = latency_summary(detect_latencies)
+        print(f"  Ortak tespit ({shared_detector}): p50 {report['detect_latency']['p50_ms']:.0f} ms, "
+              f"p90 {report['detect_latency']['p90_ms']:.0f} ms")
+
+    for engine_name in engine_names:
+        plugin = dococr.OCR_ENGINE_PLUGINS[engine_name]
+        print(f"\n  Motor: {engine_name.upper()}")
+        load_start = time.perf_counter()
+        plugin["loader"]()
+        load_time = time.perf_counter() - load_start
+        rss_before = peak_rss_mb()
+
+        latencies, regex_latencies = [], []
+        correct = {field_name: 0 for field_name in field_names}
+        exact_matches = 0
+        run_start = time.perf_counter()
+        for sample, (image_path, bgr, gray), regions in zip(samples, images, regions_per_image):
+            start = time.perf_counter()
+            recognized = None
+            if regions is not None and "recognizer" in plugin:
+                recognizer_input = dococr.build_engine_input(plugin["recognizer_input_type"], image_path, bgr, gray)
+                recognized = plugin["recognizer"](recognizer_input, regions[0], *plugin["args"])
+            if recognized is not None:
+                full_text, _ = dococr.regions_to_result(engine_name, regions[0], regions[1], recognized)
+            else:
+                ocr_input = dococr.build_engine_input(plugin["input_type"], image_path, bgr, gray)
+                try:
+                    full_text, _ = plugin["function"](ocr_input, *plugin["args"])
+                except dococr.OcrEngineError as e:
+                    print(f"    {e}")
+                    full_text = ""
+            latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            predicted = dococr.extract_info_from_text_regex(full_text)
+            regex_latencies.append(time.perf_counter() - start)
+
+            matches = [field_matches(f, predicted[f], sample["fields"][f]) for f in field_names]
+            for field_name, matched in zip(field_names, matches):
+                correct[field_name] += matched
+            exact_matches += all(matches)
+        run_elapsed = time.perf_counter() - run_start
+
+        image_count = len(samples) or 1
+        report["engines"][engine_name] = {
+            "load_time_s": load_time,
+            "latency": latency_summary(latencies),
+            "regex_latency": latency_summary(regex_latencies),
+            "images_per_second": len(samples) / run_elapsed if run_elapsed > 0 else 0.0,
+            "peak_rss_mb": peak_rss_mb(),
+            "peak_rss_increase_mb": peak_rss_mb() - rss_before,
+            "field_accuracy": {f: correct[f] / image_count for f in field_names},
+            "all_fields_accuracy": exact_matches / image_count,
+        }
+        report["engine_versions"][engine_name] = dococr.get_engine_version(engine_name)
+        print_engine_report(engine_name, report["engines"][engine_name])
+    return report
+
+def print_engine_report(engine_name, engine_report):
+    latency = engine_report["latency"]
+    accuracy = ", ".join(f"{f} %{v * 100:.0f}" for f, v in engine_report["field_accuracy"].items())
+    print(f"    yükleme {engine_report['load_time_s']:.2f} sn | p50 {latency['p50_ms']:.0f} ms, "
+          f"p90 {latency['p90_ms']:.0f} ms, p99 {latency['p99_ms']:.0f} ms | {engine_report['images_per_second']:.2f} resim/sn | "
+          f"tepe RSS {engine_report['peak_rss_mb']:.0f} MB")
+    print(f"    doğruluk: {accuracy} | tüm alanlar %{engine_report['all_fields_accuracy'] * 100:.0f}")
+
+# Belge Kırpma Regresyon Vakaları
+# Ön işlemenin kırpma adımı yalnızca arka plan üzerindeki sayfayı kırpmalı; kadrajı dolduran bir faturadaki çerçeveli
+# tablo veya input klasöründeki örnek fatura kırpılmamalı. Korunan bölge (çıktı görüntüsünün orijinal koordinatlardaki
+# karşılığı) beklenen bölgenin en az %98'ini kapsamalı (metin atılmamalı) ve ondan en fazla %25 büyük olmalı (arka plan
+# kırpılmalı; eğiklik düzeltmesi ve kenar payı küçük bir fazlalık bırakır).
+def make_full_frame_table_case(rng):
+    image = render_invoice_image(make_synthetic_invoice(rng), rng)
+    height, width = image.shape[:2]
+    top, bottom = int(height * 0.3), int(height * 0.75)
+    cv2.rectangle(image, (40, top), (width - 40, bottom), (30, 30, 30), 3)
+    for y in range(top, bottom, max(20, (bottom - top) // 6)):
+        cv2.line(image, (40, y), (width - 40, y), (30, 30, 30), 2)
+    return image, (0, 0, width, height)
+
+def make_page_on_background_case(rng):
+    page = render_invoice_image(make_synthetic_invoice(rng), rng)
+    height, width = page.shape[:2]
+    canvas_width, canvas_height = int(width * 1.4), int(height * 1.4)
+    x0, y0 = (canvas_width - width) / 2, (canvas_height - height) / 2
+    corners = np.float32([[x0, y0], [x0 + width, y0], [x0 + width, y0 + height], [x0, y0 + height]])
+    corners += np.float32([[rng.uniform(-0.03, 0.03) * width, rng.uniform(-0.03, 0.03) * height] for _ in range(4)])
+    warp = cv2.getPerspectiveTransform(np.float32([[0, 0], [width, 0], [width, height], [0, height]]), corners)
+    background = (rng.randint(40, 90), rng.randint(40, 90), rng.randint(40, 90))
+    image = cv2.warpPerspective(page, warp, (canvas_width, canvas_height), borderValue=background)
+    noise = np.random.default_rng(rng.randint(0, 2 ** 31)).normal(0, 4, image.shape)
+    image = np.clip(image.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+    (left, top), (right, bottom) = corners.min(axis=0), corners.max(axis=0)
+    return image, (left, top, right, bottom)
+
+def kept_region(image, preprocess_config):
+    normalized, matrix = dococr.preprocess_image_for_ocr(image, preprocess_config)
+    height, width = normalized.shape[:2]
+    inverse = np.linalg.inv(np.vstack([matrix, [0, 0, 1]]))
+    corners = np.array([[0, 0, 1], [width, 0, 1], [width, height, 1], [0, height, 1]], dtype=np.float64) @ inverse.T
+    image_height, image_width = image.shape[:2]
+    left, top = np.clip(corners[:, :2].min(axis=0), 0, None)
+    right, bottom = np.minimum(corners[:, :2].max(axis=0), [image_width, image_height])
+    return float(left), float(top), float(right), float(bottom)
+
+def box_area(box):
+    return max(0.0, box[2] - box[0]) * max(0.0, box[3] - box[1])
+
+def region_coverage(kept, expected):
+    # (beklenen bölgenin korunan oranı, korunan alan / beklenen alan)
+    intersection = box_area((max(kept[0], expected[0]), max(kept[1], expected[1]),
+                             min(kept[2], expected[2]), min(kept[3], expected[3])))
+    return intersection / box_area(expected), box_area(kept) / box_area(expected)
+
+def run_crop_benchmark(case_count, seed):
+    rng = random.Random(seed)
+    preprocess_config = dococr.get_preprocess_config(True)
+    cases = []
+    for i in range(case_count):
+        cases.append((f"tam_kadraj_tablo_{i}",) + make_full_frame_table_case(rng))
+        cases.append((f"arka_plan_sayfa_{i}",) + make_page_on_background_case(rng))
+    sample_path = os.path.join(dococr.INPUT_IMAGE_DIR, "Ukazkova_faktura.png")
+    if os.path.exists(sample_path):
+        sample = cv2.imread(sample_path)
+        cases.append(("ornek_fatura", sample, (0, 0, sample.shape[1], sample.shape[0])))
+    results = []
+    for name, image, expected in cases:
+        coverage, size_ratio = region_coverage(kept_region(image, preprocess_config), expected)
+        results.append({"case": name, "coverage": coverage, "size_ratio": size_ratio,
+                        "passed": coverage >= 0.98 and size_ratio <= 1.25})
+    return {"benchmark": "crop", "seed": seed, "cases": results,
+            "failures": sum(1 for result in results if not result["passed"])}
+
+def print_crop_report(report):
+    print(f"\n== Belge Kırpma Regresyonu ({len(report['cases'])} vaka) ==")
+    for result in report["cases"]:
+        print(f"  {result['case']:<24} kapsama %{result['coverage'] * 100:.1f}, boyut x{result['size_ratio']:.2f}  "
+              f"{'geçti' if result['passed'] else 'KALDI'}")
+    if report["failures"]:
+        print(f"  UYARI: {report['failures']} vakada korunan bölge beklenenden farklı!")
+
+def compare_reports(previous, current):
+    # Aynı motor için önceki rapora göre verim ve doğruluk değişimlerini yazdırır
+    print("\n== Önceki Raporla Karşılaştırma ==")
+    for engine_name, current_engine in current.get("engines", {}).items():
+        previous_engine = previous.get("engines", {}).get(engine_name)
+        if previous_engine is None:
+            print(f"  {engine_name}: önceki raporda yok")
+            continue
+        throughput_change = current_engine["images_per_second"] - previous_engine["images_per_second"]
+        accuracy_change = current_engine["all_fields_accuracy"] - previous_engine["all_fields_accuracy"]
+        p90_change = current_engine["latency"]["p90_ms"] - previous_engine["latency"]["p90_ms"]
+        print(f"  {engine_name}: resim/sn {throughput_change:+.2f}, p90 {p90_change:+.0f} ms, "
+              f"tüm alanlar doğruluğu {accuracy_change * 100:+.1f} puan")
+
+
+def environment_info():
+    return {"python": platform.python_version(), "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+def write_report(report, output_path):
+    report = dict(report, environment=environment_info())
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=4)
+    print(f"\nRapor {output_path} dosyasına yazıldı.")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="DocOCR performans ölçümleri.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    regex_parser = subparsers.add_parser("regex", help="Regex alan çıkarıcısının belge/sn ölçümü (eski ve yeni).")
+    regex_parser.add_argument("--docs", type=int, default=2000, help="Üretilecek sentetik belge sayısı.")
+    regex_parser.add_argument("--repeats", type=int, default=3, help="Ölçüm tekrarı (en iyisi raporlanır).")
+    regex_parser.add_argument("--seed", type=int, default=42)
+    regex_parser.add_argument("--json", metavar="RAPOR", help="Raporu JSON olarak bu dosyaya yaz.")
+
+    crop_parser = subparsers.add_parser("crop", help="Ön işleme kırpmasının regresyon vakaları (tam kadraj tablo, arka plan üzerinde sayfa).")
+    crop_parser.add_argument("--cases", type=int, default=5, help="Her vaka türünden üretilecek görüntü sayısı.")
+    crop_parser.add_argument("--seed", type=int, default=42)
+    crop_parser.add_argument("--json", metavar="RAPOR", help="Raporu JSON olarak bu dosyaya yaz.")
+
+    ocr_parser = subparsers.add_parser("ocr", help="Sentetik faturalarda OCR motorlarının gecikme, verim, bellek ve doğruluk ölçümü.")
+    ocr_parser.add_argument("--images", type=int, default=20, help="Üretilecek sentetik fatura sayısı.")
+    ocr_parser.add_argument("--seed", type=int, default=42)
+    ocr_parser.add_argument("--engines", default=",".join(dococr.DEFAULT_OCR_ENGINES),
+                            help="Ölçülecek OCR motorları, virgülle ayrılmış.")
+    ocr_parser.add_argument("--dataset-dir", default=os.path.join(dococr.OUTPUT_DATA_DIR, "benchmark_dataset"),
+                            help="Sentetik görüntülerin ve ground_truth.json dosyasının yazılacağı klasör.")
+    ocr_parser.add_argument("--preprocess", action="store_true",
+                            help="Görüntüleri motorlardan önce main.py'deki ön işleme aşamasından geçir.")
+    ocr_parser.add_argument("--detect-once", metavar="DEDEKTOR",
+                            help="Bölgeleri bu motorun dedektörüyle bir kez bul; tüm tanıyıcılar aynı bölgelerde ölçülür.")
+    ocr_parser.add_argument("--json", metavar="RAPOR", help="Raporu JSON olarak bu dosyaya yaz.")
+    ocr_parser.add_argument("--compare", metavar="ONCEKI_RAPOR", help="Önceki bir JSON raporuyla karşılaştır.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "regex":
+        report = run_regex_benchmark(args.docs, args.repeats, args.seed)
+        print_regex_report(report)
+    elif args.command == "crop":
+        report = run_crop_benchmark(args.cases, args.seed)
+        print_crop_report(report)
+    elif args.command == "ocr":
+        engine_names = dococr.select_ocr_engines([e.strip() for e in args.engines.split(",") if e.strip()])
+        if not engine_names:
+            print("Hata: Ölçülebilecek OCR motoru yok.")
+            return 1
+        print(f"{args.images} sentetik fatura {args.dataset_dir} klasörüne üretiliyor...")
+        samples = build_image_dataset(args.dataset_dir, args.images, args.seed)
+        report = run_ocr_benchmark(args.dataset_dir, samples, engine_names, dococr.get_preprocess_config(args.preprocess),
+                                   dococr.select_shared_detector(args.detect_once))
+        report["seed"] = args.seed
+        if args.compare:
+            with open(args.compare, 'r', encoding='utf-8') as f:
+                compare_reports(json.load(f), report)
+    if args.json:
+        write_report(report, args.json)
+    return 1 if report.get("mismatches") or report.get("failures") else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,18 +1,162 @@
 import os
+import sys
 import json
 import re
+import time
+import hashlib
+import argparse
+import abc
+import functools
+import importlib
+import importlib.util
+import multiprocessing
+import multiprocessing.util
+import asyncio
+import threading
+import random
+import gc
+import signal
+import concurrent.futures
+import contextlib
+import queue
+from collections import OrderedDict, deque
+
+_PROCESS_START = time.perf_counter()
+
 import cv2
 from PIL import Image
-import pytesseract
-import easyocr
 import numpy as np
-import google.generativeai as genai 
+
+_CORE_IMPORT_TIME = time.perf_counter() - _PROCESS_START
 
 # Gemini API Yapılandırması 
 GOOGLE_API_KEY = "API-KEY" #--> APİ anahtarını girin
-USE_GEMINI = False 
+USE_GEMINI = True # Anahtar yoksa veya yapılandırma başarısız olursa LLM otomatik olarak devre dışı kalır
+GEMINI_MODEL_NAME = 'gemini-1.5-flash-latest'
+
+
+# Tembel İçe Aktarma
+# OCR motorları ve Gemini istemcisi ağır kütüphaneler (PyTorch, TensorFlow, Paddle) getirdiği için
+# yalnızca ilk kullanımda içe aktarılır; süreler --timing raporu için kaydedilir.
+OPTIONAL_MODULE_MESSAGES = {
+    "pytesseract": "Bilgi: pytesseract kütüphanesi bulunamadı. Tesseract motoru atlanacaktır.",
+    "easyocr": "Bilgi: easyocr kütüphanesi bulunamadı. EasyOCR motoru atlanacaktır.",
+    "keras_ocr": "Bilgi: keras-ocr kütüphanesi bulunamadı veya TensorFlow/PyTorch kurulu değil. Keras-OCR motoru atlanacaktır.",
+    "paddleocr": "Bilgi: paddleocr kütüphanesi bulunamadı veya paddlepaddle kurulu değil. PaddleOCR motoru atlanacaktır.",
+    "google.generativeai": "Bilgi: google-generativeai kütüphanesi bulunamadı. LLM özelliği devre dışı bırakılacak.",
+    "pypdfium2": "Bilgi: PDF desteği için pypdfium2 veya PyMuPDF (fitz) kurulu değil. PDF dosyaları atlanacaktır.",
+    "pyarrow": "Bilgi: pyarrow kütüphanesi bulunamadı. Kutucuk tablosu (Parquet/Arrow) dışa aktarımı yapılmayacak.",
+}
+_imported_modules = {}
+module_import_times = {}
+
+def is_module_installed(module_name):
+    try:
+        return importlib.util.find_spec(module_name) is not None
+    except (ImportError, ValueError):
+        return False
+
+def import_optional_module(module_name):
+    if module_name in _imported_modules:
+        return _imported_modules[module_name]
+    start = time.perf_counter()
+    try:
+        module = importlib.import_module(module_name)
+    except ImportError:
+        module = None
+        # tesserocr gibi yalnızca hızlandırıcı olan modüller için mesaj yazdırılmaz
+        if module_name in OPTIONAL_MODULE_MESSAGES:
+            print(OPTIONAL_MODULE_MESSAGES[module_name])
+    module_import_times[module_name] = time.perf_counter() - start
+    _imported_modules[module_name] = module
+    return module
+
+
+# Konfigürasyon
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+INPUT_IMAGE_DIR = os.path.join(BASE_DIR, "input")
+OUTPUT_ANNOTATED_DIR = os.path.join(BASE_DIR, "output") 
+OUTPUT_DATA_DIR = os.path.join(BASE_DIR, "output")         #
+OUTPUT_JSON_FILE = os.path.join(OUTPUT_DATA_DIR, "extracted_data.json")
+OUTPUT_RESULTS_FILE = os.path.join(OUTPUT_DATA_DIR, "extracted_data.jsonl") # Her kayıt üretildiği anda eklenir
+OUTPUT_MANIFEST_FILE = os.path.join(OUTPUT_DATA_DIR, "manifest.jsonl") # İşlenmiş dosyalar (boyut, mtime, özet, kayıtlar)
+OUTPUT_DETECTIONS_DIR = os.path.join(OUTPUT_DATA_DIR, "detections") # Çalışma başına bir Parquet/Arrow dosyası
+LLM_CACHE_DIR = os.path.join(OUTPUT_DATA_DIR, "llm_cache")
+METRICS_DIR = os.path.join(OUTPUT_DATA_DIR, "metrics")
+
+USE_OCR_CACHE = True
+OCR_CACHE_DIR = os.path.join(OUTPUT_DATA_DIR, "ocr_cache")
+OCR_CACHE_MAX_BYTES = 512 * 1024 * 1024 # Bu boyut aşılınca en uzun süredir kullanılmayan kayıtlar silinir
+
+ANNOTATION_FORMAT = "png" # "png", "jpg" veya "none" (işaretlenmiş resim yazılmaz)
+ANNOTATION_MAX_SIDE = 0 # 0 değilse işaretlenmiş resim en uzun kenarı bu değere inecek şekilde küçültülür (önizleme)
+ANNOTATION_JPEG_QUALITY = 85
+ANNOTATION_QUEUE_SIZE = 8 # Kodlanmayı bekleyen en fazla işaretlenmiş resim; dolunca OCR döngüsü bekler
+
+# Görüntü normalizasyonu (--preprocess ile de açılır). Motorlar küçültülmüş, eğikliği düzeltilmiş ve belgeye
+# kırpılmış görüntüyü alır; kutucuklar işaretleme ve kayıt için orijinal koordinatlara geri dönüştürülür.
+PREPROCESS_ENABLED = False
+PREPROCESS_TARGET_TEXT_HEIGHT = 24 # Ortanca karakter yüksekliği (piksel); daha büyük metin bu değere küçültülür, büyütme yapılmaz
+PREPROCESS_MAX_SIDE = 2500
+PREPROCESS_DESKEW = True
+PREPROCESS_MAX_SKEW_ANGLE = 10 # derece
+PREPROCESS_CROP_DOCUMENT = True # Yalnızca arka plan üzerindeki sayfanın kenarları bulunursa kırpılır
+PREPROCESS_CROP_MIN_SPAN = 0.5 # Sayfa çokgeni her iki eksende kadrajın en az bu oranını kaplamalı
+PREPROCESS_CROP_MIN_CONTRAST = 40 # Sayfa içi ile dışı arasındaki en düşük ortalama gri farkı
+PREPROCESS_CROP_MAX_OUTSIDE_INK = 0.005 # Sayfa dışında izin verilen kenar (mürekkep) pikseli oranı
+PREPROCESS_DENOISE = False # Yavaştır; gürültülü telefon fotoğrafları için
+PREPROCESS_BINARIZE = False # Uyarlamalı eşikleme; renkli motorlar da ikili görüntüyü alır
+USE_PREPROCESS_CACHE = True
+PREPROCESS_CACHE_DIR = os.path.join(OUTPUT_DATA_DIR, "preprocess_cache")
+PREPROCESS_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Kademeli çalışma (--cascade): motorlar bu sırayla (ucuzdan pahalıya) denenir; ilk motor tüm alanları yeterli
+# güvenle bulursa diğerleri çalıştırılmaz. Eksik alanlar için sonraki motor yalnızca alanın beklendiği
+# yatay şeridi (sayfa yüksekliğine oranla üst, alt) okur.
+CASCADE_ENABLED = False
+CASCADE_ENGINE_ORDER = ["tesseract", "paddleocr", "easyocr", "keras_ocr"]
+CASCADE_MIN_CONFIDENCE = 0.6
+CASCADE_REGION_RERUN = True
+CASCADE_FIELD_BANDS = {"satici_adi": (0.0, 0.35), "tarih": (0.0, 0.5), "belge_no": (0.0, 0.5), "tutar": (0.4, 1.0)}
+
+# Motor birleştirme (--fuse): motorların kutucukları eşleştirilir ve güvenle ağırlıklı oylamayla
+# resim başına tek bir birleşik sonuç ({resim}_fused) üretilir.
+FUSION_ENABLED = False
+FUSION_IOU_THRESHOLD = 0.3
+FUSION_CONTAINMENT_THRESHOLD = 0.8 # Küçük kutunun bu oranı büyük kutunun içindeyse (kelime-satır eşleşmesi) eşleşir
+FUSION_DEFAULT_CONFIDENCE = 0.5 # Güven vermeyen motorlar (ör. Keras-OCR) için
+FUSION_SINGLE_ENGINE_MIN_CONFIDENCE = 0.5 # Yalnızca bir motorun bulduğu kutucuklar bu güvenin altındaysa atılır
+
+# Kutucuk Tablosu Dışa Aktarımı
+DETECTIONS_EXPORT_FORMAT = None # "parquet" (sayfa başına bir satır grubu) veya "arrow" (IPC, sayfa başına bir kayıt yığını); pyarrow gerekir
+
+# Ortak metin tespiti (--detect-once): sayfa bir kez "easyocr" veya "paddleocr" dedektörüyle taranır,
+# diğer motorlar yalnızca bulunan bölgeler üzerinde tanıma yapar. None ise her motor kendi tespitini yapar.
+SHARED_DETECTOR = None
+RECOGNIZER_BATCH_SIZE = 16
+
+PDF_DPI = 200 # PDF sayfaları bu çözünürlükte rasterleştirilir
+MAX_IN_FLIGHT_PAGES = 0 # Paralel modda aynı anda işçilere verilen en fazla sayfa; 0 = 2 x süreç sayısı
 
-if GOOGLE_API_KEY:
+TESSERACT_LANG = 'tur'
+TESSERACT_BACKEND = "auto" # "auto", "tesserocr" (kalıcı API) veya "pytesseract" (alt süreç)
+EASYOCR_LANG = ['tr']
+PADDLEOCR_LANG = 'tr'
+
+_gemini_state = {"initialized": False, "model": None}
+
+def get_gemini_model():
+    if _gemini_state["initialized"]:
+        return _gemini_state["model"]
+    _gemini_state["initialized"] = True
+    if not USE_GEMINI:
+        return None
+    if not GOOGLE_API_KEY or GOOGLE_API_KEY == "API-KEY":
+        print("Bilgi: GOOGLE_API_KEY ortam değişkeni bulunamadı. LLM özelliği devre dışı bırakılacak.")
+        return None
+    genai = import_optional_module("google.generativeai")
+    if genai is None:
+        return None
     try:
         genai.configure(api_key=GOOGLE_API_KEY)
 
@@ -22,87 +166,802 @@ if GOOGLE_API_KEY:
             {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
             {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
         ]
-        gemini_model = genai.GenerativeModel('gemini-1.5-flash-latest', safety_settings=safety_settings)
-        USE_GEMINI = True
+        _gemini_state["model"] = genai.GenerativeModel(GEMINI_MODEL_NAME, safety_settings=safety_settings)
         print("Google Gemini API başarıyla yapılandırıldı ve model yüklendi.")
     except Exception as e:
         print(f"Hata: Google Gemini API yapılandırılamadı: {e}. LLM özelliği devre dışı bırakılacak.")
-        gemini_model = None
-        USE_GEMINI = False
-else:
-    print("Bilgi: GOOGLE_API_KEY ortam değişkeni bulunamadı. LLM özelliği devre dışı bırakılacak.")
-    gemini_model = None
-    USE_GEMINI = False
-
-try:
-    import keras_ocr
-    KERAS_OCR_AVAILABLE = True
-except ImportError:
-    keras_ocr = None
-    KERAS_OCR_AVAILABLE = False
-    print("Bilgi: keras-ocr kütüphanesi bulunamadı veya TensorFlow/PyTorch kurulu değil. Keras-OCR motoru atlanacaktır.")
-
-PADDLEOCR_AVAILABLE = False
-PaddleOCR = None
-try:
-    from paddleocr import PaddleOCR
-    PADDLEOCR_AVAILABLE = True
-except ImportError:
-    print("Bilgi: paddleocr kütüphanesi bulunamadı veya paddlepaddle kurulu değil. PaddleOCR motoru atlanacaktır.")
+    return _gemini_state["model"]
+
+# Motor Kayıt Defteri
+# Her motor, süreç başına (motor adı, dil/ayar) anahtarıyla yalnızca bir kez oluşturulur
+# ve tüm çağrılara aynı örnek verilir. Yükleme ve çıkarım süreleri ayrı tutulur.
+# Bellek bütçesi (--memory-budget) verilirse her motorun yüklemeden sonraki RSS artışı ölçülür ve yeni bir motor
+# bütçeyi aşacaksa en uzun süredir kullanılmayan motorlar bellekten çıkarılır (sonraki kullanımda yeniden yüklenir).
+_engine_instances = OrderedDict()
+engine_load_times = {}
+engine_inference_times = {}
+engine_inference_counts = {}
+engine_memory = {} # (motor, ayar) -> yükleme sonrası RSS artışı (bayt)
+engine_evictions = {} # motor -> bellekten çıkarılma sayısı
+_memory_state = {"budget": 0, "report_pending": True}
+
+def get_rss_bytes():
+    # Anlık RSS; /proc olmayan sistemlerde ölçülemez (None)
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
 
+def _release_engine(key):
+    engine_name = key[0]
+    instance = _engine_instances.pop(key)
+    if hasattr(instance, "End"): # tesserocr API'si yerel belleğini ancak End() ile bırakır
+        instance.End()
+    del instance
+    if engine_name == "keras_ocr" and "tensorflow" in sys.modules:
+        sys.modules["tensorflow"].keras.backend.clear_session()
+    gc.collect()
+    engine_evictions[engine_name] = engine_evictions.get(engine_name, 0) + 1
+    _memory_state["report_pending"] = True
+    print(f"{engine_name} motoru bellek bütçesi için bellekten çıkarıldı "
+          f"(~{engine_memory.get(key, 0) / 2**20:.0f} MB).")
+
+def enforce_memory_budget(incoming_key=None):
+    # Gelen motorun bilinen (ya da 0) boyutu eklenince bütçe aşılıyorsa en eski kullanılan motorlar çıkarılır.
+    # Ayırıcılar bellek iade etmeyebildiğinden RSS yeniden ölçülmez; çıkarılan motorun ölçülmüş boyutu düşülür.
+    budget = _memory_state["budget"]
+    rss = get_rss_bytes() if budget else None
+    if rss is None:
+        return
+    rss += engine_memory.get(incoming_key, 0) if incoming_key not in _engine_instances else 0
+    for key in list(_engine_instances):
+        if rss <= budget:
+            break
+        if key == incoming_key or _engine_instances[key] is None:
+            continue
+        rss -= engine_memory.get(key, 0)
+        _release_engine(key)
+
+def get_engine_instance(engine_name, config_key, factory):
+    key = (engine_name, config_key)
+    if key in _engine_instances:
+        _engine_instances.move_to_end(key)
+        return _engine_instances[key]
+    enforce_memory_budget(key)
+    rss_before = get_rss_bytes()
+    start = time.perf_counter()
+    try:
+        instance = factory()
+        print(f"{engine_name} motoru başarıyla başlatıldı (Ayar: {config_key}).")
+    except Exception as e:
+        print(f"{engine_name} başlatılırken hata: {e}. Bu motor devre dışı bırakılıyor.")
+        instance = None
+    engine_load_times[key] = engine_load_times.get(key, 0.0) + time.perf_counter() - start
+    if instance is not None and rss_before is not None:
+        engine_memory[key] = max(0, get_rss_bytes() - rss_before)
+    _memory_state["report_pending"] = True
+    # Başarısız yüklemeler de saklanır; her resimde yeniden denenmez.
+    _engine_instances[key] = instance
+    enforce_memory_budget(key)
+    return instance
+
+def record_engine_inference(engine_name, elapsed):
+    engine_inference_times[engine_name] = engine_inference_times.get(engine_name, 0.0) + elapsed
+    engine_inference_counts[engine_name] = engine_inference_counts.get(engine_name, 0) + 1
+
+def print_engine_timing_summary():
+    if not engine_load_times and not engine_inference_times:
+        return
+    print("\n== Motor Süreleri (yükleme / çıkarım) ==")
+    load_by_engine = {}
+    for (engine_name, _), elapsed in engine_load_times.items():
+        load_by_engine[engine_name] = load_by_engine.get(engine_name, 0.0) + elapsed
+    for engine_name in sorted(set(load_by_engine) | set(engine_inference_times)):
+        load_time = load_by_engine.get(engine_name, 0.0)
+        inference_time = engine_inference_times.get(engine_name, 0.0)
+        count = engine_inference_counts.get(engine_name, 0)
+        per_call = inference_time / count if count else 0.0
+        memory = sum(size for (name, _), size in engine_memory.items() if name == engine_name)
+        memory_note = f", bellek ~{memory / 2**20:.0f} MB" if memory else ""
+        if engine_evictions.get(engine_name):
+            memory_note += f" ({engine_evictions[engine_name]} kez bellekten çıkarıldı)"
+        print(f"  {engine_name}: yükleme {load_time:.2f} sn, çıkarım {inference_time:.2f} sn "
+              f"({count} çağrı, çağrı başına {per_call:.2f} sn){memory_note}")
+
+def print_cascade_summary(stop_counts, skipped_runs, processed_images):
+    # Atlanan motor çalıştırmalarının süresi, o motorun bu çalışmadaki ortalama çıkarım süresiyle tahmin edilir
+    if not processed_images:
+        return
+    print("\n== Kademeli Çalışma ==")
+    for engine_name, count in stop_counts.items():
+        print(f"  {engine_name} kademesinde duran: {count} resim ({count / processed_images:.0%})")
+    unresolved = processed_images - sum(stop_counts.values())
+    if unresolved:
+        print(f"  Tüm kademeler çalıştırılan: {unresolved} resim")
+    saved_seconds, unknown_runs = 0.0, 0
+    for engine_name, count in skipped_runs.items():
+        calls = engine_inference_counts.get(engine_name, 0)
+        if calls:
+            saved_seconds += count * engine_inference_times.get(engine_name, 0.0) / calls
+        else:
+            unknown_runs += count
+    total_skipped = sum(skipped_runs.values())
+    print(f"  Atlanan motor çalıştırması: {total_skipped}, tahmini kazanç {saved_seconds:.2f} sn"
+          + (f" ({unknown_runs} çalıştırmanın süresi bilinmiyor)" if unknown_runs else ""))
+
+def get_tesserocr_api(lang=TESSERACT_LANG):
+    tesserocr = import_optional_module("tesserocr")
+    if tesserocr is None:
+        return None
+    return get_engine_instance("tesseract", lang, lambda: tesserocr.PyTessBaseAPI(lang=lang))
 
-# Konfigürasyon
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-INPUT_IMAGE_DIR = os.path.join(BASE_DIR, "input")
-OUTPUT_ANNOTATED_DIR = os.path.join(BASE_DIR, "output") 
-OUTPUT_DATA_DIR = os.path.join(BASE_DIR, "output")         #
-OUTPUT_JSON_FILE = os.path.join(OUTPUT_DATA_DIR, "extracted_data.json")
+def get_easyocr_reader(lang_list=EASYOCR_LANG):
+    easyocr = import_optional_module("easyocr")
+    if easyocr is None:
+        return None
+    return get_engine_instance("easyocr", tuple(lang_list), lambda: easyocr.Reader(list(lang_list), gpu=False))
 
-TESSERACT_LANG = 'tur'
-EASYOCR_LANG = ['tr']
-PADDLEOCR_LANG = 'tr'
+def get_paddleocr_instance(lang=PADDLEOCR_LANG):
+    paddleocr = import_optional_module("paddleocr")
+    if paddleocr is None:
+        return None
+    return get_engine_instance(
+        "paddleocr", lang,
+        lambda: paddleocr.PaddleOCR(use_angle_cls=True, lang=lang, use_gpu=False, show_log=False))
+
+def get_keras_ocr_pipeline():
+    keras_ocr = import_optional_module("keras_ocr")
+    if keras_ocr is None:
+        return None
+    return get_engine_instance("keras_ocr", "default", lambda: keras_ocr.pipeline.Pipeline())
 
-keras_ocr_pipeline = None
-if KERAS_OCR_AVAILABLE:
+
+def get_engine_version(engine_name):
     try:
-        keras_ocr_pipeline = keras_ocr.pipeline.Pipeline()
-        print("Keras-OCR pipeline başarıyla başlatıldı.")
-    except Exception as e:
-        print(f"Keras-OCR pipeline başlatılırken hata: {e}. Bu motor devre dışı bırakılıyor.")
-        KERAS_OCR_AVAILABLE = False
-else:
-    keras_ocr_pipeline = None
+        if engine_name == "tesseract":
+            uses_tesserocr = TESSERACT_BACKEND != "pytesseract" and is_module_installed("tesserocr")
+            backend = "tesserocr" if uses_tesserocr else "pytesseract"
+            return f"{backend}-{import_optional_module('pytesseract').get_tesseract_version()}"
+        module = import_optional_module(engine_name)
+        return getattr(module, "__version__", "bilinmiyor")
+    except Exception:
+        pass
+    return "bilinmiyor"
+
+
+# Disk Önbelleği
+# Her kayıt, içerik özetiyle adlandırılmış ayrı bir JSON dosyasıdır; boyut sınırı aşıldığında
+# en uzun süredir kullanılmayan kayıtlar silinir (isabette dosya zamanı yenilenir).
+class DiskLruCache:
+    SUFFIX = ".json"
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._index = None # anahtar -> dosya boyutu, en eskiden en yeniye
+        self._total_bytes = 0
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}{self.SUFFIX}")
+
+    def _load_index(self):
+        if self._index is not None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entries = []
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith(self.SUFFIX):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, file_name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, file_name[:-len(self.SUFFIX)], stat.st_size))
+        self._index = OrderedDict()
+        self._total_bytes = 0
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._total_bytes += size
+
+    def __contains__(self, key):
+        # Sayılmayan, dosyayı okumayan varlık kontrolü
+        self._load_index()
+        return key in self._index
+
+    def get_payload(self, key):
+        return self._get(key, self._read_json)
+
+    def put_payload(self, key, payload):
+        self._put(key, lambda f: f.write(json.dumps(payload, ensure_ascii=False,
+                                                    default=lambda o: o.item() if hasattr(o, 'item') else str(o)).encode('utf-8')))
+
+    def _read_json(self, f):
+        return json.loads(f.read().decode('utf-8'))
+
+    def _get(self, key, reader):
+        self._load_index()
+        if key not in self._index:
+            self.misses += 1
+            return None
+        try:
+            with open(self._path(key), 'rb') as f:
+                payload = reader(f)
+            os.utime(self._path(key)) # LRU sırası diskte de korunsun
+        except (OSError, ValueError):
+            self._total_bytes -= self._index.pop(key)
+            self.misses += 1
+            return None
+        self._index.move_to_end(key)
+        self.hits += 1
+        return payload
+
+    def _put(self, key, writer):
+        self._load_index()
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                writer(f)
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+        except Exception as e:
+            print(f"    Uyarı: Önbelleğe yazılamadı ({self.cache_dir}): {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        if key in self._index:
+            self._total_bytes -= self._index.pop(key)
+        self._index[key] = size
+        self._total_bytes += size
+        self._evict()
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and len(self._index) > 1:
+            old_key, size = self._index.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+
+    def enforce_limit(self):
+        self._load_index()
+        self._evict()
+
+
+# OCR Sonuç Önbelleği
+# Kayıtlar görüntü baytlarının özeti, motor adı, dil/ayar ve motor sürümüyle adreslenir.
+class OcrResultCache(DiskLruCache):
+    def __init__(self, cache_dir, max_bytes):
+        super().__init__(cache_dir, max_bytes)
+        self._versions = {}
+
+    def make_key(self, image_hash, engine_name, engine_config):
+        if engine_name not in self._versions:
+            self._versions[engine_name] = get_engine_version(engine_name)
+        key_material = json.dumps([image_hash, engine_name, engine_config, self._versions[engine_name]])
+        return hashlib.sha256(key_material.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        cached = self.get_payload(key)
+        if cached is None:
+            return None
+        return cached["full_text"], cached["detections"]
+
+    def put(self, key, full_text, detections):
+        self.put_payload(key, {"full_text": full_text, "detections": detections})
 
-paddle_ocr_instance = None
 
-def get_paddleocr_instance():
-    global paddle_ocr_instance
-    if PADDLEOCR_AVAILABLE and paddle_ocr_instance is None:
+class NormalizedImageCache(DiskLruCache):
+    # Ön işlenmiş görüntü PNG olarak, orijinal koordinatlara dönüş için kullanılan dönüşüm matrisiyle saklanır.
+    SUFFIX = ".npz"
+
+    def make_key(self, image_hash, preprocess_config):
+        key_material = json.dumps([image_hash, preprocess_config], sort_keys=True)
+        return hashlib.sha256(key_material.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        return self._get(key, self._read_image)
+
+    def put(self, key, image, matrix):
+        encoded, png_bytes = cv2.imencode(".png", image)
+        if encoded:
+            self._put(key, lambda f: np.savez(f, png=png_bytes, matrix=matrix))
+
+    def _read_image(self, f):
         try:
-            paddle_ocr_instance = PaddleOCR(use_angle_cls=True, lang=PADDLEOCR_LANG, use_gpu=False, show_log=False)
-            print(f"PaddleOCR instance başarıyla başlatıldı (Dil: {PADDLEOCR_LANG}).")
+            with np.load(f) as data:
+                image = cv2.imdecode(data["png"], cv2.IMREAD_COLOR)
+                matrix = data["matrix"]
         except Exception as e:
-            print(f"PaddleOCR başlatılırken hata: {e}. Bu motor devre dışı bırakılıyor.")
-            pass 
-    return paddle_ocr_instance
+            raise ValueError(f"bozuk önbellek kaydı: {e}")
+        if image is None:
+            raise ValueError("bozuk önbellek kaydı")
+        return image, matrix
+
+
+def format_cache_summary(hits, misses):
+    total = hits + misses
+    hit_rate = (100.0 * hits / total) if total else 0.0
+    return f"{hits} isabet, {misses} ıskalama (%{hit_rate:.1f} isabet oranı)"
+
+
+# Sonuç Deposu
+# Her entry_key kaydı üretildiği anda JSONL dosyasına eklenir ve diske yazılır; çökme durumunda
+# yalnızca yarım kalan son satır kaybolur. Aynı anahtar tekrar yazılırsa son kayıt geçerlidir.
+class JsonlResultStore:
+    def __init__(self, path):
+        self.path = path
+        self.keys = set()
+        self._file = None
+
+    def open(self, legacy_json_path=None):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if not os.path.exists(self.path) and legacy_json_path and os.path.exists(legacy_json_path):
+            self._import_legacy_json(legacy_json_path)
+
+        needs_newline = False
+        if os.path.exists(self.path):
+            for key, _ in self._iter_lines():
+                self.keys.add(key)
+            with open(self.path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() > 0:
+                    f.seek(-1, os.SEEK_END)
+                    needs_newline = f.read(1) != b'\n'
+        self._file = open(self.path, 'a', encoding='utf-8')
+        if needs_newline: # Önceki çalışmadan yarım kalmış satırı kapat
+            self._file.write('\n')
+        return self
+
+    def _import_legacy_json(self, legacy_json_path):
+        try:
+            with open(legacy_json_path, 'r', encoding='utf-8') as f:
+                legacy_data = json.load(f)
+        except json.JSONDecodeError:
+            print(f"Uyarı: {legacy_json_path} dosyası okunamadı veya bozuk, içe aktarılmadı.")
+            return
+        with open(self.path, 'w', encoding='utf-8') as f:
+            for key, record in legacy_data.items():
+                f.write(json.dumps({"key": key, "record": record}, ensure_ascii=False) + '\n')
+        print(f"Mevcut veriler {legacy_json_path} dosyasından {self.path} dosyasına aktarıldı.")
+
+    def _iter_lines(self, with_offsets=False):
+        with open(self.path, 'rb') as f:
+            offset = 0
+            for raw_line in f:
+                line_offset = offset
+                offset += len(raw_line)
+                try:
+                    item = json.loads(raw_line)
+                    key = item["key"]
+                except (ValueError, KeyError, TypeError):
+                    continue # Çökmeden kalan yarım veya bozuk satır
+                yield key, (line_offset if with_offsets else item["record"])
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def append(self, key, record):
+        self._file.write(json.dumps({"key": key, "record": record}, ensure_ascii=False) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.keys.add(key)
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def export_json(self, output_path):
+        # Mevcut iç içe JSON biçimini üretir. Bellekte yalnızca anahtar -> satır konumu tutulur;
+        # kayıtlar dosyadan tek tek okunup yazılır.
+        latest_offsets = {}
+        for key, offset in self._iter_lines(with_offsets=True):
+            latest_offsets[key] = offset
+        tmp_path = f"{output_path}.tmp"
+        with open(self.path, 'rb') as source, open(tmp_path, 'w', encoding='utf-8') as out:
+            out.write('{')
+            for i, (key, offset) in enumerate(latest_offsets.items()):
+                source.seek(offset)
+                record = json.loads(source.readline())["record"]
+                entry = json.dumps({key: record}, ensure_ascii=False, indent=4)
+                out.write((',' if i else '') + entry[1:-2])
+            out.write('\n}' if latest_offsets else '}')
+        os.replace(tmp_path, output_path)
+        return len(latest_offsets)
+
+
+# İşlenmiş Dosya Listesi
+# Her dosya için boyut, mtime, içerik özeti ve üretilen kayıt sonekleri (motorlar, "cascade", "fused") salt eklemeli
+# bir JSONL dosyasında tutulur; dosya başına son satır geçerlidir. Boyut ve mtime değişmediyse dosya okunmaz,
+# değiştiyse özet karşılaştırılır (yalnızca dokunulmuş dosyalar yeniden işlenmez).
+class ProcessedManifest:
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._file = None
+
+    def open(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        line_count = 0
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        self.entries[entry["dosya"]] = entry
+                    except (ValueError, KeyError, TypeError):
+                        continue # Çökmeden kalan yarım satır
+                    line_count += 1
+        if line_count > 2 * len(self.entries) + 100: # Eskimiş satırlar çoğaldıysa dosya yeniden yazılır
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for entry in self.entries.values():
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            os.replace(tmp_path, self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        return self
+
+    def check(self, image_file, stat, record_suffixes):
+        # (durum, içerik özeti): durum "yeni", "degisti", "motor" (eksik kayıt) veya None (güncel)
+        entry = self.entries.get(image_file)
+        if entry is None:
+            return "yeni", None
+        if entry["boyut"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            file_hash = entry["sha256"]
+        else:
+            file_hash = hash_file(os.path.join(INPUT_IMAGE_DIR, image_file))
+            if file_hash != entry["sha256"]:
+                return "degisti", file_hash
+            self.mark(image_file, stat, file_hash, []) # Yalnızca dokunulmuş; yeni mtime kaydedilir
+        if not set(record_suffixes) <= set(entry["kayitlar"]):
+            return "motor", file_hash
+        return None, file_hash
+
+    def mark(self, image_file, stat, file_hash, record_suffixes):
+        previous = self.entries.get(image_file)
+        if previous is not None and previous["sha256"] == file_hash:
+            record_suffixes = sorted(set(previous["kayitlar"]) | set(record_suffixes))
+        entry = {"dosya": image_file, "boyut": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": file_hash,
+                 "kayitlar": sorted(record_suffixes), "zaman": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        self.entries[image_file] = entry
+        self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+class DetectionExportWriter:
+    # Sayfa tabloları (DetectionTable) ana süreçte tek dosyaya eklenir: Parquet'te her sayfa bir satır grubu, Arrow IPC'de
+    # bir kayıt yığını olur. Dosya ".part" uzantısıyla yazılır ve kapanınca yeniden adlandırılır; yarıda kalan bir çalışma
+    # analiz işlerine bozuk dosya bırakmaz. Her çalışma (izleme modunda her yeni dosya grubu) ayrı bir dosyaya yazılır.
+    EXTENSIONS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+    def __init__(self, directory, export_format):
+        self.directory = directory
+        self.export_format = export_format
+        self.pyarrow = import_optional_module("pyarrow") if export_format else None
+        self.path = None
+        self.pages, self.rows = 0, 0
+        self._writer = None
+
+    def is_available(self):
+        return self.pyarrow is not None
+
+    def write(self, ocr_result):
+        table = ocr_result.pop("detections", None)
+        if table is None or not len(table) or not self.is_available():
+            return
+        arrow_table = table.to_arrow(self.pyarrow, ocr_result["image_file"], ocr_result["page"])
+        if self._writer is None:
+            self._open(arrow_table.schema)
+        self._writer.write_table(arrow_table)
+        self.pages += 1
+        self.rows += len(table)
+
+    def _open(self, schema):
+        os.makedirs(self.directory, exist_ok=True)
+        base_path = os.path.join(self.directory, f"detections_{time.strftime('%Y%m%d-%H%M%S')}")
+        self.path, suffix = base_path + self.EXTENSIONS[self.export_format], 1
+        while os.path.exists(self.path):
+            suffix += 1
+            self.path = f"{base_path}_{suffix}{self.EXTENSIONS[self.export_format]}"
+        if self.export_format == "parquet":
+            self._writer = import_optional_module("pyarrow.parquet").ParquetWriter(f"{self.path}.part", schema)
+        else:
+            self._writer = import_optional_module("pyarrow.ipc").new_file(f"{self.path}.part", schema)
+
+    def close(self):
+        if self._writer is None:
+            return
+        self._writer.close()
+        self._writer = None
+        os.replace(f"{self.path}.part", self.path)
+        print(f"Kutucuk tablosu: {self.rows} kutucuk, {self.pages} sayfa -> {self.path}")
+        self.pages, self.rows = 0, 0
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Belge Girişi
+# Çok sayfalı PDF ve TIFF dosyaları sayfa sayfa, yalnızca işlenecekleri anda açılır ve rasterleştirilir;
+# bellek kullanımı belgenin uzunluğundan bağımsız kalır. Tek sayfalık resimler önceki gibi işlenir.
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.tif')
+DOCUMENT_EXTENSIONS = ('.pdf',)
+_document_hashes = {}
+_open_document = {"path": None, "backend": None, "document": None}
+
+def _get_open_document(path):
+    # Süreç başına yalnızca son açılan PDF/TIFF açık tutulur; ardışık sayfalar aynı belgeyi yeniden açmaz.
+    # TIFF'te açık tutmak şarttır: Pillow sayfa konumlarını açık resimde biriktirir, her sayfada yeniden açıp
+    # seek etmek baştan itibaren tüm sayfaları taradığı için belge boyunca O(N²) olurdu.
+    if _open_document["path"] == path:
+        return _open_document["backend"], _open_document["document"]
+    if _open_document["document"] is not None:
+        _open_document["document"].close()
+        _open_document.update(path=None, backend=None, document=None)
+    if os.path.splitext(path)[1].lower() in ('.tif', '.tiff'):
+        _open_document.update(path=path, backend="pil", document=Image.open(path))
+        return "pil", _open_document["document"]
+    for backend in ("pypdfium2", "fitz"):
+        if is_module_installed(backend):
+            module = import_optional_module(backend)
+            document = module.PdfDocument(path) if backend == "pypdfium2" else module.open(path)
+            _open_document.update(path=path, backend=backend, document=document)
+            return backend, document
+    return None, None
+
+def count_document_pages(path):
+    # Sayfalara bölünecek belgeler için sayfa sayısını, tek sayfalık resimler için None döndürür
+    extension = os.path.splitext(path)[1].lower()
+    if extension in DOCUMENT_EXTENSIONS:
+        backend, document = _get_open_document(path)
+        if document is None:
+            print(OPTIONAL_MODULE_MESSAGES["pypdfium2"])
+            return 0
+        return len(document) if backend == "pypdfium2" else document.page_count
+    if extension in ('.tif', '.tiff'):
+        frame_count = getattr(_get_open_document(path)[1], "n_frames", 1)
+        return frame_count if frame_count > 1 else None
+    return None
+
+def render_document_page(path, page_index, dpi=PDF_DPI):
+    backend, document = _get_open_document(path)
+    if backend == "pil":
+        document.seek(page_index)
+        page_image = document
+    elif backend == "pypdfium2":
+        page = document[page_index]
+        try:
+            page_image = page.render(scale=dpi / 72).to_pil()
+        finally:
+            page.close()
+    else:
+        pixmap = document[page_index].get_pixmap(dpi=dpi)
+        page_image = Image.frombytes("RGBA" if pixmap.alpha else "RGB", (pixmap.width, pixmap.height), pixmap.samples)
+    return cv2.cvtColor(np.asarray(page_image.convert("RGB")), cv2.COLOR_RGB2BGR)
+
+def get_document_hash(path):
+    # Belgenin özeti süreç başına bir kez hesaplanır; sayfa özetleri bundan türetilir
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    if key not in _document_hashes:
+        _document_hashes[key] = hash_file(path)
+    return _document_hashes[key]
+
+def page_entry_base(image_file, page_index):
+    base_filename = os.path.splitext(image_file)[0]
+    return base_filename if page_index is None else f"{base_filename}_p{page_index + 1:04d}"
+
+def iter_page_tasks(documents):
+    # (dosya, sayfa, sayfa sayısı) görevleri tembel üretilir; tek sayfalık resimlerde sayfa None'dır
+    for image_file, page_count in documents:
+        if page_count is None:
+            yield (image_file, None, None)
+        else:
+            for page_index in range(page_count):
+                yield (image_file, page_index, page_count)
+
+def read_image_file(path):
+    # Dosya bir kez okunur; aynı baytlar hem önbellek özeti hem de çözümleme için kullanılır.
+    with open(path, 'rb') as f:
+        image_bytes = f.read()
+    image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    return image_bytes, image
 
 
 # yardımcı Fonksiyonlar
-def preprocess_image_for_ocr(image_path):
-    img = cv2.imread(image_path)
-    if img is None:
-        print(f"Hata: {image_path} yüklenemedi (preprocess_image_for_ocr).")
+def get_preprocess_config(enabled=PREPROCESS_ENABLED):
+    if not enabled:
+        return None
+    return {"target_text_height": PREPROCESS_TARGET_TEXT_HEIGHT, "max_side": PREPROCESS_MAX_SIDE,
+            "deskew": PREPROCESS_DESKEW, "max_skew_angle": PREPROCESS_MAX_SKEW_ANGLE,
+            "crop_document": PREPROCESS_CROP_DOCUMENT, "denoise": PREPROCESS_DENOISE, "binarize": PREPROCESS_BINARIZE,
+            # Kırpma eşikleri önbellek anahtarına girer; eski (yanlış kırpılmış) önbellek kayıtları kullanılmaz
+            "crop_thresholds": [PREPROCESS_CROP_MIN_SPAN, PREPROCESS_CROP_MIN_CONTRAST, PREPROCESS_CROP_MAX_OUTSIDE_INK]}
+
+def estimate_text_height(binary):
+    # Bağlı bileşenlerin ortanca yüksekliği yaklaşık karakter yüksekliğini verir
+    _, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+    image_height, image_width = binary.shape
+    is_glyph = (heights >= 4) & (heights < image_height * 0.1) & (widths >= 2) & (widths < image_width * 0.3)
+    if np.count_nonzero(is_glyph) < 20:
+        return None
+    return float(np.median(heights[is_glyph]))
+
+def estimate_skew_angle(binary, max_angle):
+    # Satır izdüşümü yöntemi: metin satırları yataya oturduğunda satır toplamlarının varyansı en büyük olur
+    height, width = binary.shape
+    center = (width / 2, height / 2)
+
+    def score(angle):
+        rotated = cv2.warpAffine(binary, cv2.getRotationMatrix2D(center, angle, 1.0), (width, height),
+                                 flags=cv2.INTER_NEAREST)
+        return float(np.var(rotated.sum(axis=1, dtype=np.float64)))
+
+    best_angle = max(np.arange(-max_angle, max_angle + 0.5, 1.0), key=score)
+    best_angle = max(np.arange(best_angle - 1.0, best_angle + 1.01, 0.2), key=score)
+    return float(best_angle)
+
+def find_document_contour(gray):
+    # Yalnızca gerçek sayfa kenarı kırpılır: en büyük dış kontur dört köşeli bir çokgene indirgenmeli, iki eksende de
+    # kadrajın büyük kısmını kaplamalı, dışı içinden belirgin biçimde farklı (arka plan) olmalı ve dışında mürekkep
+    # (metin, çizgi) bulunmamalı. Kadrajı dolduran bir faturadaki çerçeveli tablo bu koşulları sağlamaz; None döner.
+    height, width = gray.shape
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    raw_edges = cv2.Canny(blurred, 50, 150)
+    edges = cv2.dilate(raw_edges, np.ones((5, 5), np.uint8))
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+    hull = cv2.convexHull(max(contours, key=cv2.contourArea))
+    area_ratio = cv2.contourArea(hull) / float(height * width)
+    if area_ratio < 0.2 or area_ratio > 0.95:
+        return None
+    quad = cv2.approxPolyDP(hull, 0.02 * cv2.arcLength(hull, True), True).reshape(-1, 2)
+    if len(quad) != 4:
+        return None
+    span = (quad.max(axis=0) - quad.min(axis=0)) / np.array([width, height], dtype=np.float64)
+    if span.min() < PREPROCESS_CROP_MIN_SPAN:
         return None
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    return gray
 
-def draw_boxes_on_image(original_image_path, detections, output_path, engine_name):
-    try:
-        image = cv2.imread(original_image_path)
+    # Kenar çevresindeki şerit (gölge, bulanık kenar) iç/dış karşılaştırmasına katılmaz
+    inside = np.zeros_like(gray)
+    cv2.fillPoly(inside, [quad.astype(np.int32)], 255)
+    band_size = max(3, int(0.02 * max(height, width))) | 1
+    band_kernel = np.ones((band_size, band_size), np.uint8)
+    inner = cv2.erode(inside, band_kernel) > 0
+    outer = cv2.dilate(inside, band_kernel) == 0
+    if outer.sum() < 0.02 * height * width or not inner.any():
+        return None
+    if abs(float(gray[inner].mean()) - float(gray[outer].mean())) < PREPROCESS_CROP_MIN_CONTRAST:
+        return None
+    if np.count_nonzero(raw_edges[outer]) > PREPROCESS_CROP_MAX_OUTSIDE_INK * outer.sum():
+        return None
+    return quad.astype(np.float64)
+
+def preprocess_image_for_ocr(image, config):
+    # Küçültme, eğiklik düzeltme ve kırpma tek bir afin dönüşümde birleştirilir. Dönen matris orijinal
+    # koordinatları normalleştirilmiş görüntüye taşır; tersi kutucukları geri dönüştürmek için kullanılır.
+    if isinstance(image, str):
+        image_path = image
+        image = cv2.imread(image_path)
         if image is None:
-            print(f"Hata: {original_image_path} yüklenemedi (draw_boxes_on_image).")
-            return
-
+            print(f"Hata: {image_path} yüklenemedi (preprocess_image_for_ocr).")
+            return None
+    original_height, original_width = image.shape[:2]
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    # Ölçümler küçük bir kopya üzerinde yapılır
+    analysis_scale = min(1.0, 1200.0 / max(original_height, original_width))
+    analysis_gray = gray if analysis_scale == 1.0 else cv2.resize(gray, None, fx=analysis_scale, fy=analysis_scale,
+                                                                  interpolation=cv2.INTER_AREA)
+    _, analysis_binary = cv2.threshold(analysis_gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+
+    region = np.array([[0, 0], [original_width, 0], [original_width, original_height], [0, original_height]], dtype=np.float64)
+    contour = find_document_contour(analysis_gray) if config["crop_document"] else None
+    if contour is not None:
+        region = contour / analysis_scale
+        # Belge dışındaki koyu arka plan metin gibi görünmesin; ölçümler yalnızca belge içinde yapılır
+        document_mask = np.zeros_like(analysis_binary)
+        cv2.fillPoly(document_mask, [contour.astype(np.int32)], 255)
+        document_mask = cv2.erode(document_mask, np.ones((15, 15), np.uint8))
+        analysis_binary = cv2.bitwise_and(analysis_binary, document_mask)
+
+    angle = 0.0
+    if config["deskew"]:
+        angle = estimate_skew_angle(analysis_binary, config["max_skew_angle"])
+        if abs(angle) < 0.3:
+            angle = 0.0
+    rotation = np.vstack([cv2.getRotationMatrix2D((original_width / 2, original_height / 2), angle, 1.0), [0, 0, 1]])
+    rotated_region = region @ rotation[:2, :2].T + rotation[:2, 2]
+    margin = 0.01 * max(original_height, original_width)
+    x0, y0 = rotated_region.min(axis=0) - margin
+    x1, y1 = rotated_region.max(axis=0) + margin
+    if angle == 0.0:
+        x0, y0 = max(x0, 0.0), max(y0, 0.0)
+        x1, y1 = min(x1, float(original_width)), min(y1, float(original_height))
+
+    scale = 1.0
+    text_height = estimate_text_height(analysis_binary)
+    if text_height:
+        scale = min(scale, config["target_text_height"] / (text_height / analysis_scale))
+    scale = min(scale, config["max_side"] / max(x1 - x0, y1 - y0))
+    output_size = (max(1, int(round((x1 - x0) * scale))), max(1, int(round((y1 - y0) * scale))))
+    matrix = np.array([[scale, 0, -scale * x0], [0, scale, -scale * y0], [0, 0, 1]]) @ rotation
+
+    if angle == 0.0 and output_size == (original_width, original_height) and x0 == 0.0 and y0 == 0.0:
+        normalized = image
+    else:
+        # Büyük küçültmelerde örtüşmeyi önlemek için önce INTER_AREA ile küçültülür, kalan dönüşüm
+        # (döndürme ve kırpma) küçük görüntüye uygulanır; toplam dönüşüm yine tek matristir.
+        source, source_matrix = image, np.eye(3)
+        if scale < 0.9:
+            resized_size = (max(1, int(round(original_width * scale))), max(1, int(round(original_height * scale))))
+            source = cv2.resize(image, resized_size, interpolation=cv2.INTER_AREA)
+            source_matrix = np.diag([resized_size[0] / original_width, resized_size[1] / original_height, 1.0])
+        remaining = matrix @ np.linalg.inv(source_matrix)
+        normalized = cv2.warpAffine(source, remaining[:2], output_size, flags=cv2.INTER_LINEAR,
+                                    borderMode=cv2.BORDER_CONSTANT, borderValue=(255, 255, 255))
+
+    if config["denoise"] or config["binarize"]:
+        normalized_gray = cv2.cvtColor(normalized, cv2.COLOR_BGR2GRAY)
+        if config["denoise"]:
+            normalized_gray = cv2.fastNlMeansDenoising(normalized_gray, None, 10, 7, 21)
+        if config["binarize"]:
+            normalized_gray = cv2.adaptiveThreshold(normalized_gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                                    cv2.THRESH_BINARY, 31, 15)
+        normalized = cv2.cvtColor(normalized_gray, cv2.COLOR_GRAY2BGR)
+    return normalized, matrix[:2]
+
+def map_detections_to_original(detections, engine_name, matrix):
+    # Normalleştirilmiş görüntüdeki kutucukları motorun kendi biçimini koruyarak orijinal koordinatlara taşır
+    inverse = cv2.invertAffineTransform(np.asarray(matrix, dtype=np.float64))
+
+    def to_original(points):
+        return np.asarray(points, dtype=np.float64) @ inverse[:, :2].T + inverse[:, 2]
+
+    mapped_detections = []
+    for det in detections:
+        bbox_data = det.get('bbox')
+        mapped = dict(det)
+        try:
+            if bbox_data and len(bbox_data) == 4 and all(isinstance(n, (int, float, np.number)) for n in bbox_data):
+                if engine_name == "tesseract":
+                    x, y, w, h = bbox_data
+                    corners = to_original([[x, y], [x + w, y], [x + w, y + h], [x, y + h]])
+                    left, top = np.floor(corners.min(axis=0)).astype(int).tolist()
+                    right, bottom = np.ceil(corners.max(axis=0)).astype(int).tolist()
+                    mapped['bbox'] = type(bbox_data)((left, top, right - left, bottom - top))
+                else:
+                    x1, y1, x2, y2 = bbox_data
+                    corners = to_original([[x1, y1], [x2, y1], [x2, y2], [x1, y2]])
+                    mapped['bbox'] = np.floor(corners.min(axis=0)).astype(int).tolist() + \
+                                     np.ceil(corners.max(axis=0)).astype(int).tolist()
+            elif bbox_data:
+                mapped['bbox'] = np.rint(to_original(bbox_data)).astype(int).tolist()
+        except (TypeError, ValueError):
+            pass
+        mapped_detections.append(mapped)
+    return mapped_detections
+
+def draw_boxes_on_image(image, detections, engine_name, max_side=0):
+    # Çizim girdinin bir kopyası üzerinde yapılır; OCR için çözümlenen dizi değişmez.
+    try:
+        image = image.copy()
         color_map = {
             "tesseract": (0, 0, 255),
             "easyocr": (0, 255, 0),
@@ -110,145 +969,236 @@ def draw_boxes_on_image(original_image_path, detections, output_path, engine_nam
             "paddleocr": (255, 165, 0)
         }
         color = color_map.get(engine_name.lower(), (128, 128, 128))
+        scale = 1.0
+        if max_side and max(image.shape[:2]) > max_side:
+            scale = max_side / max(image.shape[:2])
+        thickness = max(2, int(round(2 / scale)))
 
         for det in detections:
             bbox_data = det.get('bbox')
             if not bbox_data: continue
 
             try:
-                if engine_name == "tesseract" and isinstance(bbox_data, tuple) and len(bbox_data) == 4:
+                if engine_name == "tesseract" and isinstance(bbox_data, (tuple, list)) and len(bbox_data) == 4:
                     x, y, w, h = bbox_data
-                    cv2.rectangle(image, (x, y), (x + w, y + h), color, 2)
+                    cv2.rectangle(image, (x, y), (x + w, y + h), color, thickness)
                 elif engine_name == "easyocr" and isinstance(bbox_data, list) and len(bbox_data) == 4 and all(isinstance(n, (int, float)) for n in bbox_data):
-                    cv2.rectangle(image, (int(bbox_data[0]), int(bbox_data[1])), (int(bbox_data[2]), int(bbox_data[3])), color, 2)
+                    cv2.rectangle(image, (int(bbox_data[0]), int(bbox_data[1])), (int(bbox_data[2]), int(bbox_data[3])), color, thickness)
                 elif (engine_name == "keras_ocr" or engine_name == "paddleocr") and \
                      isinstance(bbox_data, list) and len(bbox_data) == 4 and \
                      all(isinstance(coord_pair, list) and len(coord_pair) == 2 for coord_pair in bbox_data):
                     box_points = np.array(bbox_data, dtype=np.int32).reshape((-1, 1, 2))
-                    cv2.polylines(image, [box_points], isClosed=True, color=color, thickness=2)
+                    cv2.polylines(image, [box_points], isClosed=True, color=color, thickness=thickness)
             except Exception as draw_err:
                 print(f"    Hata: {engine_name} için kutu çizilirken sorun oluştu: {bbox_data} - {draw_err}")
                 continue
-        cv2.imwrite(output_path, image)
+        if scale < 1.0:
+            image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return image
     except Exception as e:
-        print(f"Hata: Görüntü üzerine kutu çizilirken genel bir hata ({original_image_path}, {engine_name}): {e}")
-
-
-def extract_info_from_text_regex(text): 
-    extracted = {"tarih": None, "tutar": None, "belge_no": None, "satici_adi": None} 
-    if not text or not isinstance(text, str):
-        return extracted
+        print(f"Hata: Görüntü üzerine kutu çizilirken genel bir hata ({engine_name}): {e}")
+        return None
 
-    date_patterns = [
+class AnnotationWriter:
+    # İşaretlenmiş resimler arka plandaki bir iş parçacığında kodlanıp diske yazılır.
+    # Kuyruk sınırlı olduğundan yazım OCR'ın gerisinde kalırsa bellek büyümez, OCR döngüsü bekler.
+    EXTENSIONS = {"png": ".png", "jpg": ".jpg"}
+
+    def __init__(self, image_format=ANNOTATION_FORMAT, max_side=ANNOTATION_MAX_SIDE,
+                 queue_size=ANNOTATION_QUEUE_SIZE, jpeg_quality=ANNOTATION_JPEG_QUALITY):
+        self.image_format = image_format
+        self.max_side = max_side
+        self.encode_params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality] if image_format == "jpg" else []
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._thread = None
+
+    @property
+    def enabled(self):
+        return self.image_format in self.EXTENSIONS
+
+    def filename_for(self, base_filename, engine_name):
+        return f"{base_filename}_{engine_name}_annotated{self.EXTENSIONS[self.image_format]}"
+
+    def submit(self, output_path, image):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="annotation-writer", daemon=True)
+            self._thread.start()
+        self._queue.put((output_path, image))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                output_path, image = item
+                if not cv2.imwrite(output_path, image, self.encode_params):
+                    print(f"Hata: İşaretlenmiş resim yazılamadı: {output_path}")
+            except Exception as e:
+                print(f"Hata: İşaretlenmiş resim yazılırken sorun oluştu ({item[0]}): {e}")
+            finally:
+                self._queue.task_done()
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+
+# Alan Çıkarıcı
+# Desenler nesne oluşturulurken bir kez derlenir. Desenlerin öncelik sırası sonucu belirlediği için
+# (ilk eşleşen desen kazanır) tek bir alternasyonda birleştirilmezler: sırayı koruyan birleşik desen
+# ((?=(?P<p0>...))|(?=(?P<p1>...)), en küçük desen numarası seçilerek) aynı sonucu verir ama her konumda tüm
+# desenleri denediği için tarih alanında ölçülen hızı yarıya iner. Bunun yerine belge başına tekrarlanan işler
+# (tutar normalizasyonu, anahtar kelime kontrolü, satır bölme) önbelleğe alınır.
+class FieldExtractor:
+    DATE_PATTERNS = [
         r'\b(\d{1,2}[./-]\d{1,2}[./-]\d{2,4})\b',
         r'\b(\d{2,4}[./-]\d{1,2}[./-]\d{1,2})\b',
         r'\b(\d{1,2}\s+(?:Ocak|Şubat|Mart|Nisan|Mayıs|Haziran|Temmuz|Ağustos|Eylül|Ekim|Kasım|Aralık|JAN|FEB|MAR|APR|MAY|JUN|JUL|AUG|SEP|OCT|NOV|DEC)\s+\d{2,4})\b'
     ]
-    for pattern in date_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            extracted["tarih"] = match.group(1)
-            break
-
-    amount_patterns = [
+    AMOUNT_PATTERNS = [
         r'(?:toplam|tutar|yek[üu]n|total|ara\s*toplam|genel\s*toplam)\s*[:\s]*([0-9.,]+)\s*(?:tl|try|eur|usd|€|\$)?',
         r'([0-9.,]+)\s*(?:tl|try|eur|usd|€|\$)\s*(?:toplam|tutar|yek[üu]n|total|genel\s*toplam)',
         r'\b([0-9.,]+)\s*(?:tl|try|eur|usd|€|\$)\b',
         r'\b(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{1,2})?|\d+[.,]\d{1,2})\b(?!\s*\d)'
     ]
-    best_amount_str = None
-    max_numeric_value = 0.0
-    for idx, pattern in enumerate(amount_patterns):
-        if idx == len(amount_patterns) - 1 and best_amount_str: continue
-        matches = re.finditer(pattern, text, re.IGNORECASE)
-        for match in matches:
-            amount_candidate_str = match.group(1)
-            try:
-                normalized_amount_str = amount_candidate_str.replace(' ', '').strip()
-                normalized_amount_str = re.sub(r'[^\d.,]', '', normalized_amount_str)
-
-                if not normalized_amount_str: continue
-
-                # Ondalık ve binlik ayırıcı normalizasyonu
-                if '.' in normalized_amount_str and ',' in normalized_amount_str:
-                    if normalized_amount_str.rfind('.') > normalized_amount_str.rfind(','): # 1.234,56 formatı
-                        normalized_amount_str = normalized_amount_str.replace('.', '').replace(',', '.')
-                    else: # 1,234.56 formatı
-                        normalized_amount_str = normalized_amount_str.replace(',', '')
-                elif ',' in normalized_amount_str: # Sadece virgül varsa ondalıktır: 123,45
-                    normalized_amount_str = normalized_amount_str.replace(',', '.')
-                
-                # Son nokta/virgülü kontrol et, eğer sondaysa ve tekse kaldır (örneğin "1.250." gibi)
-                if normalized_amount_str.endswith('.') or normalized_amount_str.endswith(','):
-                    normalized_amount_str = normalized_amount_str[:-1]
-
-                # Çoklu nokta/virgül varsa ve float'a çevrilemiyorsa atla
-                if normalized_amount_str.count('.') > 1 :
-                     parts = normalized_amount_str.split('.')
-                     if len(parts[-1]) != 2 and len(parts) > 2: # 1.2.345 gibi bir durumu yakalamak için
-                         normalized_amount_str = "".join(parts[:-1]) + "." + parts[-1] # 12.345 -> 12.345
-
-
-                if not re.match(r'^\d+(\.\d+)?$', normalized_amount_str): 
-                    continue
+    DOC_NO_PATTERNS = [
+        r'(?:fatura\s*(?:no|numarası)|belge\s*no|fiş\s*no|seri\s*no|işlem\s*no|sipariş\s*no|doküman\s*no|invoice\s*n[o\.]?\.?|receipt\s*no)\s*[:\s]*([a-z0-9\-/]{5,30})',
+        r'\b([A-Z]{1,4}[-/]?\s?\d{6,25})\b', 
+        r'\b([A-Z0-9]{8,25})\b' 
+    ]
+    SELLER_PATTERNS = [
+        r'^([A-ZÇĞİÖŞÜ][A-Za-zÇĞİÖŞÜçğıöşü\s.,&-]+(?:A\.Ş\.|LTD\.|ŞTİ\.|ANONİM ŞİRKETİ|LİMİTED ŞİRKETİ|CO\.|INC\.))\s*$',
+        r'([A-ZÇĞİÖŞÜ][A-Za-zÇĞİÖŞÜçğıöşü\s.,&-]{5,50}(?:A\.Ş\.|LTD\.|ŞTİ\.))',
+    ]
+    SELLER_SKIP_KEYWORDS = ['MERKEZİ', 'ŞUBESİ', 'VERGİ DAİRESİ', 'V.D.']
+
+    def __init__(self):
+        self._date_res = [re.compile(p, re.IGNORECASE) for p in self.DATE_PATTERNS]
+        self._amount_res = [(re.compile(p, re.IGNORECASE), any(kw in p.lower() for kw in ["toplam", "tutar", "yekun", "total"]))
+                            for p in self.AMOUNT_PATTERNS]
+        self._doc_no_res = [re.compile(p, re.IGNORECASE) for p in self.DOC_NO_PATTERNS]
+        self._seller_res = [re.compile(p) for p in self.SELLER_PATTERNS]
+        self._plain_number_re = re.compile(r'^\d+(\.\d+)?$')
+        self._uppercase_re = re.compile(r'[A-Z]')
+        self._seller_reject_re = re.compile(r'^\d+\s|NO:|CAD\.|SOK\.')
+        # Aynı tutar adayları motorlar ve sayfalar arasında sık tekrarlanır
+        self._parse_amount = functools.lru_cache(maxsize=4096)(self._parse_amount_uncached)
+
+    def _parse_amount_uncached(self, amount_candidate_str):
+        # Aday grupları yalnızca rakam, nokta ve virgül içerir; bu yüzden ayrıca karakter temizliği gerekmez.
+        normalized_amount_str = amount_candidate_str.replace(' ', '').strip()
+        if not normalized_amount_str:
+            return None
+
+        # Ondalık ve binlik ayırıcı normalizasyonu
+        if '.' in normalized_amount_str and ',' in normalized_amount_str:
+            if normalized_amount_str.rfind('.') > normalized_amount_str.rfind(','): # 1.234,56 formatı
+                normalized_amount_str = normalized_amount_str.replace('.', '').replace(',', '.')
+            else: # 1,234.56 formatı
+                normalized_amount_str = normalized_amount_str.replace(',', '')
+        elif ',' in normalized_amount_str: # Sadece virgül varsa ondalıktır: 123,45
+            normalized_amount_str = normalized_amount_str.replace(',', '.')
+
+        # Son nokta/virgülü kontrol et, eğer sondaysa ve tekse kaldır (örneğin "1.250." gibi)
+        if normalized_amount_str.endswith('.') or normalized_amount_str.endswith(','):
+            normalized_amount_str = normalized_amount_str[:-1]
+
+        # Çoklu nokta/virgül varsa ve float'a çevrilemiyorsa atla
+        if normalized_amount_str.count('.') > 1 :
+            parts = normalized_amount_str.split('.')
+            if len(parts[-1]) != 2 and len(parts) > 2: # 1.2.345 gibi bir durumu yakalamak için
+                normalized_amount_str = "".join(parts[:-1]) + "." + parts[-1] # 12.345 -> 12.345
+
+        if not self._plain_number_re.match(normalized_amount_str):
+            return None
+        try:
+            return float(normalized_amount_str)
+        except ValueError:
+            return None
 
-                numeric_value = float(normalized_amount_str)
+    def _extract_date(self, text):
+        for date_re in self._date_res:
+            match = date_re.search(text)
+            if match:
+                return match.group(1)
+        return None
+
+    def _extract_amount(self, text):
+        best_amount_str = None
+        max_numeric_value = 0.0
+        last_idx = len(self._amount_res) - 1
+        for idx, (amount_re, is_keyword_pattern) in enumerate(self._amount_res):
+            if idx == last_idx and best_amount_str: continue
+            for match in amount_re.finditer(text):
+                amount_candidate_str = match.group(1)
+                numeric_value = self._parse_amount(amount_candidate_str)
+                if numeric_value is None: continue
 
-                is_keyword_pattern = any(kw in pattern.lower() for kw in ["toplam", "tutar", "yekun", "total"])
                 if is_keyword_pattern:
                     if numeric_value > max_numeric_value: 
                         max_numeric_value = numeric_value
                         best_amount_str = amount_candidate_str.strip()
                 elif not best_amount_str and 0.01 < numeric_value < 100000000: 
-                     if numeric_value > max_numeric_value: 
+                    if numeric_value > max_numeric_value: 
                         max_numeric_value = numeric_value
                         best_amount_str = amount_candidate_str.strip()
-            except ValueError:
-                continue
-    extracted["tutar"] = best_amount_str
+        return best_amount_str
 
-    doc_no_patterns = [
-        r'(?:fatura\s*(?:no|numarası)|belge\s*no|fiş\s*no|seri\s*no|işlem\s*no|sipariş\s*no|doküman\s*no|invoice\s*n[o\.]?\.?|receipt\s*no)\s*[:\s]*([a-z0-9\-/]{5,30})',
-        r'\b([A-Z]{1,4}[-/]?\s?\d{6,25})\b', 
-        r'\b([A-Z0-9]{8,25})\b' 
-    ]
-    for pattern in doc_no_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            potential_no = match.group(1).upper().strip()
-            if "belge_no" not in extracted or not extracted["belge_no"]:
-                if not (potential_no.isdigit() and (len(potential_no) > 18 or len(potential_no) < 6)): 
-                    if re.search(r'[A-Z]', potential_no) or len(potential_no) >= 7 : 
-                        extracted["belge_no"] = potential_no
-                        break
-            elif len(potential_no) > len(extracted.get("belge_no", "")): 
-                 extracted["belge_no"] = potential_no
-                 break
-
-    seller_patterns = [
-        r'^([A-ZÇĞİÖŞÜ][A-Za-zÇĞİÖŞÜçğıöşü\s.,&-]+(?:A\.Ş\.|LTD\.|ŞTİ\.|ANONİM ŞİRKETİ|LİMİTED ŞİRKETİ|CO\.|INC\.))\s*$',
-        r'([A-ZÇĞİÖŞÜ][A-Za-zÇĞİÖŞÜçğıöşü\s.,&-]{5,50}(?:A\.Ş\.|LTD\.|ŞTİ\.))',
-        r'MERKEZİ|ŞUBESİ' 
-    ]
-    lines = text.split('\n')
-    for i, line in enumerate(lines[:5]):
-        if extracted["satici_adi"]: break
-        if any(skip_kw in line.upper() for skip_kw in ['MERKEZİ', 'ŞUBESİ', 'VERGİ DAİRESİ', 'V.D.']):
-            continue
-        for pattern in seller_patterns[:-1]:
-            match = re.search(pattern, line)
+    def _extract_doc_no(self, text):
+        for doc_no_re in self._doc_no_res:
+            match = doc_no_re.search(text)
             if match:
-                candidate_seller = match.group(1).strip()
-                if len(candidate_seller) > 4 and not re.match(r'^\d+\s|NO:|CAD\.|SOK\.', candidate_seller.upper()):
-                    extracted["satici_adi"] = candidate_seller
-                    break
-    return extracted
+                potential_no = match.group(1).upper().strip()
+                if not (potential_no.isdigit() and (len(potential_no) > 18 or len(potential_no) < 6)): 
+                    if self._uppercase_re.search(potential_no) or len(potential_no) >= 7 : 
+                        return potential_no
+        return None
 
-def extract_info_with_gemini(full_text, regex_extractions):
-    if not USE_GEMINI or not gemini_model or not full_text.strip():
-        return {"hata": "Gemini kullanılabilir değil veya metin boş."}
+    def _extract_seller(self, text):
+        for line in text.split('\n', 5)[:5]:
+            line_upper = line.upper()
+            if any(skip_kw in line_upper for skip_kw in self.SELLER_SKIP_KEYWORDS):
+                continue
+            for seller_re in self._seller_res:
+                match = seller_re.search(line)
+                if match:
+                    candidate_seller = match.group(1).strip()
+                    if len(candidate_seller) > 4 and not self._seller_reject_re.match(candidate_seller.upper()):
+                        return candidate_seller
+        return None
 
-    prompt = f"""
+    def extract(self, text):
+        extracted = {"tarih": None, "tutar": None, "belge_no": None, "satici_adi": None} 
+        if not text or not isinstance(text, str):
+            return extracted
+        extracted["tarih"] = self._extract_date(text)
+        extracted["tutar"] = self._extract_amount(text)
+        extracted["belge_no"] = self._extract_doc_no(text)
+        extracted["satici_adi"] = self._extract_seller(text)
+        return extracted
+
+    def extract_deduplicated(self, texts):
+        # Toplu bir eşleştirme değildir, metinler yine tek tek extract'tan geçer. Yalnızca çağrı içinde birebir aynı
+        # metinler (ör. aynı çıktıyı veren motorlar, boş metinler) bir kez çıkarılır; her sonuç ayrı bir sözlüktür.
+        results_by_text = {}
+        results = []
+        for text in texts:
+            memo_key = text if isinstance(text, str) else None
+            if memo_key not in results_by_text:
+                results_by_text[memo_key] = self.extract(text)
+            results.append(dict(results_by_text[memo_key]))
+        return results
+
+field_extractor = FieldExtractor()
+
+def extract_info_from_text_regex(text): 
+    return field_extractor.extract(text)
+
+def build_llm_prompt(full_text, regex_extractions):
+    return f"""
     Bir OCR çıktısından Türkçe olarak bilgi çıkarımı yapacaksın. Bu metin bir fatura, fiş veya benzeri bir belgeye ait olabilir.
     Projenin amacı belge üzerindeki şu temel bilgileri doğru bir şekilde tespit etmektir:
     1. Tarih (Belgenin düzenlenme tarihi, GG.AA.YYYY formatına yakın olmalı)
@@ -283,56 +1233,352 @@ def extract_info_with_gemini(full_text, regex_extractions):
     Tarih için GG.AA.YYYY veya benzeri formatları ara.
     JSON çıktısı dışında hiçbir açıklama yapma. Sadece JSON verisini döndür.
     """
-    try:
-        print("    Gemini'ye istek gönderiliyor...")
-        response = gemini_model.generate_content(prompt)
-        
-        match = re.search(r"```json\s*([\s\S]*?)\s*```", response.text)
-        if match:
-            json_str = match.group(1)
+
+def parse_llm_response(response_text):
+    match = re.search(r"```json\s*([\s\S]*?)\s*```", response_text)
+    if match:
+        json_str = match.group(1)
+    else:
+        json_str = response_text 
+    return json.loads(json_str)
+
+def llm_error_result(message):
+    return {"hata": message, "tarih": "Bulunamadı", "tutar": "Bulunamadı", "belge_no": "Bulunamadı", "satici_adi": "Bulunamadı"}
+
+
+# LLM Çıkarım Aşaması
+# LLM çağrıları OCR döngüsünden ayrı bir arka plan iş parçacığındaki asyncio döngüsünde, sınırlı
+# eşzamanlılık, üstel geri çekilmeli yeniden deneme ve istem özetiyle anahtarlanan bir önbellekle
+# çalışır. Arka uç değiştirilebilir; "stub" ağ kullanmadan test ve verim ölçümü sağlar.
+LLM_BACKEND = "gemini" # "gemini", "stub" veya "none"
+LLM_CONCURRENCY = 4
+LLM_MAX_RETRIES = 3
+LLM_RETRY_BASE_DELAY = 1.0 # sn; her denemede iki katına çıkar
+LLM_MAX_PENDING_RECORDS = 256 # LLM yanıtı bekleyen en fazla kayıt; aşılırsa OCR döngüsü bekler
+LLM_STUB_LATENCY = 0.2 # sn; sahte arka ucun yanıt gecikmesi
+USE_LLM_CACHE = True
+LLM_CACHE_MAX_BYTES = 64 * 1024 * 1024
+LLM_SKIPPED_RESULT = {"hata": "LLM kullanılmadı veya hata oluştu."}
+LLM_TRANSIENT_STATUS_CODES = (408, 429, 500, 502, 503, 504) # Yalnızca bu HTTP durumları ve bağlantı/zaman aşımı hataları yeniden denenir
+LLM_AUTH_STATUS_CODES = (401, 403)
+
+class LlmBlockedError(Exception):
+    pass
+
+def classify_llm_error(error):
+    # "gecici" (yeniden denenir), "yetki" (anahtar/izin hatası; aşama kapatılır) veya "kalici" (hemen vazgeçilir).
+    # google.api_core hataları HTTP durumunu "code" özelliğinde taşır; geçersiz anahtar 400 ile döner.
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return "gecici"
+    status = getattr(error, "code", None)
+    if isinstance(status, int):
+        if status in LLM_TRANSIENT_STATUS_CODES:
+            return "gecici"
+        if status in LLM_AUTH_STATUS_CODES:
+            return "yetki"
+    message = str(error).lower()
+    if any(hint in message for hint in ("api key", "api_key", "permission", "unauthenticated", "unauthorized")):
+        return "yetki"
+    return "kalici"
+
+class LlmBackend(abc.ABC):
+    name = "base"
+
+    def is_available(self):
+        return True
+
+    def cache_namespace(self):
+        return self.name
+
+    @abc.abstractmethod
+    async def generate(self, prompt):
+        pass
+
+class GeminiLlmBackend(LlmBackend):
+    name = "gemini"
+
+    def is_available(self):
+        return get_gemini_model() is not None
+
+    def cache_namespace(self):
+        return f"gemini:{GEMINI_MODEL_NAME}"
+
+    async def generate(self, prompt):
+        gemini_model = get_gemini_model()
+        if hasattr(gemini_model, "generate_content_async"):
+            response = await gemini_model.generate_content_async(prompt)
         else:
-            json_str = response.text 
+            response = await asyncio.to_thread(gemini_model.generate_content, prompt)
+        prompt_feedback = getattr(response, 'prompt_feedback', None)
+        if prompt_feedback is not None and prompt_feedback.block_reason:
+            raise LlmBlockedError(prompt_feedback.block_reason)
+        return response.text
+
+class StubLlmBackend(LlmBackend):
+    # Gemini yerine geçen yerel sahte sunucu: sabit gecikmeyle, istemdeki regex sonuçlarını
+    # JSON olarak geri döndürür. failure_rate ile geçici hatalar (yeniden deneme) denenebilir.
+    name = "stub"
+
+    def __init__(self, latency=LLM_STUB_LATENCY, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+
+    async def generate(self, prompt):
+        await asyncio.sleep(self.latency)
+        if self._random.random() < self.failure_rate:
+            raise ConnectionError("Sahte LLM sunucusu geçici hata döndürdü.")
+        fields = {}
+        for field_name, label in (("tarih", "Tarih"), ("tutar", "Tutar"), ("belge_no", "Belge No"), ("satici_adi", "Satıcı Adı")):
+            match = re.search(rf"^\s*{label} \(Regex\): (.*)$", prompt, re.MULTILINE)
+            value = match.group(1).strip() if match else ""
+            fields[field_name] = value if value and value != "None" else "Bulunamadı"
+        return "```json\n" + json.dumps(fields, ensure_ascii=False) + "\n```"
+
+def create_llm_backend(backend_name):
+    if backend_name == "gemini":
+        return GeminiLlmBackend()
+    if backend_name == "stub":
+        return StubLlmBackend()
+    return None
+
+class LlmExtractionStage:
+    def __init__(self, backend, concurrency=LLM_CONCURRENCY, cache=None,
+                 max_retries=LLM_MAX_RETRIES, retry_base_delay=LLM_RETRY_BASE_DELAY, metrics=None):
+        self.backend = backend
+        self.metrics = metrics
+        self.concurrency = max(1, concurrency)
+        self.cache = cache
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.stats = {"requests": 0, "cache_hits": 0, "retries": 0, "failures": 0}
+        self._available = None
+        self._loop = None
+        self._thread = None
+        self._semaphore = None
+
+    def is_available(self):
+        # Gemini ancak ilk gerçek istekte yapılandırılır (tembel yükleme).
+        if self._available is None:
+            self._available = self.backend is not None and self.backend.is_available()
+        return self._available
+
+    def _start(self):
+        self._loop = asyncio.new_event_loop()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-asamasi", daemon=True)
+        self._thread.start()
+
+    def submit(self, full_text, regex_fields):
+        if not full_text or not full_text.strip() or not self.is_available():
+            future = concurrent.futures.Future()
+            future.set_result(dict(LLM_SKIPPED_RESULT))
+            return future
+        if self._loop is None:
+            self._start()
+        return asyncio.run_coroutine_threadsafe(self._extract(full_text, regex_fields), self._loop)
+
+    async def _extract(self, full_text, regex_fields):
+        prompt = build_llm_prompt(full_text, regex_fields)
+        cache_key = hashlib.sha256(f"{self.backend.cache_namespace()}\n{prompt}".encode('utf-8')).hexdigest()
+        if self.cache:
+            cached_result = self.cache.get_payload(cache_key)
+            if cached_result is not None:
+                self.stats["cache_hits"] += 1
+                return cached_result
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._semaphore:
+                    if self._available is False: # Önceki bir istekte yetki hatası alındı
+                        return dict(LLM_SKIPPED_RESULT)
+                    self.stats["requests"] += 1
+                    request_start = time.perf_counter()
+                    response_text = await self.backend.generate(prompt)
+                    if self.metrics:
+                        self.metrics.add_span("llm", time.perf_counter() - request_start)
+                break
+            except LlmBlockedError as e:
+                self.stats["failures"] += 1
+                return llm_error_result(f"LLM isteği engellendi: {e}")
+            except Exception as e:
+                error_kind = classify_llm_error(e)
+                if error_kind == "yetki" and self._available:
+                    self._available = False
+                    print(f"Hata: LLM arka ucu isteği yetki/anahtar hatasıyla reddetti ({e}). "
+                          f"LLM aşaması bu çalışma için devre dışı bırakıldı.")
+                if error_kind != "gecici" or attempt == self.max_retries:
+                    self.stats["failures"] += 1
+                    return llm_error_result(str(e))
+                self.stats["retries"] += 1
+                await asyncio.sleep(self.retry_base_delay * (2 ** attempt) * (0.5 + random.random()))
 
-        llm_result = json.loads(json_str)
-        print(f"    Gemini Yanıtı (işlenmiş): {llm_result}")
+        try:
+            llm_result = parse_llm_response(response_text)
+        except json.JSONDecodeError:
+            self.stats["failures"] += 1
+            return llm_error_result("LLM yanıtı JSON formatında değil")
+        if self.cache:
+            self.cache.put_payload(cache_key, llm_result)
         return llm_result
-    except json.JSONDecodeError as e:
-        print(f"    Gemini Yanıtı JSON olarak ayrıştırılamadı: {e}")
-        print(f"    Ham Yanıt: {response.text if 'response' in locals() else 'Yanıt alınamadı.'}")
-        return {"hata": "LLM yanıtı JSON formatında değil", "tarih": "Bulunamadı", "tutar": "Bulunamadı", "belge_no": "Bulunamadı", "satici_adi": "Bulunamadı"}
-    except Exception as e:
 
-        if hasattr(response, 'prompt_feedback') and response.prompt_feedback.block_reason:
-            print(f"    Gemini isteği engellendi: {response.prompt_feedback.block_reason}")
-            print(f"    Engellenme detayları: {response.prompt_feedback.safety_ratings}")
-            return {"hata": f"LLM isteği engellendi: {response.prompt_feedback.block_reason}", "tarih": "Bulunamadı", "tutar": "Bulunamadı", "belge_no": "Bulunamadı", "satici_adi": "Bulunamadı"}
-        print(f"    Gemini ile bilgi çıkarılırken hata: {e}")
-        return {"hata": str(e), "tarih": "Bulunamadı", "tutar": "Bulunamadı", "belge_no": "Bulunamadı", "satici_adi": "Bulunamadı"}
+    def close(self):
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+    def summary(self):
+        return (f"{self.stats['requests']} istek, {self.stats['cache_hits']} önbellek isabeti, "
+                f"{self.stats['retries']} yeniden deneme, {self.stats['failures']} hata")
+
+class OrderedRecordWriter:
+    # LLM yanıtları farklı sırayla tamamlanabilir; kayıtlar yine üretildikleri sırayla depoya yazılır.
+    def __init__(self, result_store, max_pending=LLM_MAX_PENDING_RECORDS, metrics=None):
+        self.result_store = result_store
+        self.max_pending = max_pending
+        self.metrics = metrics
+        self._pending = deque()
+
+    def add(self, entry_key, record, llm_future):
+        self._pending.append((entry_key, record, llm_future))
+        self.flush()
+
+    def add_callback(self, callback):
+        # Önceki tüm kayıtlar depoya yazıldıktan sonra çağrılır (ör. dosyayı işlenmiş olarak işaretlemek için)
+        self._pending.append((None, callback, None))
+        self.flush()
+
+    def flush_when_done(self, callback, executor):
+        # Bekleyen LLM sonuçlarının hepsi gelince kayıtlar yazılır ve callback çağrılır. Çağıran iş parçacığı beklemez.
+        # Son sonuç LLM döngüsünün iş parçacığında tamamlanır; fsync'li depo yazımları orada yapılsaydı diğer LLM
+        # istekleri beklerdi. Bu yüzden yazım ve callback verilen executor'a (tek iş parçacıklı yazıcı) devredilir.
+        llm_futures = [llm_future for _, _, llm_future in self._pending if llm_future is not None and not llm_future.done()]
+        remaining = [len(llm_futures) + 1]
+        lock = threading.Lock()
+
+        def write():
+            try:
+                self.flush(wait_all=True)
+            except Exception as e:
+                print(f"Hata: Kayıtlar depoya yazılamadı: {e}")
+            finally:
+                callback()
+
+        def on_done(_llm_future=None):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            executor.submit(write)
+
+        for llm_future in llm_futures:
+            llm_future.add_done_callback(on_done)
+        on_done()
+
+    def flush(self, wait_all=False):
+        while self._pending:
+            entry_key, record, llm_future = self._pending[0]
+            if llm_future is not None and not llm_future.done() and not wait_all and len(self._pending) <= self.max_pending:
+                return
+            self._pending.popleft()
+            if entry_key is None:
+                record()
+                continue
+            if llm_future is not None:
+                llm_result = llm_future.result()
+                record["cikarilan_alanlar_llm"] = llm_result
+                if llm_result != LLM_SKIPPED_RESULT:
+                    print(f"    -> LLM Çıkarılan Alanlar ({entry_key}): {llm_result}")
+            if self.metrics:
+                with self.metrics.span("json_dump"):
+                    self.result_store.append(entry_key, record)
+            else:
+                self.result_store.append(entry_key, record)
 
 #  OCR Fonksiyonları
+class OcrEngineError(RuntimeError):
+    # Motor kullanılamadığında veya OCR çağrısı hata verdiğinde yükselir. Boş sonuçtan (metinsiz sayfa) ayrılır:
+    # başarısız motorun kaydı yazılmaz, önbelleğe alınmaz ve dosya o motor için işlenmiş sayılmaz.
+    pass
+
+TESSERACT_TSV_COLUMNS = ['level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num',
+                         'left', 'top', 'width', 'height', 'conf', 'text']
+
+def _parse_tesseract_tsv(tsv_text):
+    data = {column: [] for column in TESSERACT_TSV_COLUMNS}
+    for row in tsv_text.splitlines():
+        cells = row.split('\t')
+        if len(cells) < 11 or cells[0] == 'level':
+            continue
+        if len(cells) == 11:
+            cells.append('')
+        for column, cell in zip(TESSERACT_TSV_COLUMNS[:-1], cells):
+            data[column].append(float(cell) if column == 'conf' else int(cell))
+        data['text'].append(cells[11])
+    return data
+
+def _tesseract_data_to_result(data):
+    # Tek bir TSV sonucundan hem tam metni (blok/paragraf/satır numaralarına göre satır ve
+    # paragraf boşluklarıyla) hem de kelime kutucuklarını üretir.
+    text_parts = []
+    detections = []
+    current_par_key = None
+    current_line_key = None
+    for i in range(len(data['level'])):
+        text_segment = data['text'][i]
+        if not text_segment.strip():
+            continue
+        par_key = (data['page_num'][i], data['block_num'][i], data['par_num'][i])
+        line_key = par_key + (data['line_num'][i],)
+        if line_key != current_line_key:
+            if current_line_key is not None:
+                text_parts.append("\n" if par_key == current_par_key else "\n\n")
+            current_par_key, current_line_key = par_key, line_key
+        else:
+            text_parts.append(" ")
+        text_parts.append(text_segment)
+
+        if float(data['conf'][i]) > 20:
+            (x, y, w, h) = (data['left'][i], data['top'][i], data['width'][i], data['height'][i])
+            detections.append({'text': text_segment, 'bbox': (x, y, w, h), 'confidence': float(data['conf'][i])/100})
+    return "".join(text_parts), detections
+
+def _tesseract_tsv_with_tesserocr(image_array_gray, lang):
+    api = get_tesserocr_api(lang)
+    if api is None:
+        return None
+    api.SetImage(Image.fromarray(image_array_gray))
+    return api.GetTSVText(0)
+
 def ocr_with_tesseract(image_array_gray, lang='tur'):
+    # Görüntü bir kez OCR'lanır; tam metin ve kutucuklar aynı TSV çıktısından kurulur.
+    pytesseract = import_optional_module("pytesseract")
     try:
-        full_text = pytesseract.image_to_string(image_array_gray, lang=lang)
-        data = pytesseract.image_to_data(image_array_gray, lang=lang, output_type=pytesseract.Output.DICT)
-        detections = []
-        for i in range(len(data['level'])):
-            if int(data['conf'][i]) > 20: 
-                (x, y, w, h) = (data['left'][i], data['top'][i], data['width'][i], data['height'][i])
-                text_segment = data['text'][i]
-                if text_segment.strip():
-                    detections.append({'text': text_segment, 'bbox': (x, y, w, h), 'confidence': float(data['conf'][i])/100})
-        return full_text, detections
-    except pytesseract.TesseractNotFoundError:
-        print("    Hata: Tesseract kurulu değil veya PATH'e eklenmemiş. Tesseract OCR atlanacak.")
-        return "", [] 
+        tsv_text = None
+        if TESSERACT_BACKEND in ("auto", "tesserocr"):
+            tsv_text = _tesseract_tsv_with_tesserocr(image_array_gray, lang)
+            if tsv_text is None and TESSERACT_BACKEND == "tesserocr":
+                print("    Bilgi: tesserocr kullanılamıyor, pytesseract ile devam ediliyor.")
+        if tsv_text is None:
+            if pytesseract is None:
+                raise OcrEngineError("Tesseract atlanıyor (pytesseract/tesserocr kullanılamıyor).")
+            tsv_text = pytesseract.image_to_data(image_array_gray, lang=lang)
+        return _tesseract_data_to_result(_parse_tesseract_tsv(tsv_text))
+    except OcrEngineError:
+        raise
     except Exception as e:
-        print(f"    Tesseract OCR Hatası: {e}")
-        return "", []
+        if pytesseract is not None and isinstance(e, pytesseract.TesseractNotFoundError):
+            raise OcrEngineError("Hata: Tesseract kurulu değil veya PATH'e eklenmemiş. Tesseract OCR atlanacak.") from e
+        raise OcrEngineError(f"Tesseract OCR Hatası: {e}") from e
 
 def ocr_with_easyocr(image_path_or_array, lang_list=['tr']):
+    reader = get_easyocr_reader(lang_list)
+    if reader is None:
+        raise OcrEngineError("EasyOCR atlanıyor (reader başlatılamadı).")
     try:
-
-        reader = easyocr.Reader(lang_list, gpu=False)
         result = reader.readtext(image_path_or_array, detail=1, paragraph=False)
         full_text_parts = []
         detections = []
@@ -347,33 +1593,39 @@ def ocr_with_easyocr(image_path_or_array, lang_list=['tr']):
         full_text = "\n".join(full_text_parts)
         return full_text, detections
     except Exception as e:
-        print(f"    EasyOCR Hatası: {e}")
-        return "", []
+        raise OcrEngineError(f"EasyOCR Hatası: {e}") from e
 
-def ocr_with_keras_ocr(image_path):
-    if not KERAS_OCR_AVAILABLE or keras_ocr_pipeline is None:
-        print("    Keras-OCR atlanıyor (kullanılamıyor veya pipeline başlatılamadı).")
-        return "", []
+def ocr_with_keras_ocr(image_path_or_array):
+    pipeline = get_keras_ocr_pipeline()
+    if pipeline is None:
+        raise OcrEngineError("Keras-OCR atlanıyor (kullanılamıyor veya pipeline başlatılamadı).")
     try:
-        images_to_process = [keras_ocr.tools.read(image_path)] 
-        prediction_groups = keras_ocr_pipeline.recognize(images_to_process)
-        full_text_parts = []
-        detections = []
-        if prediction_groups and prediction_groups[0]: 
-            for text_segment, box in prediction_groups[0]:
-                full_text_parts.append(text_segment)
-                detections.append({'text': text_segment, 'bbox': box.astype(int).tolist()}) 
-        full_text = "\n".join(full_text_parts)
-        return full_text, detections
+        images_to_process = [import_optional_module("keras_ocr").tools.read(image_path_or_array)] # tools.read diziyi olduğu gibi döndürür
+        prediction_groups = pipeline.recognize(images_to_process)
+        return _keras_predictions_to_result(prediction_groups[0] if prediction_groups else [])
     except Exception as e:
-        print(f"    Keras-OCR Hatası: {e}")
-        return "", []
+        raise OcrEngineError(f"Keras-OCR Hatası: {e}") from e
+
+def ocr_batch_with_keras_ocr(images_rgb):
+    # pipeline.recognize bir resim listesi alır; tek çağrıda tespit ve tanıma toplu yapılır
+    pipeline = get_keras_ocr_pipeline()
+    if pipeline is None:
+        return None
+    prediction_groups = pipeline.recognize(list(images_rgb))
+    return [_keras_predictions_to_result(predictions) for predictions in prediction_groups]
+
+def _keras_predictions_to_result(predictions):
+    full_text_parts = []
+    detections = []
+    for text_segment, box in predictions or []:
+        full_text_parts.append(text_segment)
+        detections.append({'text': text_segment, 'bbox': box.astype(int).tolist()}) 
+    return "\n".join(full_text_parts), detections
 
 def ocr_with_paddleocr(image_path_or_array):
     ocr_instance = get_paddleocr_instance()
-    if not PADDLEOCR_AVAILABLE or ocr_instance is None:
-        print("    PaddleOCR atlanıyor (kullanılamıyor veya instance başlatılamadı).")
-        return "", []
+    if ocr_instance is None:
+        raise OcrEngineError("PaddleOCR atlanıyor (kullanılamıyor veya instance başlatılamadı).")
     try:
         result = ocr_instance.ocr(image_path_or_array, cls=True)
         full_text_parts = []
@@ -397,127 +1649,1507 @@ def ocr_with_paddleocr(image_path_or_array):
         full_text = "\n".join(full_text_parts)
         return full_text, detections
     except Exception as e:
-        print(f"    PaddleOCR Hatası: {e}")
-        return "", []
+        raise OcrEngineError(f"PaddleOCR Hatası: {e}") from e
+
+# Ortak Metin Tespiti
+# Dedektör bölgeleri dörtgen ([[x, y] x 4], orijinal görüntü koordinatlarında) olarak okuma sırasıyla döndürür.
+# Tanıyıcılar bölge başına (metin, güven) döndürür; güveni vermeyen motorlar için güven None'dır.
+def _quad_bounds(quad, width, height):
+    quad = np.asarray(quad, dtype=np.float64)
+    x_min, y_min = np.floor(quad.min(axis=0)).astype(int).tolist()
+    x_max, y_max = np.ceil(quad.max(axis=0)).astype(int).tolist()
+    return max(0, x_min), max(0, y_min), min(width, x_max), min(height, y_max)
+
+def sort_regions_reading_order(quads):
+    # Bölgeler üst kenara göre sıralanır; dikey merkezleri yakın olanlar aynı satırda toplanıp soldan sağa dizilir.
+    if not quads:
+        return [], []
+    quads = [np.asarray(q, dtype=np.float64) for q in quads]
+    tops = [q[:, 1].min() for q in quads]
+    centers = [q[:, 1].mean() for q in quads]
+    heights = [q[:, 1].max() - q[:, 1].min() for q in quads]
+    tolerance = 0.5 * float(np.median(heights))
+    lines = []
+    for index in sorted(range(len(quads)), key=lambda i: tops[i]):
+        if lines and abs(centers[index] - lines[-1]["center"]) <= tolerance:
+            lines[-1]["members"].append(index)
+            lines[-1]["center"] = float(np.mean([centers[i] for i in lines[-1]["members"]]))
+        else:
+            lines.append({"center": centers[index], "members": [index]})
+    ordered_quads, line_numbers = [], []
+    for line_number, line in enumerate(lines):
+        for index in sorted(line["members"], key=lambda i: quads[i][:, 0].min()):
+            ordered_quads.append(quads[index].tolist())
+            line_numbers.append(line_number)
+    return ordered_quads, line_numbers
+
+def detect_regions_with_easyocr(image_rgb, lang_list=['tr']):
+    reader = get_easyocr_reader(lang_list)
+    if reader is None:
+        return None
+    horizontal_list, free_list = reader.detect(image_rgb)
+    horizontal_list, free_list = horizontal_list[0], free_list[0]
+    quads = [[[x_min, y_min], [x_max, y_min], [x_max, y_max], [x_min, y_max]]
+             for x_min, x_max, y_min, y_max in horizontal_list]
+    return quads + [[list(point) for point in quad] for quad in free_list]
 
-# Ana İşlem
-def main():
-    all_extracted_data = {}
-    if os.path.exists(OUTPUT_JSON_FILE):
+def detect_regions_with_paddleocr(image_bgr):
+    ocr_instance = get_paddleocr_instance()
+    if ocr_instance is None:
+        return None
+    result = ocr_instance.ocr(image_bgr, det=True, rec=False, cls=False)
+    return [[list(point) for point in quad] for quad in (result[0] or [])] if result else []
+
+def crop_region(image, quad):
+    # Eğik dörtgeni yatay bir şeride düzleştirir; dikey şeritler 90 derece döndürülür
+    quad = np.asarray(quad, dtype=np.float32)
+    width = int(max(np.linalg.norm(quad[0] - quad[1]), np.linalg.norm(quad[2] - quad[3])))
+    height = int(max(np.linalg.norm(quad[0] - quad[3]), np.linalg.norm(quad[1] - quad[2])))
+    width, height = max(width, 1), max(height, 1)
+    target = np.array([[0, 0], [width, 0], [width, height], [0, height]], dtype=np.float32)
+    crop = cv2.warpPerspective(image, cv2.getPerspectiveTransform(quad, target), (width, height),
+                               borderMode=cv2.BORDER_REPLICATE, flags=cv2.INTER_CUBIC)
+    if height / width >= 1.5:
+        crop = np.rot90(crop)
+    return crop
+
+def recognize_with_tesseract(image_array_gray, quads, lang='tur'):
+    # Kalıcı tesserocr API'si görüntüyü bir kez alır, her bölge için yalnızca dikdörtgen değişir.
+    # pytesseract her bölge için ayrı bir süreç başlatacağından bu modda desteklenmez (None: tam sayfa OCR).
+    tesserocr = import_optional_module("tesserocr")
+    api = get_tesserocr_api(lang) if TESSERACT_BACKEND != "pytesseract" else None
+    if api is None:
+        return None
+    height, width = image_array_gray.shape[:2]
+    api.SetImage(Image.fromarray(image_array_gray))
+    api.SetPageSegMode(tesserocr.PSM.SINGLE_LINE)
+    recognized = []
+    try:
+        for quad in quads:
+            x_min, y_min, x_max, y_max = _quad_bounds(quad, width, height)
+            if x_max <= x_min or y_max <= y_min:
+                recognized.append(("", 0.0))
+                continue
+            api.SetRectangle(x_min, y_min, x_max - x_min, y_max - y_min)
+            recognized.append((api.GetUTF8Text().strip(), api.MeanTextConf() / 100))
+    finally:
+        api.SetPageSegMode(tesserocr.PSM.AUTO)
+    return recognized
+
+def recognize_with_easyocr(image_array_gray, quads, lang_list=['tr']):
+    reader = get_easyocr_reader(lang_list)
+    if reader is None:
+        return None
+    height, width = image_array_gray.shape[:2]
+    horizontal_list, positions = [], {}
+    for index, quad in enumerate(quads):
+        x_min, y_min, x_max, y_max = _quad_bounds(quad, width, height)
+        horizontal_list.append([x_min, x_max, y_min, y_max])
+        positions.setdefault((x_min, y_min, x_max, y_max), []).append(index)
+    # EasyOCR sonuçları kendi sırasıyla döndürdüğü için kutu koordinatlarıyla bölgelere eşlenir
+    recognized = [("", 0.0)] * len(quads)
+    results = reader.recognize(image_array_gray, horizontal_list=horizontal_list, free_list=[],
+                               batch_size=RECOGNIZER_BATCH_SIZE, detail=1, paragraph=False)
+    for bbox_coords, text_segment, prob in results:
+        key = (int(bbox_coords[0][0]), int(bbox_coords[0][1]), int(bbox_coords[2][0]), int(bbox_coords[2][1]))
+        if positions.get(key):
+            recognized[positions[key].pop(0)] = (text_segment, float(prob))
+    return recognized
+
+def recognize_with_paddleocr(image_bgr, quads):
+    ocr_instance = get_paddleocr_instance()
+    if ocr_instance is None:
+        return None
+    if not quads:
+        return []
+    crops = [crop_region(image_bgr, quad) for quad in quads]
+    result = ocr_instance.ocr(crops, det=False, cls=True)
+    # Sürüme göre tek liste ya da kırpıntı başına bir liste döner
+    if result and len(result) == 1 and len(result[0]) == len(crops):
+        result = result[0]
+    recognized = []
+    for item in result:
+        while isinstance(item, list) and len(item) == 1 and isinstance(item[0], (list, tuple)):
+            item = item[0]
+        recognized.append((item[0], float(item[1])) if item else ("", 0.0))
+    return recognized
+
+def recognize_with_keras_ocr(image_rgb, quads):
+    pipeline = get_keras_ocr_pipeline()
+    if pipeline is None:
+        return None
+    if not quads:
+        return []
+    texts = pipeline.recognizer.recognize_from_boxes(images=[image_rgb], box_groups=[np.array(quads, dtype=np.float32)],
+                                                     batch_size=RECOGNIZER_BATCH_SIZE)[0]
+    return [(text_segment, None) for text_segment in texts]
+
+RECOGNIZER_MIN_CONFIDENCE = {"tesseract": 0.2, "easyocr": 0.15, "paddleocr": 0.3}
+
+def regions_to_result(engine_name, quads, line_numbers, recognized):
+    # Bölge tanıma sonuçlarını motorun tam sayfa çıktısıyla aynı biçime (tam metin + kutucuklar) dönüştürür
+    min_confidence = RECOGNIZER_MIN_CONFIDENCE.get(engine_name, 0.0)
+    lines, detections = {}, []
+    for quad, line_number, (text_segment, confidence) in zip(quads, line_numbers, recognized):
+        if not text_segment or not text_segment.strip():
+            continue
+        lines.setdefault(line_number, []).append(text_segment.strip())
+        if confidence is not None and confidence <= min_confidence:
+            continue
+        points = np.rint(np.asarray(quad)).astype(int)
+        x_min, y_min = points.min(axis=0).tolist()
+        x_max, y_max = points.max(axis=0).tolist()
+        if engine_name == "tesseract":
+            bbox = (x_min, y_min, x_max - x_min, y_max - y_min)
+        elif engine_name == "easyocr":
+            bbox = [x_min, y_min, x_max, y_max]
+        else:
+            bbox = points.tolist()
+        detection = {'text': text_segment, 'bbox': bbox}
+        if confidence is not None:
+            detection['confidence'] = confidence
+        detections.append(detection)
+    full_text = "\n".join(" ".join(lines[line_number]) for line_number in sorted(lines))
+    return full_text, detections
+
+
+# Sütunlu Kutucuk Tablosu
+# Bir sayfadaki tüm motorların kutucukları kelime başına sözlük yerine sütunlar halinde tutulur: eksen hizalı kutu
+# (x0, y0, x1, y1), dörtgen köşeleri, güven (yoksa NaN) ve motor kimliği (OCR_ENGINE_PLUGINS sırası) NumPy dizileridir;
+# metinler Arrow'un dize düzeninde tek bir UTF-8 tampon ve ofsetlerle saklanır. İşçiden ana sürece birkaç dizi olarak
+# taşınır, birleştirmede doğrudan kullanılır ve Parquet/Arrow'a kopyasız aktarılır.
+class DetectionTable:
+    def __init__(self, boxes, quads, confidences, engine_ids, text_data=b"", text_offsets=None):
+        self.boxes = boxes # (N, 4) float32
+        self.quads = quads # (N, 4, 2) float32
+        self.confidences = confidences # (N,) float64
+        self.engine_ids = engine_ids # (N,) uint8
+        self.text_data = text_data
+        self.text_offsets = np.zeros(1, dtype=np.int32) if text_offsets is None else text_offsets # (N + 1,) int32
+
+    def __len__(self):
+        return len(self.boxes)
+
+    @classmethod
+    def from_detections(cls, engine_name, detections):
+        # Tesseract (x, y, w, h), EasyOCR [x1, y1, x2, y2], Paddle/Keras dörtgenleri. Metni veya kutusu olmayanlar atlanır.
+        corners, confidences, encoded = [], [], []
+        for det in detections:
+            text_segment = (det.get('text') or '').strip()
+            bbox_data = det.get('bbox')
+            if not text_segment or bbox_data is None or len(bbox_data) == 0:
+                continue
+            try:
+                if len(bbox_data) == 4 and all(isinstance(n, (int, float, np.number)) for n in bbox_data):
+                    x0, y0, third, fourth = map(float, bbox_data)
+                    x1, y1 = (x0 + third, y0 + fourth) if engine_name == "tesseract" else (third, fourth)
+                    corners.append((x0, y0, x1, y0, x1, y1, x0, y1))
+                elif len(bbox_data) == 4:
+                    corners.append(tuple(float(n) for point in bbox_data for n in point[:2]))
+                else:
+                    points = np.asarray(bbox_data, dtype=np.float64).reshape(-1, 2)
+                    (x0, y0), (x1, y1) = points.min(axis=0), points.max(axis=0)
+                    corners.append((x0, y0, x1, y0, x1, y1, x0, y1))
+            except (TypeError, ValueError, IndexError):
+                continue
+            confidence = det.get('confidence')
+            confidences.append(np.nan if confidence is None else float(confidence))
+            encoded.append(text_segment.encode('utf-8'))
+        quads = np.array(corners, dtype=np.float32).reshape(-1, 4, 2)
+        text_offsets = np.zeros(len(encoded) + 1, dtype=np.int32)
+        np.cumsum(np.array([len(segment) for segment in encoded], dtype=np.int32), out=text_offsets[1:])
+        return cls(np.concatenate([quads.min(axis=1), quads.max(axis=1)], axis=1), quads,
+                   np.array(confidences, dtype=np.float64),
+                   np.full(len(encoded), ENGINE_IDS.get(engine_name, 255), dtype=np.uint8),
+                   b"".join(encoded), text_offsets)
+
+    @classmethod
+    def concat(cls, tables):
+        tables = [table for table in tables if len(table)]
+        if not tables:
+            return cls(np.empty((0, 4), np.float32), np.empty((0, 4, 2), np.float32),
+                       np.empty(0, np.float64), np.empty(0, np.uint8))
+        if len(tables) == 1:
+            return tables[0]
+        shifts = np.cumsum([0] + [len(table.text_data) for table in tables[:-1]])
+        text_offsets = np.concatenate([[0]] + [table.text_offsets[1:] + shift for table, shift in zip(tables, shifts)])
+        return cls(np.concatenate([table.boxes for table in tables]), np.concatenate([table.quads for table in tables]),
+                   np.concatenate([table.confidences for table in tables]),
+                   np.concatenate([table.engine_ids for table in tables]),
+                   b"".join(table.text_data for table in tables), text_offsets.astype(np.int32))
+
+    def texts(self):
+        bounds = self.text_offsets.tolist()
+        return [self.text_data[start:end].decode('utf-8') for start, end in zip(bounds[:-1], bounds[1:])]
+
+    def to_arrow(self, pyarrow, image_file, page_index):
+        count = len(self)
+        engine_names = pyarrow.array(list(ENGINE_IDS), pyarrow.string())
+        return pyarrow.table({
+            "kaynak_dosya": pyarrow.array([image_file], pyarrow.string()).take(np.zeros(count, dtype=np.int32)),
+            "sayfa": pyarrow.array(np.full(count, page_index or 0, dtype=np.int32), mask=np.full(count, page_index is None)),
+            "ocr_motoru": engine_names.take(self.engine_ids),
+            "text": pyarrow.StringArray.from_buffers(count, pyarrow.py_buffer(self.text_offsets),
+                                                     pyarrow.py_buffer(self.text_data)),
+            "x0": self.boxes[:, 0], "y0": self.boxes[:, 1], "x1": self.boxes[:, 2], "y1": self.boxes[:, 3],
+            "quad": pyarrow.FixedSizeListArray.from_arrays(self.quads.reshape(-1), 8),
+            "confidence": pyarrow.array(self.confidences, from_pandas=True), # NaN -> null
+        })
+
+
+# Çoklu Motor Birleştirme
+# Tüm motorların kutucukları tek bir (N, 4) x1, y1, x2, y2 dizisine dönüştürülür. Aday çiftler bir ızgara dizininden,
+# eşleşmeler toplu IoU / içerilme hesabıyla bulunur; farklı motorlardan eşleşen kutucuklar aynı kümeye bağlanır
+# ve her kümenin metni motorların ortalama güveniyle ağırlıklı oylanır.
+def find_overlap_candidates(boxes, cell_size):
+    # Her kutu kapladığı ızgara hücrelerine yazılır; aynı hücreyi paylaşan kutular (i < j) aday çift olur
+    cells = (np.maximum(boxes, 0) // cell_size).astype(np.int64)
+    spans_x = cells[:, 2] - cells[:, 0] + 1
+    counts = spans_x * (cells[:, 3] - cells[:, 1] + 1)
+    owners = np.repeat(np.arange(len(boxes)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    cell_ids = (cells[owners, 1] + offsets // spans_x[owners]) * (cells[:, 2].max() + 1) + \
+               cells[owners, 0] + offsets % spans_x[owners]
+    order = np.lexsort((owners, cell_ids))
+    cell_ids, owners = cell_ids[order], owners[order]
+    firsts, seconds = [], []
+    step = 1
+    while step < len(owners):
+        same_cell = cell_ids[step:] == cell_ids[:-step]
+        if not same_cell.any():
+            break
+        firsts.append(owners[:-step][same_cell])
+        seconds.append(owners[step:][same_cell])
+        step += 1
+    if not firsts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    pair_keys = np.unique(np.concatenate(firsts) * len(boxes) + np.concatenate(seconds))
+    return pair_keys // len(boxes), pair_keys % len(boxes)
+
+def match_boxes(boxes, firsts, seconds):
+    first_boxes, second_boxes = boxes[firsts], boxes[seconds]
+    overlap_w = np.minimum(first_boxes[:, 2], second_boxes[:, 2]) - np.maximum(first_boxes[:, 0], second_boxes[:, 0])
+    overlap_h = np.minimum(first_boxes[:, 3], second_boxes[:, 3]) - np.maximum(first_boxes[:, 1], second_boxes[:, 1])
+    intersection = np.clip(overlap_w, 0, None) * np.clip(overlap_h, 0, None)
+    first_areas = (first_boxes[:, 2] - first_boxes[:, 0]) * (first_boxes[:, 3] - first_boxes[:, 1])
+    second_areas = (second_boxes[:, 2] - second_boxes[:, 0]) * (second_boxes[:, 3] - second_boxes[:, 1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        iou = intersection / (first_areas + second_areas - intersection)
+        containment = intersection / np.minimum(first_areas, second_areas)
+    return (iou >= FUSION_IOU_THRESHOLD) | (containment >= FUSION_CONTAINMENT_THRESHOLD)
+
+def connected_labels(count, firsts, seconds):
+    # Birleşim-bul: her düğüm bağlı olduğu en küçük indise etiketlenir (toplu min yayma + işaretçi atlama)
+    labels = np.arange(count)
+    while True:
+        lowest = np.minimum(labels[firsts], labels[seconds])
+        new_labels = labels.copy()
+        np.minimum.at(new_labels, firsts, lowest)
+        np.minimum.at(new_labels, seconds, lowest)
+        new_labels = new_labels[new_labels]
+        if np.array_equal(new_labels, labels):
+            return labels
+        labels = new_labels
+
+def order_boxes_reading(boxes):
+    # Kutular dikey merkeze göre sıralanır; ardışık merkezler arasındaki fark yarım satır yüksekliğini aşınca yeni satır başlar
+    centers = (boxes[:, 1] + boxes[:, 3]) / 2
+    tolerance = 0.5 * float(np.median(boxes[:, 3] - boxes[:, 1]))
+    by_center = np.argsort(centers, kind="stable")
+    line_numbers = np.empty(len(boxes), dtype=np.int64)
+    line_numbers[by_center] = np.concatenate(([0], np.cumsum(np.diff(centers[by_center]) > tolerance)))
+    return np.lexsort((boxes[:, 0], line_numbers)), line_numbers
+
+def fuse_engine_detections(table, engine_order):
+    # table: sayfanın DetectionTable'ı; engine_order motor öncelik sırasıdır, eşit oyda önceki motor kazanır
+    fused = {"full_text": "", "detections_count": 0, "clusters": 0, "multi_engine_clusters": 0,
+             "engines": list(engine_order)}
+    if not len(table):
+        return fused
+    boxes = table.boxes.astype(np.float64)
+    texts = table.texts()
+    confidences = np.where(np.isnan(table.confidences), FUSION_DEFAULT_CONFIDENCE, table.confidences)
+    priorities = np.full(256, len(engine_order))
+    priorities[[ENGINE_IDS[engine_name] for engine_name in engine_order]] = np.arange(len(engine_order))
+    engine_ids = priorities[table.engine_ids]
+
+    cell_size = max(16.0, 2 * float(np.median(boxes[:, 3] - boxes[:, 1])))
+    firsts, seconds = find_overlap_candidates(boxes, cell_size)
+    cross_engine = engine_ids[firsts] != engine_ids[seconds]
+    firsts, seconds = firsts[cross_engine], seconds[cross_engine]
+    matched = match_boxes(boxes, firsts, seconds)
+    labels = connected_labels(len(boxes), firsts[matched], seconds[matched])
+    cluster_ids, cluster_index = np.unique(labels, return_inverse=True)
+    cluster_boxes = np.empty((len(cluster_ids), 4), dtype=np.float64)
+    cluster_boxes[:, :2], cluster_boxes[:, 2:] = np.inf, -np.inf
+    for column, reduce in ((0, np.minimum), (1, np.minimum), (2, np.maximum), (3, np.maximum)):
+        reduce.at(cluster_boxes[:, column], cluster_index, boxes[:, column])
+
+    # Küme içinde her motorun kutucukları soldan sağa birleştirilerek o motorun adayı olur
+    candidates = [{} for _ in cluster_ids]
+    cluster_list, engine_list, confidence_list = cluster_index.tolist(), engine_ids.tolist(), confidences.tolist()
+    for index in np.lexsort((boxes[:, 0], engine_ids, cluster_index)).tolist():
+        engine_texts = candidates[cluster_list[index]].setdefault(engine_list[index], ([], []))
+        engine_texts[0].append(texts[index])
+        engine_texts[1].append(confidence_list[index])
+
+    cluster_texts = [None] * len(cluster_ids)
+    cluster_confidences = np.zeros(len(cluster_ids))
+    for cluster, engine_candidates in enumerate(candidates):
+        votes = {}
+        for engine_index, (segments, segment_confidences) in sorted(engine_candidates.items()):
+            text_segment = " ".join(segments)
+            vote = votes.setdefault(" ".join(text_segment.casefold().split()), [0.0, text_segment])
+            vote[0] += sum(segment_confidences) / len(segment_confidences)
+        weight, text_segment = max(votes.values(), key=lambda vote: vote[0])
+        if len(engine_candidates) == 1 and weight < FUSION_SINGLE_ENGINE_MIN_CONFIDENCE:
+            continue
+        cluster_texts[cluster] = text_segment
+        cluster_confidences[cluster] = weight / len(engine_candidates)
+        fused["multi_engine_clusters"] += len(engine_candidates) > 1
+
+    kept = np.flatnonzero([text is not None for text in cluster_texts])
+    fused["clusters"] = len(cluster_ids)
+    if not len(kept):
+        return fused
+    order, line_numbers = order_boxes_reading(cluster_boxes[kept])
+    lines = {}
+    for position in order.tolist():
+        lines.setdefault(int(line_numbers[position]), []).append(cluster_texts[kept[position]])
+    fused["full_text"] = "\n".join(" ".join(lines[line_number]) for line_number in sorted(lines))
+    fused["detections_count"] = len(kept)
+    fused["mean_confidence"] = float(cluster_confidences[kept].mean())
+    return fused
+
+
+# Ölçümler
+# Aşama süreleri (span) ve sayaçlar. Kapalıyken span() paylaşılan boş bir bağlam döndürür,
+# böylece ek maliyet tek bir metot çağrısıyla sınırlı kalır.
+_NULL_SPAN = contextlib.nullcontext()
+
+class RunMetrics:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.spans = {} # aşama -> [çağrı sayısı, toplam sn, en uzun sn]
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def span(self, name):
+        if not self.enabled:
+            return _NULL_SPAN
+        return self._timed_span(name)
+
+    @contextlib.contextmanager
+    def _timed_span(self, name):
+        start = time.perf_counter()
         try:
-            with open(OUTPUT_JSON_FILE, 'r', encoding='utf-8') as f:
-                all_extracted_data = json.load(f)
-            print(f"Mevcut veriler {OUTPUT_JSON_FILE} dosyasından yüklendi.")
-        except json.JSONDecodeError:
-            print(f"Uyarı: {OUTPUT_JSON_FILE} dosyası okunamadı veya bozuk, sıfırdan oluşturulacak.")
-            all_extracted_data = {}
+            yield
+        finally:
+            self.add_span(name, time.perf_counter() - start)
 
-    ocr_engine_configs = {
-        "tesseract": {"function": ocr_with_tesseract, "input_type": "gray_array", "args": [TESSERACT_LANG]},
-        "easyocr": {"function": ocr_with_easyocr, "input_type": "path_or_bgr_array", "args": [EASYOCR_LANG]},
-    }
+    def add_span(self, name, elapsed, count=1, longest=None):
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self.spans.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += count
+            stats[1] += elapsed
+            stats[2] = max(stats[2], elapsed if longest is None else longest)
+
+    def increment(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self, reset=False):
+        with self._lock:
+            snapshot = {"spans": {name: list(stats) for name, stats in self.spans.items()},
+                        "counters": dict(self.counters)}
+            if reset:
+                self.spans.clear()
+                self.counters.clear()
+        return snapshot
+
+    def merge(self, snapshot):
+        for name, (count, total, longest) in snapshot.get("spans", {}).items():
+            self.add_span(name, total, count=count, longest=longest)
+        for name, value in snapshot.get("counters", {}).items():
+            self.increment(name, value)
+
+    def to_prometheus(self):
+        lines = ["# HELP dococr_stage_seconds_total Aşamada geçen toplam süre.",
+                 "# TYPE dococr_stage_seconds_total counter"]
+        lines += [f'dococr_stage_seconds_total{{stage="{name}"}} {stats[1]:.6f}' for name, stats in sorted(self.spans.items())]
+        lines += ["# HELP dococr_stage_calls_total Aşama çağrı sayısı.", "# TYPE dococr_stage_calls_total counter"]
+        lines += [f'dococr_stage_calls_total{{stage="{name}"}} {stats[0]}' for name, stats in sorted(self.spans.items())]
+        lines += ["# HELP dococr_stage_seconds_max Aşamanın en uzun tek çağrısı.", "# TYPE dococr_stage_seconds_max gauge"]
+        lines += [f'dococr_stage_seconds_max{{stage="{name}"}} {stats[2]:.6f}' for name, stats in sorted(self.spans.items())]
+        for name, value in sorted(self.counters.items()):
+            metric_name = f"dococr_{re.sub(r'[^a-zA-Z0-9_]', '_', name)}"
+            metric_type = "counter" if isinstance(value, int) else "gauge"
+            if metric_type == "counter":
+                metric_name += "_total"
+            lines += [f"# TYPE {metric_name} {metric_type}", f"{metric_name} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def write(self, output_dir, run_id):
+        os.makedirs(output_dir, exist_ok=True)
+        json_path = os.path.join(output_dir, f"run_{run_id}.json")
+        prom_path = os.path.join(output_dir, f"run_{run_id}.prom")
+        snapshot = self.snapshot()
+        snapshot["spans"] = {name: {"calls": count, "total_s": total, "max_s": longest,
+                                    "mean_s": total / count if count else 0.0}
+                             for name, (count, total, longest) in snapshot["spans"].items()}
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(dict(snapshot, run_id=run_id), f, ensure_ascii=False, indent=4)
+        with open(prom_path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        return json_path, prom_path
+
+    def print_summary(self):
+        if not self.spans:
+            return
+        print("\n== Aşama Süreleri ==")
+        for name, (count, total, longest) in sorted(self.spans.items(), key=lambda item: -item[1][1]):
+            print(f"  {name:<22} {total:8.2f} sn  ({count} çağrı, en uzun {longest:.3f} sn)")
+
+# OCR tarafındaki (işçi süreçlerdeki) ölçümler her resimden sonra ana sürece aktarılıp sıfırlanır
+ocr_metrics = RunMetrics()
+run_metrics = RunMetrics()
+
+def profile_call(label, function, *args):
+    import cProfile
+    import io
+    import pstats
+    profiler = cProfile.Profile()
+    result = profiler.runcall(function, *args)
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    profile_path = os.path.join(METRICS_DIR, f"profil_{label}.prof")
+    profiler.dump_stats(profile_path)
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(20)
+    print(stream.getvalue())
+    print(f"cProfile çıktısı: {profile_path}")
+    return result
 
-    if PADDLEOCR_AVAILABLE:
-        ocr_engine_configs["paddleocr"] = {"function": ocr_with_paddleocr, "input_type": "path_or_bgr_array", "args": []}
-    else:
-        print("Bilgi: PaddleOCR motoru kullanılamadığı için yapılandırmaya eklenmedi.")
 
-    if KERAS_OCR_AVAILABLE and keras_ocr_pipeline is not None:
-        ocr_engine_configs["keras_ocr"] = {"function": ocr_with_keras_ocr, "input_type": "path", "args": []}
+# Ana İşlem
+NUM_WORKERS = 1 # Paralel toplu işte kullanılacak süreç sayısı (0 = tüm çekirdekler)
+ENGINE_MEMORY_BUDGET_MB = 0 # Süreç (işçi) başına RSS bütçesi; 0 = sınırsız. Linux'ta /proc/self/statm ile ölçülür
+WATCH_INTERVAL = 2.0 # --watch: giriş klasörünün taranma aralığı (sn)
+WATCH_DEBOUNCE = 1.0 # --watch: bu süreden yeni değiştirilmiş (yazımı sürüyor olabilecek) dosyalar beklenir (sn)
+
+_ocr_cache = None
+_worker_state = {"is_pool_worker": False, "profile_image": None, "preprocess": None,
+                 "cascade": False, "fusion": False, "keep_detections": False,
+                 "pdf_dpi": PDF_DPI,
+                 "shared_detector": None, "shared_detector_key": None}
+_preprocess_cache = None
+_annotation_writer = AnnotationWriter()
+
+def _warm_up_tesseract():
+    import_optional_module("pytesseract")
+    if TESSERACT_BACKEND != "pytesseract":
+        get_tesserocr_api(TESSERACT_LANG)
+
+# OCR Motor Eklentileri
+# Motorlar yalnızca seçildiklerinde ve ilk kullanımda içe aktarılır/oluşturulur. "module" kurulumu
+# içe aktarmadan kontrol etmek, "modules" --timing raporu, "loader" motoru ısıtmak için kullanılır.
+# "batch_function" varsa sunucu modunda birden çok resim tek çağrıda işlenir.
+OCR_ENGINE_PLUGINS = {
+    "tesseract": {"function": ocr_with_tesseract, "input_type": "gray_array", "args": [TESSERACT_LANG],
+                  "recognizer": recognize_with_tesseract, "recognizer_input_type": "gray_array",
+                  "module": "pytesseract", "modules": ["pytesseract", "tesserocr"], "loader": _warm_up_tesseract},
+    "easyocr": {"function": ocr_with_easyocr, "input_type": "rgb_array", "args": [EASYOCR_LANG],
+                "recognizer": recognize_with_easyocr, "recognizer_input_type": "gray_array",
+                "detector": detect_regions_with_easyocr,
+                "module": "easyocr", "modules": ["easyocr"], "loader": lambda: get_easyocr_reader(EASYOCR_LANG)},
+    "paddleocr": {"function": ocr_with_paddleocr, "input_type": "bgr_array", "args": [],
+                  "recognizer": recognize_with_paddleocr, "recognizer_input_type": "bgr_array",
+                  "detector": detect_regions_with_paddleocr,
+                  "module": "paddleocr", "modules": ["paddleocr"], "loader": get_paddleocr_instance},
+    "keras_ocr": {"function": ocr_with_keras_ocr, "input_type": "rgb_array", "args": [],
+                  "batch_function": ocr_batch_with_keras_ocr,
+                  "recognizer": recognize_with_keras_ocr, "recognizer_input_type": "rgb_array",
+                  "module": "keras_ocr", "modules": ["keras_ocr"], "loader": get_keras_ocr_pipeline},
+}
+DEFAULT_OCR_ENGINES = ["tesseract", "easyocr", "paddleocr", "keras_ocr"]
+ENGINE_IDS = {engine_name: index for index, engine_name in enumerate(OCR_ENGINE_PLUGINS)} # DetectionTable motor kimlikleri
+
+def select_ocr_engines(requested_engines=None):
+    engine_names = []
+    for engine_name in requested_engines or DEFAULT_OCR_ENGINES:
+        plugin = OCR_ENGINE_PLUGINS.get(engine_name)
+        if plugin is None:
+            print(f"Hata: Bilinmeyen OCR motoru '{engine_name}'. Geçerli motorlar: {', '.join(OCR_ENGINE_PLUGINS)}")
+        elif not is_module_installed(plugin["module"]):
+            print(OPTIONAL_MODULE_MESSAGES[plugin["module"]])
+        elif engine_name not in engine_names:
+            engine_names.append(engine_name)
+    return engine_names
+
+def get_ocr_cache():
+    global _ocr_cache
+    if USE_OCR_CACHE and _ocr_cache is None:
+        _ocr_cache = OcrResultCache(OCR_CACHE_DIR, OCR_CACHE_MAX_BYTES)
+    return _ocr_cache
+
+def get_preprocess_cache():
+    global _preprocess_cache
+    if USE_PREPROCESS_CACHE and _preprocess_cache is None:
+        _preprocess_cache = NormalizedImageCache(PREPROCESS_CACHE_DIR, PREPROCESS_CACHE_MAX_BYTES)
+    return _preprocess_cache
+
+def warm_up_engines(engine_names):
+    shared_detector = _worker_state["shared_detector"]
+    for engine_name in engine_names + ([shared_detector] if shared_detector not in (None, *engine_names) else []):
+        OCR_ENGINE_PLUGINS[engine_name]["loader"]()
+
+def select_shared_detector(detector_name):
+    if not detector_name:
+        return None
+    plugin = OCR_ENGINE_PLUGINS.get(detector_name)
+    if plugin is None or "detector" not in plugin:
+        detectors = [name for name, p in OCR_ENGINE_PLUGINS.items() if "detector" in p]
+        print(f"Hata: '{detector_name}' ortak dedektör olarak kullanılamaz. Geçerli dedektörler: {', '.join(detectors)}")
+        return None
+    if not is_module_installed(plugin["module"]):
+        print(OPTIONAL_MODULE_MESSAGES[plugin["module"]])
+        return None
+    return detector_name
+
+def print_startup_timing_report(engine_names, first_result_time):
+    print("\n== Başlangıç Süreleri (--timing) ==")
+    print(f"  Temel kütüphaneler (cv2, numpy, PIL): {_CORE_IMPORT_TIME:.2f} sn")
+    for engine_name in engine_names:
+        import_time = sum(module_import_times.get(m, 0.0) for m in OCR_ENGINE_PLUGINS[engine_name]["modules"])
+        load_time = sum(t for (name, _), t in engine_load_times.items() if name == engine_name)
+        print(f"  {engine_name}: içe aktarma {import_time:.2f} sn, model yükleme {load_time:.2f} sn")
+    if "google.generativeai" in module_import_times:
+        print(f"  gemini: içe aktarma {module_import_times['google.generativeai']:.2f} sn")
+    print(f"  İlk sonuca kadar geçen süre: {first_result_time:.2f} sn")
+
+def configure_ocr_process(ocr_options):
+    global _annotation_writer
+    ocr_metrics.enabled = ocr_options.get("metrics", False)
+    _worker_state["profile_image"] = ocr_options.get("profile_image")
+    _worker_state["preprocess"] = ocr_options.get("preprocess")
+    _worker_state["pdf_dpi"] = ocr_options.get("pdf_dpi", PDF_DPI)
+    _worker_state["cascade"] = ocr_options.get("cascade", False)
+    _worker_state["fusion"] = ocr_options.get("fusion", False)
+    _worker_state["keep_detections"] = bool(ocr_options.get("detections_export"))
+    _memory_state["budget"] = ocr_options.get("memory_budget", 0)
+    shared_detector = ocr_options.get("shared_detector")
+    _worker_state["shared_detector"] = shared_detector
+    # Dedektör sürümü de önbellek anahtarına girer; dedektör değişirse bölgeler ve metinler değişir
+    _worker_state["shared_detector_key"] = f"{shared_detector}:{get_engine_version(shared_detector)}" if shared_detector else None
+    _annotation_writer.close()
+    _annotation_writer = AnnotationWriter(ocr_options.get("annotation_format", ANNOTATION_FORMAT),
+                                          ocr_options.get("annotation_max_side", ANNOTATION_MAX_SIDE))
+
+def _init_ocr_worker(engine_names, ocr_options):
+    # Her işçi süreç motorlarını yalnızca bir kez, başlangıçta oluşturur.
+    _worker_state["is_pool_worker"] = True
+    # Ctrl+C yalnızca ana süreçte işlenir; havuzu o kapatır (izleme modunda işçiler beklerken de)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    configure_ocr_process(ocr_options)
+    # Havuz kapanırken kuyrukta kalan işaretlenmiş resimler yazılmadan süreç sonlanmasın
+    multiprocessing.util.Finalize(None, lambda: _annotation_writer.close(), exitpriority=10)
+    warm_up_engines(engine_names)
+
+def build_engine_input(input_type, image_path, bgr_image, gray_image, rgb_image=None):
+    # Motorlar dosya yolu yerine bir kez çözümlenmiş diziyi alır; her motor kendi beklediği renk düzenini görür.
+    if input_type == "path":
+        return image_path
+    if input_type == "gray_array":
+        return gray_image
+    if input_type == "bgr_array":
+        return bgr_image
+    if input_type == "rgb_array":
+        return rgb_image if rgb_image is not None else cv2.cvtColor(bgr_image, cv2.COLOR_BGR2RGB)
+    return None
+
+def prepare_engine_views(original_cv_image, engine_names, image_hash):
+    # Motor girdileri yalnızca önbellekte bulunmayan ilk motor için ve resim başına bir kez hazırlanır;
+    # ön işleme açıksa tüm motorlar aynı normalleştirilmiş görüntüyü paylaşır.
+    preprocess_config = _worker_state["preprocess"]
+    bgr_image, matrix = original_cv_image, None
+    if preprocess_config:
+        preprocess_cache = get_preprocess_cache()
+        cache_key = preprocess_cache.make_key(image_hash, preprocess_config) if preprocess_cache else None
+        cached = preprocess_cache.get(cache_key) if preprocess_cache else None
+        if cached is not None:
+            bgr_image, matrix = cached
+        else:
+            with ocr_metrics.span("preprocess"):
+                bgr_image, matrix = preprocess_image_for_ocr(original_cv_image, preprocess_config)
+            if preprocess_cache:
+                preprocess_cache.put(cache_key, bgr_image, matrix)
+    with ocr_metrics.span("cvtColor"):
+        views = {"bgr": bgr_image, "gray": cv2.cvtColor(bgr_image, cv2.COLOR_BGR2GRAY), "rgb": None, "matrix": matrix}
+        input_types = {OCR_ENGINE_PLUGINS[engine_name][key] for engine_name in engine_names
+                       for key in ("input_type", "recognizer_input_type") if key in OCR_ENGINE_PLUGINS[engine_name]}
+        if _worker_state["shared_detector"]:
+            input_types.add(OCR_ENGINE_PLUGINS[_worker_state["shared_detector"]]["input_type"])
+        if "rgb_array" in input_types:
+            views["rgb"] = cv2.cvtColor(bgr_image, cv2.COLOR_BGR2RGB)
+    return views
+
+def detect_shared_regions(views):
+    # Sayfa seçili dedektörle bir kez taranır; bölgeler okuma sırasına dizilir ve tüm tanıyıcılarca paylaşılır
+    detector_name = _worker_state["shared_detector"]
+    plugin = OCR_ENGINE_PLUGINS[detector_name]
+    detect_start = time.perf_counter()
+    try:
+        quads = plugin["detector"](build_engine_input(plugin["input_type"], None, views["bgr"], views["gray"], views["rgb"]),
+                                   *plugin["args"])
+    except Exception as e:
+        print(f"    {detector_name.upper()} ortak tespit sırasında hata: {e}. Motorlar tam sayfa OCR yapacak.")
+        quads = None
+    elapsed = time.perf_counter() - detect_start
+    ocr_metrics.add_span(f"detect.{detector_name}", elapsed)
+    regions = sort_regions_reading_order(quads) if quads is not None else None
+    info = {"detector": detector_name, "regions": len(regions[0]) if regions else 0, "time": elapsed,
+            "failed": regions is None}
+    return regions, info
+
+def _band_bounds(band, height):
+    return int(band[0] * height), max(int(band[0] * height) + 1, int(band[1] * height))
+
+def engine_cache_config(page, engine_name, band=None):
+    # Önbellek anahtarına giren motor ayarları: dil/argümanlar, ön işleme, ortak dedektör ve şerit
+    additional_args = OCR_ENGINE_PLUGINS[engine_name]["args"]
+    engine_config = repr(additional_args) if page["preprocess_key"] is None else f"{additional_args!r}|{page['preprocess_key']}"
+    if _worker_state["shared_detector"] and OCR_ENGINE_PLUGINS[engine_name].get("recognizer"):
+        engine_config += f"|detect:{_worker_state['shared_detector_key']}"
+    if band:
+        engine_config += f"|band:{band[0]:.2f}-{band[1]:.2f}"
+    return engine_config
+
+def run_ocr_engine(page, engine_name, band=None):
+    # Tek bir motoru sayfa üzerinde çalıştırır (önbellek, ön işleme, ortak tespit ve işaretleme dahil).
+    # band verilirse (üst, alt oranları) yalnızca o yatay şerit OCR'lanır.
+    config = OCR_ENGINE_PLUGINS[engine_name]
+    ocr_function = config["function"]
+    input_type = config["input_type"]
+    additional_args = config["args"]
+    image_path, ocr_cache = page["image_path"], page["ocr_cache"]
+
+    # failed: motor kullanılamadı veya OCR hata verdi; boş sonuç kaydedilmez ve önbelleğe alınmaz
+    engine_result = {"engine_name": engine_name, "cache_hit": False, "inference_time": None, "failed": False,
+                     "full_text": "", "detections_count": 0, "annotated_image": None, "mean_confidence": None}
+    full_text, detections = "", []
+    recognizer = config.get("recognizer") if _worker_state["shared_detector"] else None
+    if band:
+        engine_result["band"] = list(band)
+    cache_key = ocr_cache.make_key(page["image_hash"], engine_name, engine_cache_config(page, engine_name, band)) \
+        if ocr_cache else None
+    cached_result = ocr_cache.get(cache_key) if ocr_cache else None
+    if cached_result is not None:
+        full_text, detections = cached_result
+        engine_result["cache_hit"] = True
     else:
-        print("Bilgi: Keras-OCR motoru kullanılamadığı için yapılandırmaya eklenmedi.")
-
-
-    image_files = [f for f in os.listdir(INPUT_IMAGE_DIR) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.tiff'))]
-    if not image_files:
-        print(f"'{INPUT_IMAGE_DIR}' klasöründe işlenecek resim bulunamadı.")
-        print(f"Lütfen fatura/fiş görsellerinizi '{INPUT_IMAGE_DIR}' klasörüne ekleyin.")
-        return
-
-    print(f"\nToplam {len(image_files)} adet resim işlenecek...")
-
-    for image_file in image_files:
-        image_path = os.path.join(INPUT_IMAGE_DIR, image_file)
-        base_filename = os.path.splitext(image_file)[0]
-        print(f"\n--- {image_file} İşleniyor ---")
-
-        original_cv_image = cv2.imread(image_path)
-        if original_cv_image is None:
-            print(f"    Hata: {image_file} yüklenemedi, atlanıyor.")
-            continue
-        gray_cv_image = cv2.cvtColor(original_cv_image, cv2.COLOR_BGR2GRAY)
-
-        for engine_name, config in ocr_engine_configs.items():
-            print(f"  Motor: {engine_name.upper()}")
-            ocr_function = config["function"]
-            input_type = config["input_type"]
-            additional_args = config["args"]
-
-            ocr_input = None
-            if input_type == "path":
-                ocr_input = image_path
-            elif input_type == "gray_array":
-                ocr_input = gray_cv_image
-            elif input_type == "path_or_bgr_array":
-                ocr_input = image_path
-
-            full_text, detections = "", []
+        if page["views"] is None:
+            page["views"] = prepare_engine_views(page["original_cv_image"], page["engine_names"], page["image_hash"])
+        views = page["views"]
+        if recognizer and "regions" not in views:
+            views["regions"], page["result"]["shared_detection"] = detect_shared_regions(views)
+        bgr_image, gray_image, rgb_image = views["bgr"], views["gray"], views["rgb"]
+        band_top = 0
+        if band:
+            band_top, band_bottom = _band_bounds(band, bgr_image.shape[0])
+            bgr_image, gray_image = bgr_image[band_top:band_bottom], gray_image[band_top:band_bottom]
+            rgb_image = rgb_image[band_top:band_bottom] if rgb_image is not None else None
+        batched = page["batched"].pop(engine_name, None) if page.get("batched") else None
+        if batched is not None:
+            # Toplu çalıştırmada (run_batched_engines) sonuç hazırdır; süre toplu çağrının resim başına payıdır
+            full_text, detections, engine_result["inference_time"] = batched
+        else:
+            ocr_start = time.perf_counter()
             try:
-                full_text, detections = ocr_function(ocr_input, *additional_args)
+                recognized = None
+                if recognizer and views["regions"] is not None:
+                    quads, line_numbers = views["regions"]
+                    if band:
+                        # Ortak bölgelerden yalnızca merkezi şeritte kalanlar tanınır; koordinatlar tam sayfaya göredir
+                        kept = [i for i, quad in enumerate(quads)
+                                if band_top <= np.mean([point[1] for point in quad]) < band_bottom]
+                        quads, line_numbers = [quads[i] for i in kept], [line_numbers[i] for i in kept]
+                    recognizer_input = build_engine_input(config["recognizer_input_type"], image_path,
+                                                          views["bgr"], views["gray"], views["rgb"])
+                    recognized = recognizer(recognizer_input, quads, *additional_args)
+                if recognized is not None:
+                    full_text, detections = regions_to_result(engine_name, quads, line_numbers, recognized)
+                else:
+                    ocr_input = build_engine_input(input_type, image_path, bgr_image, gray_image, rgb_image)
+                    full_text, detections = ocr_function(ocr_input, *additional_args)
+                    if band_top and detections:
+                        detections = map_detections_to_original(detections, engine_name, [[1, 0, 0], [0, 1, -band_top]])
+            except OcrEngineError as e_ocr:
+                print(f"    {e_ocr}")
+                full_text, detections = "", []
+                engine_result["failed"] = True
             except Exception as e_ocr:
                 print(f"    {engine_name.upper()} OCR sırasında genel hata: {e_ocr}")
-                full_text, detections = "", [] 
+                full_text, detections = "", []
+                engine_result["failed"] = True
+            engine_result["inference_time"] = time.perf_counter() - ocr_start
+        ocr_metrics.add_span(f"engine.{engine_name}", engine_result["inference_time"])
+        if views["matrix"] is not None and detections:
+            detections = map_detections_to_original(detections, engine_name, views["matrix"])
+        if ocr_cache and not engine_result["failed"] and full_text and full_text.strip():
+            ocr_cache.put(cache_key, full_text, detections)
+
+    engine_result["full_text"] = full_text or ""
+    engine_result["detections_count"] = len(detections)
+    confidences = [det['confidence'] for det in detections if det.get('confidence') is not None]
+    if confidences:
+        engine_result["mean_confidence"] = float(np.mean(confidences))
+    if _worker_state["fusion"] or _worker_state["keep_detections"]:
+        engine_result["detections"] = DetectionTable.from_detections(engine_name, detections)
+    if detections and _annotation_writer.enabled:
+        annotated_image_filename = _annotation_writer.filename_for(page["base_filename"], engine_name)
+        with ocr_metrics.span("annotate"):
+            annotated_image = draw_boxes_on_image(page["original_cv_image"], detections, engine_name, _annotation_writer.max_side)
+        if annotated_image is not None:
+            _annotation_writer.submit(os.path.join(OUTPUT_ANNOTATED_DIR, annotated_image_filename), annotated_image)
+            engine_result["annotated_image"] = annotated_image_filename
+    return engine_result
+
+def run_engine_cascade(page):
+    # Motorlar ucuzdan pahalıya çalıştırılır. Tüm alanlar bulunduğunda ve ortalama güven eşiğin üstündeyse durulur.
+    # Güven yeterli ama bazı alanlar eksikse bir sonraki motor yalnızca o alanların beklendiği şeritte çalışır;
+    # güven düşükse sonraki motor tam sayfayı okur ve düşük güvenli motorun bulduğu alanların yerine geçebilir.
+    fields, sources, tentative = None, {}, set()
+    band = None
+    cascade = {"stopped_engine": None, "engines_run": [], "skipped_engines": [], "region_reruns": []}
+    engine_names = page["engine_names"]
+    for tier, engine_name in enumerate(engine_names):
+        engine_result = run_ocr_engine(page, engine_name, band)
+        page["result"]["engines"].append(engine_result)
+        cascade["engines_run"].append(engine_name)
+        if band:
+            cascade["region_reruns"].append(engine_name)
+        engine_fields = field_extractor.extract(engine_result["full_text"] if engine_result["full_text"].strip() else "")
+        if fields is None:
+            fields = dict.fromkeys(engine_fields)
+        confidence = engine_result["mean_confidence"]
+        low_confidence = confidence is not None and confidence < CASCADE_MIN_CONFIDENCE
+        for field_name, value in engine_fields.items():
+            if value is not None and (fields[field_name] is None or field_name in tentative):
+                fields[field_name] = value
+                sources[field_name] = engine_name
+                if low_confidence:
+                    tentative.add(field_name)
+                else:
+                    tentative.discard(field_name)
+        missing = [field_name for field_name, value in fields.items() if value is None]
+        if not missing and not low_confidence and not tentative:
+            cascade["stopped_engine"] = engine_name
+            cascade["skipped_engines"] = engine_names[tier + 1:]
+            break
+        band = None
+        if CASCADE_REGION_RERUN and missing and not low_confidence and not tentative:
+            bands = [CASCADE_FIELD_BANDS[field_name] for field_name in missing if field_name in CASCADE_FIELD_BANDS]
+            if bands and len(bands) == len(missing):
+                band = (min(b[0] for b in bands), max(b[1] for b in bands))
+                if band == (0.0, 1.0):
+                    band = None
+    cascade["fields"] = fields or {}
+    cascade["sources"] = sources
+    return cascade
+
+def ocr_image(page_task, engine_names):
+    # Bir resmi veya belge sayfasını seçili tüm motorlarla OCR'lar. Sıralı modda ana süreçte, paralel modda
+    # işçi süreçlerde çalışır; sonuç ana sürece çıkarım ve JSON yazımı için döner.
+    image_file, page_index, _ = page_task
+    if _worker_state["profile_image"] == image_file and page_index in (None, 0):
+        result = profile_call(page_entry_base(image_file, page_index), _ocr_image, page_task, engine_names)
+    else:
+        result = _ocr_image(page_task, engine_names)
+    if ocr_metrics.enabled:
+        result["metrics"] = ocr_metrics.snapshot(reset=True)
+    return result
+
+def _ocr_image(page_task, engine_names):
+    page, result = load_ocr_page(page_task, engine_names)
+    if page is not None:
+        process_ocr_page(page)
+    return result
+
+def load_ocr_page(page_task, engine_names, image_bytes=None):
+    # Resmi/sayfayı çözümler ve motorların paylaştığı sayfa bağlamını kurar. image_bytes verilirse
+    # (sunucu yüklemeleri) dosya okunmaz. Yüklenemezse sayfa None'dır.
+    image_start = time.perf_counter()
+    image_file, page_index, page_count = page_task
+    image_path = os.path.join(INPUT_IMAGE_DIR, image_file)
+    base_filename = page_entry_base(image_file, page_index)
+    result = {"image_file": image_file, "page": page_index, "page_count": page_count,
+              "loaded": False, "engines": [], "elapsed": 0.0}
 
-            entry_key = f"{base_filename}_{engine_name}"
-            
-            if not full_text or not full_text.strip():
-                print(f"    -> {engine_name.upper()} metin çıkaramadı.")
-                regex_extracted_fields = extract_info_from_text_regex("")
+    try:
+        with ocr_metrics.span("decode"):
+            if image_bytes is not None:
+                original_cv_image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+            elif page_index is None:
+                image_bytes, original_cv_image = read_image_file(image_path)
+            else:
+                original_cv_image = render_document_page(image_path, page_index, _worker_state["pdf_dpi"])
+    except Exception as e:
+        print(f"    Hata: {image_path} okunamadı: {e}")
+        return None, result
+    if original_cv_image is None:
+        return None, result
+    result["loaded"] = True
+    ocr_cache = get_ocr_cache()
+    preprocess_config = _worker_state["preprocess"]
+    image_hash = None
+    if ocr_cache or preprocess_config:
+        with ocr_metrics.span("hash"):
+            if image_bytes is not None:
+                image_hash = hashlib.sha256(image_bytes).hexdigest()
             else:
-                print(f"    -> {engine_name.upper()} tarafından çıkarılan metin ({len(full_text)} karakter).")
-                regex_extracted_fields = extract_info_from_text_regex(full_text)
-                print(f"    -> Regex Çıkarılan Alanlar: {regex_extracted_fields}")
-
-            # LLM ile çıkarım 
-            llm_extracted_fields = {"hata": "LLM kullanılmadı veya hata oluştu."} 
-            if USE_GEMINI and full_text and full_text.strip():
-                print(f"    -> Gemini ile ek bilgi çıkarımı deneniyor...")
-                llm_extracted_fields = extract_info_with_gemini(full_text, regex_extracted_fields)
-                print(f"    -> LLM Çıkarılan Alanlar: {llm_extracted_fields}")
-            elif not USE_GEMINI:
-                 print(f"    -> LLM (Gemini) atlandı (yapılandırılmadı).")
-            elif not full_text or not full_text.strip():
-                 print(f"    -> LLM (Gemini) atlandı (OCR metni boş).")
-
-
-            all_extracted_data[entry_key] = {
+                page_key = f"{get_document_hash(image_path)}:{page_index}:{_worker_state['pdf_dpi']}"
+                image_hash = hashlib.sha256(page_key.encode('utf-8')).hexdigest()
+    del image_bytes
+    # Ön işleme ayarları önbellek anahtarına girer; kapalıyken anahtarlar önceki sürümle aynı kalır
+    page = {"image_path": image_path, "base_filename": base_filename, "original_cv_image": original_cv_image,
+            "image_hash": image_hash, "ocr_cache": ocr_cache, "engine_names": engine_names, "views": None,
+            "preprocess_key": json.dumps(preprocess_config, sort_keys=True) if preprocess_config else None,
+            "result": result, "start": image_start}
+    return page, result
+
+def process_ocr_page(page):
+    result, engine_names = page["result"], page["engine_names"]
+    if _worker_state["cascade"]:
+        result["cascade"] = run_engine_cascade(page)
+    else:
+        for engine_name in engine_names:
+            result["engines"].append(run_ocr_engine(page, engine_name))
+    if _worker_state["fusion"] or _worker_state["keep_detections"]:
+        table = DetectionTable.concat([engine_result.pop("detections") for engine_result in result["engines"]])
+        if _worker_state["fusion"]:
+            with ocr_metrics.span("fusion"):
+                result["fusion"] = fuse_engine_detections(table, [engine_result["engine_name"]
+                                                                  for engine_result in result["engines"]])
+        if _worker_state["keep_detections"]:
+            # Sayfanın tablosu yalnızca dışa aktarım istenirse ana sürece taşınır
+            result["detections"] = table
+
+    if _worker_state["is_pool_worker"] and _memory_state["report_pending"]:
+        # Yükleme süreleri ve çıkarılma sayıları son rapordan bu yana olan farklar olarak gönderilir
+        result["engine_load_times"] = dict(engine_load_times)
+        result["module_import_times"] = dict(module_import_times)
+        result["engine_memory"] = dict(engine_memory)
+        result["engine_evictions"] = dict(engine_evictions)
+        engine_load_times.clear()
+        engine_evictions.clear()
+        _memory_state["report_pending"] = False
+    result["elapsed"] = time.perf_counter() - page["start"]
+    return result
+
+def run_batched_engines(pages, engine_names):
+    # Liste alan motorlar ("batch_function") önbellekte olmayan tüm sayfaları tek çağrıda işler; sonuçlar
+    # sayfa bağlamına bırakılır ve run_ocr_engine önbellek, eşleme ve işaretleme adımlarını her sayfa için yine yapar.
+    # Kademeli çalışmada ve ortak dedektörle tanımada sayfa başına çalıştırma korunur.
+    if _worker_state["cascade"]:
+        return
+    for engine_name in engine_names:
+        config = OCR_ENGINE_PLUGINS[engine_name]
+        batch_function = config.get("batch_function")
+        if batch_function is None or (_worker_state["shared_detector"] and config.get("recognizer")):
+            continue
+        pending = [page for page in pages
+                   if not page["ocr_cache"] or page["ocr_cache"].make_key(
+                       page["image_hash"], engine_name, engine_cache_config(page, engine_name)) not in page["ocr_cache"]]
+        if len(pending) < 2:
+            continue
+        inputs = []
+        for page in pending:
+            if page["views"] is None:
+                page["views"] = prepare_engine_views(page["original_cv_image"], page["engine_names"], page["image_hash"])
+            views = page["views"]
+            inputs.append(build_engine_input(config["input_type"], page["image_path"], views["bgr"], views["gray"], views["rgb"]))
+        batch_start = time.perf_counter()
+        try:
+            batch_results = batch_function(inputs, *config["args"])
+        except Exception as e_ocr:
+            print(f"    {engine_name.upper()} toplu OCR hatası, resimler tek tek işlenecek: {e_ocr}")
+            continue
+        if batch_results is None:
+            continue
+        elapsed_share = (time.perf_counter() - batch_start) / len(pending)
+        ocr_metrics.increment(f"batched_{engine_name}_images", len(pending))
+        for page, (full_text, detections) in zip(pending, batch_results):
+            page.setdefault("batched", {})[engine_name] = (full_text, detections, elapsed_share)
+
+def extract_fields_for_result(ocr_result, record_writer, llm_stage):
+    image_file = ocr_result["image_file"]
+    base_filename = page_entry_base(image_file, ocr_result["page"])
+    engine_summaries = []
+
+    # Resmin motor metinleri birlikte verilir; aynı metni veren motorlar için çıkarım bir kez yapılır
+    texts = [engine_result["full_text"] if engine_result["full_text"].strip() else ""
+             for engine_result in ocr_result["engines"]]
+    with run_metrics.span("regex"):
+        regex_results = field_extractor.extract_deduplicated(texts)
+
+    for engine_result, regex_extracted_fields in zip(ocr_result["engines"], regex_results):
+        engine_name = engine_result["engine_name"]
+        full_text = engine_result["full_text"]
+        print(f"  Motor: {engine_name.upper()}")
+        if engine_result["cache_hit"]:
+            print(f"    -> {engine_name.upper()} sonucu önbellekten alındı.")
+        else:
+            record_engine_inference(engine_name, engine_result["inference_time"])
+            print(f"    -> {engine_name.upper()} çıkarım süresi: {engine_result['inference_time']:.2f} sn")
+
+        entry_key = f"{base_filename}_{engine_name}"
+        if engine_result["failed"]:
+            # Boş kayıt depodaki önceki (başarılı) kaydın yerine geçmesin; dosya bu motor için yeniden denenir
+            print(f"    -> {engine_name.upper()} OCR başarısız, kayıt yazılmadı (sonraki çalıştırmada yeniden denenecek).")
+            engine_summaries.append({"engine_name": engine_name, "entry_key": entry_key, "failed": True,
+                                     "regex": regex_extracted_fields, "detections_count": 0})
+            continue
+
+        if not full_text or not full_text.strip():
+            print(f"    -> {engine_name.upper()} metin çıkaramadı.")
+        else:
+            print(f"    -> {engine_name.upper()} tarafından çıkarılan metin ({len(full_text)} karakter).")
+            print(f"    -> Regex Çıkarılan Alanlar: {regex_extracted_fields}")
+
+        # LLM ile çıkarım: istek arka plandaki LLM aşamasına gönderilir, OCR döngüsü beklemez
+        if not llm_stage.is_available():
+             print(f"    -> LLM atlandı (yapılandırılmadı).")
+        elif not full_text or not full_text.strip():
+             print(f"    -> LLM atlandı (OCR metni boş).")
+        else:
+            print(f"    -> LLM ile ek bilgi çıkarımı kuyruğa alındı ({llm_stage.backend.name}).")
+        llm_future = llm_stage.submit(full_text, regex_extracted_fields)
+
+        record = {
+            "kaynak_dosya": image_file,
+            "ocr_motoru": engine_name,
+            "tam_metin": full_text.strip() if full_text else "",
+            "cikarilan_alanlar_regex": regex_extracted_fields,
+            "cikarilan_alanlar_llm": None, 
+            "detections_count": engine_result["detections_count"],
+            "annotated_image": engine_result["annotated_image"]
+        }
+        if engine_result.get("band"):
+            record["bolge"] = engine_result["band"]
+        if ocr_result["page"] is not None:
+            record["sayfa"] = ocr_result["page"] + 1
+        record_writer.add(entry_key, record, llm_future)
+        engine_summaries.append({"engine_name": engine_name, "entry_key": entry_key, "failed": False,
+                                 "regex": regex_extracted_fields, "detections_count": engine_result["detections_count"]})
+
+        if engine_result["annotated_image"]:
+            print(f"    -> İşaretlenmiş resim: {os.path.join(OUTPUT_ANNOTATED_DIR, engine_result['annotated_image'])}")
+        elif engine_result["detections_count"]:
+            print(f"    -> {engine_name.upper()} için işaretlenmiş resim yazılmadı (--annotations none).")
+        else:
+            print(f"    -> {engine_name.upper()} için kutucuk bilgisi bulunamadı.")
+
+    # Kademe ve birleşik kayıtlar, motorlardan biri başarısızsa eksik kalır; motor kayıtları gibi yazılmaz
+    failed_engines = [engine_result["engine_name"] for engine_result in ocr_result["engines"] if engine_result["failed"]]
+    cascade = ocr_result.get("cascade")
+    if cascade is not None and failed_engines:
+        print(f"    -> Kademe kaydı yazılmadı ({', '.join(failed_engines)} başarısız).")
+        engine_summaries.append({"engine_name": "cascade", "entry_key": f"{base_filename}_cascade", "failed": True,
+                                 "regex": cascade["fields"], "detections_count": 0})
+    elif cascade is not None:
+        # Kademelerin birleştirilmiş alanları ayrı bir kayıt olarak yazılır
+        stopped = cascade["stopped_engine"]
+        print(f"    -> Kademe: {' > '.join(cascade['engines_run'])}"
+              + (f", {stopped.upper()} kademesinde durdu" if stopped else ", alanlar tamamlanamadı"))
+        record = {
+            "kaynak_dosya": image_file,
+            "ocr_motoru": "cascade",
+            "cikarilan_alanlar_regex": cascade["fields"],
+            "alan_kaynaklari": cascade["sources"],
+            "calistirilan_motorlar": cascade["engines_run"],
+            "bolge_tekrarlari": cascade["region_reruns"],
+            "duran_kademe": stopped,
+            "cikarilan_alanlar_llm": dict(LLM_SKIPPED_RESULT) # Tam metni yok; kademe alanları motor kayıtlarından gelir
+        }
+        if ocr_result["page"] is not None:
+            record["sayfa"] = ocr_result["page"] + 1
+        record_writer.add(f"{base_filename}_cascade", record, None)
+        engine_summaries.append({"engine_name": "cascade", "entry_key": f"{base_filename}_cascade", "failed": False,
+                                 "regex": cascade["fields"], "detections_count": 0})
+
+    fusion = ocr_result.get("fusion")
+    if fusion is not None and failed_engines:
+        print(f"    -> Birleşik kayıt yazılmadı ({', '.join(failed_engines)} başarısız).")
+        engine_summaries.append({"engine_name": "fused", "entry_key": f"{base_filename}_fused", "failed": True,
+                                 "regex": {}, "detections_count": 0})
+    elif fusion is not None:
+        with run_metrics.span("regex"):
+            fused_fields = field_extractor.extract(fusion["full_text"])
+        print(f"    -> Birleşik sonuç: {fusion['detections_count']} kutucuk "
+              f"({fusion['multi_engine_clusters']} tanesinde motorlar örtüştü), alanlar: {fused_fields}")
+        record = {
+            "kaynak_dosya": image_file,
+            "ocr_motoru": "fused",
+            "tam_metin": fusion["full_text"],
+            "cikarilan_alanlar_regex": fused_fields,
+            "cikarilan_alanlar_llm": None, # Motor kayıtları gibi LLM aşamasından doldurulur
+            "detections_count": fusion["detections_count"],
+            "birlestirilen_motorlar": fusion["engines"],
+            "ortusen_kutucuklar": fusion["multi_engine_clusters"],
+            "annotated_image": None
+        }
+        if ocr_result["page"] is not None:
+            record["sayfa"] = ocr_result["page"] + 1
+        record_writer.add(f"{base_filename}_fused", record, llm_stage.submit(fusion["full_text"], fused_fields))
+        engine_summaries.append({"engine_name": "fused", "entry_key": f"{base_filename}_fused", "failed": False,
+                                 "regex": fused_fields, "detections_count": fusion["detections_count"]})
+    return engine_summaries
+
+class DocumentRecordAggregator:
+    # Çok sayfalı belgelerde son sayfa işlendiğinde motor başına bir belge kaydı ({belge}_{motor}) yazar.
+    # Sayfa metinleri tutulmaz; yalnızca alan değerleri ve sayfa anahtarları biriktirilir. Bir sayfası yüklenemeyen
+    # veya bir sayfasında başarısız olan motorun belge kaydı yazılmaz.
+    def __init__(self, record_writer):
+        self.record_writer = record_writer
+        self._documents = {}
+
+    def add_page(self, ocr_result, engine_summaries):
+        if ocr_result["page"] is None:
+            return
+        image_file = ocr_result["image_file"]
+        document = self._documents.setdefault(image_file, {"pages_seen": 0, "failed": False, "engines": {}})
+        document["pages_seen"] += 1
+        document["failed"] = document["failed"] or not ocr_result["loaded"]
+        for summary in engine_summaries:
+            engine_state = document["engines"].setdefault(summary["engine_name"], {
+                "fields": dict.fromkeys(summary["regex"]), "pages": [], "detections_count": 0, "failed": False})
+            if summary["failed"]:
+                engine_state["failed"] = True
+                continue
+            engine_state["pages"].append(summary["entry_key"])
+            engine_state["detections_count"] += summary["detections_count"]
+            for field_name, value in summary["regex"].items():
+                # Toplam tutar genellikle son sayfada olduğundan tutar için son, diğer alanlar için ilk bulunan değer alınır
+                if value is not None and (field_name == "tutar" or engine_state["fields"].get(field_name) is None):
+                    engine_state["fields"][field_name] = value
+        if document["pages_seen"] == ocr_result["page_count"]:
+            self._write_document(image_file, ocr_result["page_count"], self._documents.pop(image_file))
+
+    def _write_document(self, image_file, page_count, document):
+        base_filename = os.path.splitext(image_file)[0]
+        for engine_name, engine_state in document["engines"].items():
+            if document["failed"] or engine_state["failed"]:
+                print(f"  Belge kaydı yazılmadı: {base_filename}_{engine_name} (eksik sayfa)")
+                continue
+            print(f"  Belge kaydı: {base_filename}_{engine_name} ({len(engine_state['pages'])}/{page_count} sayfa)")
+            self.record_writer.add(f"{base_filename}_{engine_name}", {
                 "kaynak_dosya": image_file,
                 "ocr_motoru": engine_name,
-                "tam_metin": full_text.strip() if full_text else "",
-                "cikarilan_alanlar_regex": regex_extracted_fields,
-                "cikarilan_alanlar_llm": llm_extracted_fields, 
-                "detections_count": len(detections),
+                "sayfa_sayisi": page_count,
+                "sayfalar": engine_state["pages"],
+                "cikarilan_alanlar_regex": engine_state["fields"],
+                "cikarilan_alanlar_llm": dict(LLM_SKIPPED_RESULT), # LLM sonuçları sayfa kayıtlarındadır
+                "detections_count": engine_state["detections_count"],
                 "annotated_image": None
-            }
-
-            if detections:
-                annotated_image_filename = f"{base_filename}_{engine_name}_annotated.png"
-                annotated_image_path = os.path.join(OUTPUT_ANNOTATED_DIR, annotated_image_filename)
-                draw_boxes_on_image(image_path, detections, annotated_image_path, engine_name)
-                all_extracted_data[entry_key]["annotated_image"] = annotated_image_filename
-                print(f"    -> İşaretlenmiş resim: {annotated_image_path}")
-            else:
-                print(f"    -> {engine_name.upper()} için kutucuk bilgisi bulunamadı.")
+            }, None)
+
+@contextlib.contextmanager
+def open_ocr_pool(engine_names, workers, ocr_options):
+    # Makine öğrenmesi kütüphaneleri fork sonrası güvenli olmadığı için "spawn" kullanılır. Havuz (ve işçilerde
+    # yüklü motorlar) izleme modunda tüm çalışma boyunca korunur. Sıralı modda havuz yerine None döner.
+    if workers <= 1:
+        try:
+            yield None
+        finally:
+            _annotation_writer.close()
+        return
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(processes=workers, initializer=_init_ocr_worker, initargs=(engine_names, ocr_options)) as pool:
+        yield pool
+        # terminate yerine düzgün kapanış: işçilerin yazım kuyrukları boşaltılır
+        pool.close()
+        pool.join()
+
+def iter_ocr_results(page_tasks, engine_names, pool, max_in_flight):
+    if pool is None:
+        for page_task in page_tasks:
+            yield ocr_image(page_task, engine_names)
+        return
 
+    # Görevler sınırlı bir pencereyle verilir ve sonuçlar giriş sırasıyla alınır: yüzlerce sayfalık belgelerde
+    # bile bekleyen görev ve sonuç sayısı sabit kalır, çıktı sıralı çalıştırmayla aynıdır.
+    in_flight = deque()
+    for page_task in page_tasks:
+        in_flight.append(pool.apply_async(ocr_image, (page_task, engine_names)))
+        if len(in_flight) >= max_in_flight:
+            yield in_flight.popleft().get()
+    while in_flight:
+        yield in_flight.popleft().get()
+
+def iter_engine_passes(documents, engine_passes, pool, max_in_flight):
+    # Bellek bütçesiyle motorlar gruplanırsa tüm sayfalar her motor için ayrı bir geçişte işlenir; işçide motorlar
+    # resim başına değil geçiş başına değişir. (sonuç, ilk geçiş mi, son geçiş mi) üretilir.
+    # Bilinçli bir ödünleşim: resimler her geçişte yeniden çözümlenir, PDF sayfaları yeniden rasterleştirilir. Çözülmüş
+    # sayfaları geçişler arasında tutmak belleği belge boyutuna bağlardı (bütçenin amacına ters); sayfa başına çözümleme
+    # on milisaniyeler, motor çıkarımı ve motor yüklemesi saniyeler sürer. Ön işleme sonucu ise normalleştirilmiş görüntü
+    # önbelleğinden (USE_PREPROCESS_CACHE) okunur, yalnızca ilk geçişte hesaplanır.
+    for pass_index, pass_engines in enumerate(engine_passes):
+        if len(engine_passes) > 1:
+            print(f"\n== Motor geçişi {pass_index + 1}/{len(engine_passes)}: {', '.join(pass_engines)} ==")
+        for ocr_result in iter_ocr_results(iter_page_tasks(documents), pass_engines, pool, max_in_flight):
+            yield ocr_result, pass_index == 0, pass_index == len(engine_passes) - 1
+
+def list_input_files():
+    return [f for f in os.listdir(INPUT_IMAGE_DIR) if f.lower().endswith(IMAGE_EXTENSIONS + DOCUMENT_EXTENSIONS)]
+
+def select_pending_files(image_files, manifest, result_store, record_suffixes, no_resume=False):
+    # İşlenecek dosyaları ve dosya -> (stat, özet) bilgisini döndürür. İşlenmiş dosya listesinde olmayan ama
+    # tüm kayıtları sonuç deposunda bulunan dosyalar (liste öncesi çalışmalar) işlenmiş sayılıp listeye eklenir.
+    pending_files, file_info, reasons = [], {}, {}
+    for image_file in image_files:
+        path = os.path.join(INPUT_IMAGE_DIR, image_file)
+        try:
+            stat = os.stat(path)
+            reason, file_hash = manifest.check(image_file, stat, record_suffixes)
+            if reason == "yeni" and not no_resume and \
+                    all(f"{os.path.splitext(image_file)[0]}_{suffix}" in result_store for suffix in record_suffixes):
+                manifest.mark(image_file, stat, hash_file(path), record_suffixes)
+                reason = None
+        except OSError as e:
+            print(f"Hata: {image_file} okunamadı, atlanıyor: {e}")
+            continue
+        if reason is None and no_resume:
+            reason = "yeniden"
+        reasons[reason] = reasons.get(reason, 0) + 1
+        if reason is not None:
+            pending_files.append(image_file)
+            file_info[image_file] = (stat, file_hash)
+    if (pending_files and reasons.get(None)) or reasons.get("degisti") or reasons.get("motor"):
+        print(f"Bilgi: {reasons.get(None, 0)} dosya güncel, atlanıyor; {reasons.get('yeni', 0)} yeni, "
+              f"{reasons.get('degisti', 0)} değişmiş, {reasons.get('motor', 0)} eksik motor kaydı olan dosya işlenecek.")
+    return pending_files, file_info
+
+def build_documents(image_files):
+    documents = []
+    for image_file in image_files:
+        try:
+            page_count = count_document_pages(os.path.join(INPUT_IMAGE_DIR, image_file))
+        except Exception as e:
+            print(f"Hata: {image_file} açılamadı, atlanıyor: {e}")
+            continue
+        if page_count != 0:
+            documents.append((image_file, page_count))
+    return documents, sum(page_count or 1 for _, page_count in documents)
+
+def wait_for_new_files(watch_state, manifest, result_store, record_suffixes):
+    # Giriş klasörü yoklanır (inotify yerine taşınabilir yoklama). Boyutu ve mtime'ı art arda iki taramada
+    # aynı kalan ve WATCH_DEBOUNCE'tan eski dosyalar hazır sayılır; kopyalanması süren dosyalar beklenir.
+    # Ctrl+C ile None döner.
     try:
-        with open(OUTPUT_JSON_FILE, 'w', encoding='utf-8') as f:
-            json.dump(all_extracted_data, f, ensure_ascii=False, indent=4)
-        print(f"\n== Tüm çıkarılan veriler başarıyla {OUTPUT_JSON_FILE} dosyasına kaydedildi. ==")
+        while True:
+            time.sleep(WATCH_INTERVAL)
+            ready_files = []
+            now = time.time()
+            for image_file in list_input_files():
+                try:
+                    stat = os.stat(os.path.join(INPUT_IMAGE_DIR, image_file))
+                except OSError:
+                    continue
+                signature = (stat.st_size, stat.st_mtime_ns)
+                if watch_state["attempted"].get(image_file) == signature:
+                    continue
+                if watch_state["seen"].get(image_file) != signature:
+                    watch_state["seen"][image_file] = signature
+                    continue
+                if now - stat.st_mtime < WATCH_DEBOUNCE:
+                    continue
+                watch_state["attempted"][image_file] = signature
+                ready_files.append(image_file)
+            if ready_files:
+                pending_files, file_info = select_pending_files(ready_files, manifest, result_store, record_suffixes)
+                if pending_files:
+                    return pending_files, file_info
+    except KeyboardInterrupt:
+        return None
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fatura/fiş görsellerinden OCR ile bilgi çıkarımı.")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS,
+                        help="OCR için paralel süreç sayısı (1 = sıralı, 0 = tüm çekirdekler).")
+    parser.add_argument("--engines", default=",".join(DEFAULT_OCR_ENGINES),
+                        help=f"Çalıştırılacak OCR motorları, virgülle ayrılmış (varsayılan: {','.join(DEFAULT_OCR_ENGINES)}).")
+    parser.add_argument("--timing", action="store_true",
+                        help="Motor başına içe aktarma/yükleme sürelerini ve ilk sonuca kadar geçen süreyi raporla.")
+    parser.add_argument("--llm-backend", choices=["gemini", "stub", "none"], default=LLM_BACKEND,
+                        help="LLM çıkarım arka ucu; 'stub' ağ kullanmayan sahte sunucudur (test/ölçüm için).")
+    parser.add_argument("--llm-concurrency", type=int, default=LLM_CONCURRENCY,
+                        help="Aynı anda gönderilecek en fazla LLM isteği.")
+    parser.add_argument("--no-llm-cache", action="store_true",
+                        help="LLM yanıt önbelleğini kullanma.")
+    parser.add_argument("--metrics", action="store_true",
+                        help=f"Aşama süreleri ve sayaçları ölç; çalışma sonunda {METRICS_DIR} altına JSON ve Prometheus metni yaz.")
+    parser.add_argument("--profile-image", metavar="DOSYA_ADI",
+                        help="Yalnızca bu resmin OCR işlemini cProfile ile profille.")
+    parser.add_argument("--preprocess", action="store_true", default=PREPROCESS_ENABLED,
+                        help="Görüntüleri motorlardan önce küçült, eğikliğini düzelt ve belgeye kırp.")
+    parser.add_argument("--detect-once", metavar="DEDEKTOR", default=SHARED_DETECTOR,
+                        help="Metin bölgelerini bu motorun dedektörüyle (easyocr, paddleocr) bir kez bul; "
+                             "diğer motorlar yalnızca bu bölgelerde tanıma yapsın.")
+    parser.add_argument("--cascade", action="store_true", default=CASCADE_ENABLED,
+                        help="Motorları ucuzdan pahalıya sırayla çalıştır; alanlar yeterli güvenle bulununca dur.")
+    parser.add_argument("--fuse", action="store_true", default=FUSION_ENABLED,
+                        help="Motorların kutucuklarını eşleştirip oylayarak resim başına birleşik bir sonuç yaz.")
+    parser.add_argument("--detections", choices=["parquet", "arrow"], default=DETECTIONS_EXPORT_FORMAT,
+                        help=f"Tüm kutucukları sütunlu bir tabloya yaz ({OUTPUT_DETECTIONS_DIR} altına; pyarrow gerekir).")
+    parser.add_argument("--memory-budget", type=int, default=ENGINE_MEMORY_BUDGET_MB, metavar="MB",
+                        help="Süreç başına motor bellek bütçesi; aşılınca en uzun süredir kullanılmayan motor bellekten çıkarılır (0 = sınırsız).")
+    parser.add_argument("--pdf-dpi", type=int, default=PDF_DPI,
+                        help="PDF sayfalarının rasterleştirme çözünürlüğü.")
+    parser.add_argument("--annotations", choices=["png", "jpg", "none"], default=ANNOTATION_FORMAT,
+                        help="İşaretlenmiş resimlerin biçimi; 'none' hiç yazmaz.")
+    parser.add_argument("--annotation-max-side", type=int, default=ANNOTATION_MAX_SIDE, metavar="PIKSEL",
+                        help="İşaretlenmiş resmi en uzun kenarı bu değere inecek şekilde küçült (0 = tam boyut).")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="İşlenmiş dosya listesindeki ve sonuç deposundaki resimleri de yeniden işle.")
+    parser.add_argument("--watch", action="store_true",
+                        help=f"İlk çalışmadan sonra '{INPUT_IMAGE_DIR}' klasörünü izle ve yeni/değişen dosyaları işle (Ctrl+C ile çıkış).")
+    parser.add_argument("--export", nargs="?", const=OUTPUT_JSON_FILE, metavar="JSON_DOSYASI",
+                        help=f"Sonuç deposunu iç içe JSON biçiminde dışa aktar ve çık (varsayılan: {OUTPUT_JSON_FILE}).")
+    return parser.parse_args(argv)
+
+def export_results(output_path):
+    if not os.path.exists(OUTPUT_RESULTS_FILE):
+        print(f"Hata: {OUTPUT_RESULTS_FILE} bulunamadı, dışa aktarılacak sonuç yok.")
+        return
+    try:
+        with run_metrics.span("export.json_dump"):
+            record_count = JsonlResultStore(OUTPUT_RESULTS_FILE).export_json(output_path)
+        print(f"== {record_count} kayıt {output_path} dosyasına aktarıldı. ==")
     except Exception as e:
         print(f"Hata: JSON dosyası yazılırken sorun oluştu: {e}")
 
-if __name__ == "__main__":
-    if PADDLEOCR_AVAILABLE:
-        get_paddleocr_instance() 
+def main(argv=None):
+    args = parse_args(argv)
+    if args.export:
+        run_metrics.enabled = args.metrics
+        export_results(args.export)
+        if run_metrics.enabled:
+            run_metrics.print_summary()
+        return
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
 
-    main()
\ No newline at end of file
+    result_store = JsonlResultStore(OUTPUT_RESULTS_FILE).open(legacy_json_path=OUTPUT_JSON_FILE)
+    print(f"Sonuç deposu: {OUTPUT_RESULTS_FILE} ({len(result_store.keys)} kayıt).")
+
+    engine_names = select_ocr_engines([e.strip() for e in args.engines.split(",") if e.strip()])
+    if not engine_names:
+        print("Hata: Çalıştırılabilecek OCR motoru yok.")
+        result_store.close()
+        return
+    if args.cascade:
+        engine_names.sort(key=lambda name: CASCADE_ENGINE_ORDER.index(name) if name in CASCADE_ENGINE_ORDER
+                          else len(CASCADE_ENGINE_ORDER))
+        print(f"Kademeli çalışma sırası: {' > '.join(engine_names)}")
+    else:
+        print(f"Seçili OCR motorları: {', '.join(engine_names)}")
+
+    # Kademeli çalışmada her motorun kaydı olmayabilir; birleşik kayıt yeterlidir
+    record_suffixes = ["cascade"] if args.cascade else list(engine_names)
+    if args.fuse:
+        record_suffixes.append("fused")
+    manifest = ProcessedManifest(OUTPUT_MANIFEST_FILE).open()
+
+    image_files = list_input_files()
+    if not image_files and not args.watch:
+        print(f"'{INPUT_IMAGE_DIR}' klasöründe işlenecek resim bulunamadı.")
+        print(f"Lütfen fatura/fiş görsellerinizi '{INPUT_IMAGE_DIR}' klasörüne ekleyin.")
+        manifest.close()
+        result_store.close()
+        return
+    image_files, file_info = select_pending_files(image_files, manifest, result_store, record_suffixes, args.no_resume)
+    if not image_files and not args.watch:
+        print("Bilgi: İşlenecek yeni resim yok. Tümünü yeniden işlemek için --no-resume kullanın.")
+        manifest.close()
+        result_store.close()
+        return
+
+    documents, total_pages = build_documents(image_files)
+    if not total_pages and not args.watch:
+        manifest.close()
+        result_store.close()
+        return
+
+    if not args.watch:
+        workers = min(workers, total_pages)
+    max_in_flight = MAX_IN_FLIGHT_PAGES or 2 * workers
+    if documents:
+        print(f"\nToplam {len(documents)} dosya ({total_pages} resim/sayfa) işlenecek ({workers} süreç)...")
+    memory_budget = args.memory_budget * 2**20
+    engine_passes = [engine_names]
+    if memory_budget:
+        if get_rss_bytes() is None:
+            print("Uyarı: Bu sistemde süreç belleği (/proc/self/statm) okunamıyor; bellek bütçesi uygulanmayacak.")
+        elif len(engine_names) > 1 and not (args.cascade or args.fuse or args.detect_once):
+            # Her resim tüm motorlardan geçerse bütçe küçükken motorlar her resimde değişir; motor başına geçiş yapılır
+            engine_passes = [[engine_name] for engine_name in engine_names]
+        print(f"Bellek bütçesi: süreç başına {args.memory_budget} MB"
+              + (f", motorlar ayrı geçişlerde çalışacak (resimler her geçişte yeniden çözümlenir, {len(engine_passes)} kez)."
+                 if len(engine_passes) > 1 else "."))
+        if len(engine_names) > 1 and len(engine_passes) == 1 and get_rss_bytes() is not None:
+            print("Not: Bu modda her resim tüm motorları gerektirir; bütçe motorların toplamından küçükse motorlar "
+                  "her resimde yeniden yüklenir.")
+    detection_writer = DetectionExportWriter(OUTPUT_DETECTIONS_DIR, args.detections)
+    run_metrics.enabled = args.metrics
+    ocr_options = {"metrics": args.metrics, "profile_image": args.profile_image,
+                   "preprocess": get_preprocess_config(args.preprocess), "pdf_dpi": args.pdf_dpi,
+                   "shared_detector": select_shared_detector(args.detect_once), "cascade": args.cascade,
+                   "fusion": args.fuse, "annotation_format": args.annotations, "annotation_max_side": args.annotation_max_side,
+                   "memory_budget": memory_budget, "detections_export": detection_writer.is_available()}
+    configure_ocr_process(ocr_options)
+    if workers <= 1:
+        warm_up_engines(engine_passes[0])
+
+    llm_cache = None
+    if USE_LLM_CACHE and not args.no_llm_cache:
+        llm_cache = DiskLruCache(LLM_CACHE_DIR, LLM_CACHE_MAX_BYTES)
+    llm_stage = LlmExtractionStage(create_llm_backend(args.llm_backend), args.llm_concurrency,
+                                   cache=llm_cache, metrics=run_metrics)
+    record_writer = OrderedRecordWriter(result_store, metrics=run_metrics)
+    document_aggregator = DocumentRecordAggregator(record_writer)
+
+    failed_records = {} # dosya -> herhangi bir sayfada/geçişte başarısız olan kayıt sonekleri
+
+    def mark_processed(image_file):
+        # Dosyanın tüm kayıtları depoya yazıldıktan sonra çağrılır; işlenirken değiştiyse işaretlenmez.
+        # Yalnızca başarılı kayıtlar listeye girer; başarısız motorlar sonraki çalıştırmada yeniden denenir.
+        stat, file_hash = file_info.pop(image_file)
+        failed = failed_records.pop(image_file, set())
+        succeeded = [suffix for suffix in record_suffixes if suffix not in failed]
+        if not succeeded:
+            return
+        path = os.path.join(INPUT_IMAGE_DIR, image_file)
+        try:
+            current = os.stat(path)
+            if (current.st_size, current.st_mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+                manifest.mark(image_file, stat, file_hash or hash_file(path), succeeded)
+        except OSError:
+            pass
+
+    cache_hits, cache_misses = 0, 0
+    cascade_stop_counts, cascade_skipped_runs = {}, {}
+    processed_images = 0
+    watch_state = {"seen": {}, "attempted": {}}
+    run_start = time.perf_counter()
+    with open_ocr_pool(engine_passes[0], workers, ocr_options) as pool:
+        while True:
+            for ocr_result, first_pass, last_pass in iter_engine_passes(documents, engine_passes, pool, max_in_flight):
+                image_file = ocr_result["image_file"]
+                if ocr_result["page"] is None:
+                    print(f"\n--- {image_file} İşleniyor ---")
+                else:
+                    print(f"\n--- {image_file} sayfa {ocr_result['page'] + 1}/{ocr_result['page_count']} İşleniyor ---")
+                if not ocr_result["loaded"]:
+                    print(f"    Hata: {image_file} yüklenemedi, atlanıyor.")
+                    document_aggregator.add_page(ocr_result, [])
+                    if ocr_result["page"] is not None:
+                        # Belgenin kalan sayfaları işlenir ama belge hiçbir motor için işlenmiş sayılmaz
+                        failed_records.setdefault(image_file, set()).update(record_suffixes)
+                        if last_pass and ocr_result["page"] + 1 == ocr_result["page_count"]:
+                            record_writer.add_callback(functools.partial(mark_processed, image_file))
+                    continue
+                detection_writer.write(ocr_result)
+                for key, elapsed in ocr_result.get("engine_load_times", {}).items():
+                    engine_load_times[key] = engine_load_times.get(key, 0.0) + elapsed
+                for module_name, elapsed in ocr_result.get("module_import_times", {}).items():
+                    module_import_times[module_name] = max(module_import_times.get(module_name, 0.0), elapsed)
+                for key, size in ocr_result.get("engine_memory", {}).items():
+                    engine_memory[key] = max(engine_memory.get(key, 0), size)
+                for engine_name, count in ocr_result.get("engine_evictions", {}).items():
+                    engine_evictions[engine_name] = engine_evictions.get(engine_name, 0) + count
+                if args.timing and processed_images == 0:
+                    print_startup_timing_report(engine_names, time.perf_counter() - _PROCESS_START)
+
+                engine_summaries = extract_fields_for_result(ocr_result, record_writer, llm_stage)
+                failed_records.setdefault(image_file, set()).update(
+                    summary["engine_name"] for summary in engine_summaries if summary["failed"])
+                run_metrics.merge(ocr_result.get("metrics", {}))
+                if first_pass:
+                    processed_images += 1
+                    run_metrics.increment("images")
+                for engine_result in ocr_result["engines"]:
+                    run_metrics.increment("detections", engine_result["detections_count"])
+                    if engine_result["cache_hit"]:
+                        cache_hits += 1
+                    elif USE_OCR_CACHE:
+                        cache_misses += 1
+                cascade = ocr_result.get("cascade")
+                if cascade is not None:
+                    if cascade["stopped_engine"]:
+                        cascade_stop_counts[cascade["stopped_engine"]] = cascade_stop_counts.get(cascade["stopped_engine"], 0) + 1
+                    for engine_name in cascade["skipped_engines"]:
+                        cascade_skipped_runs[engine_name] = cascade_skipped_runs.get(engine_name, 0) + 1
+                shared_detection = ocr_result.get("shared_detection")
+                if shared_detection and not shared_detection["failed"]:
+                    print(f"    -> Ortak tespit ({shared_detection['detector']}): {shared_detection['regions']} bölge, "
+                          f"{shared_detection['time']:.2f} sn")
+                print(f"    -> Resim OCR süresi: {ocr_result['elapsed']:.2f} sn")
+                document_aggregator.add_page(ocr_result, engine_summaries)
+                if last_pass and (ocr_result["page"] is None or ocr_result["page"] + 1 == ocr_result["page_count"]):
+                    record_writer.add_callback(functools.partial(mark_processed, image_file))
+            if not args.watch:
+                break
+            record_writer.flush(wait_all=True)
+            detection_writer.close()
+            print(f"\nİzleniyor: '{INPUT_IMAGE_DIR}' (her {WATCH_INTERVAL:g} sn, çıkmak için Ctrl+C)...")
+            new_files = wait_for_new_files(watch_state, manifest, result_store, record_suffixes)
+            if new_files is None:
+                print("\nİzleme durduruldu.")
+                break
+            file_info.update(new_files[1])
+            documents, total_pages = build_documents(new_files[0])
+            print(f"\nYeni {len(documents)} dosya ({total_pages} resim/sayfa) işlenecek...")
+    ocr_elapsed = time.perf_counter() - run_start
+    record_writer.flush(wait_all=True)
+    detection_writer.close()
+    llm_stage.close()
+    run_elapsed = time.perf_counter() - run_start
+
+    manifest.close()
+    result_store.close()
+    print(f"\n== Tüm çıkarılan veriler {OUTPUT_RESULTS_FILE} dosyasına kaydedildi. ==")
+    print(f"   İç içe JSON biçimi için: python main.py --export")
+
+    print_engine_timing_summary()
+    if args.cascade:
+        print_cascade_summary(cascade_stop_counts, cascade_skipped_runs, processed_images)
+    if USE_OCR_CACHE:
+        print(f"OCR önbelleği: {format_cache_summary(cache_hits, cache_misses)}")
+        if workers > 1:
+            # İşçiler kendi görüşlerine göre sildiğinden boyut sınırı burada kesinleştirilir.
+            OcrResultCache(OCR_CACHE_DIR, OCR_CACHE_MAX_BYTES).enforce_limit()
+    if workers > 1 and ocr_options["preprocess"] and USE_PREPROCESS_CACHE:
+        NormalizedImageCache(PREPROCESS_CACHE_DIR, PREPROCESS_CACHE_MAX_BYTES).enforce_limit()
+    if llm_stage.is_available() or llm_stage.stats["requests"]: # Yetki hatasıyla kapatılsa da özet yazılır
+        print(f"LLM aşaması ({llm_stage.backend.name}): {llm_stage.summary()}, "
+              f"OCR bittikten sonra bekleme {run_elapsed - ocr_elapsed:.2f} sn")
+    images_per_second = processed_images / run_elapsed if run_elapsed > 0 else 0.0
+    print(f"Toplam: {processed_images} resim, {run_elapsed:.2f} sn, {images_per_second:.2f} resim/sn ({workers} süreç)")
+
+    if run_metrics.enabled:
+        run_metrics.increment("ocr_cache_hits", cache_hits)
+        run_metrics.increment("ocr_cache_misses", cache_misses)
+        run_metrics.increment("llm_requests", llm_stage.stats["requests"])
+        run_metrics.increment("llm_cache_hits", llm_stage.stats["cache_hits"])
+        if args.cascade:
+            run_metrics.increment("cascade_skipped_engine_runs", sum(cascade_skipped_runs.values()))
+        run_metrics.counters["run_seconds"] = run_elapsed
+        run_metrics.counters["images_per_second"] = images_per_second
+        run_metrics.print_summary()
+        json_path, prom_path = run_metrics.write(METRICS_DIR, time.strftime("%Y%m%d-%H%M%S"))
+        print(f"Ölçümler: {json_path}, {prom_path}")
+
+if __name__ == "__main__":
+    main()
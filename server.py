@@ -0,0 +1,298 @@
+import os
+import sys
+import json
+import time
+import queue
+import uuid
+import argparse
+import functools
+import threading
+import concurrent.futures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import main as dococr
+
+
+# Yapılandırma
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
+MAX_BATCH_SIZE = 8 # Bir toplu işte en fazla resim
+MAX_BATCH_WAIT_MS = 25 # İlk istekten sonra topluyu doldurmak için beklenen en uzun süre
+MAX_QUEUE_SIZE = 64 # Kuyruk doluysa yeni istekler 503 ile reddedilir
+MAX_UPLOAD_BYTES = 32 * 1024 * 1024
+REQUEST_TIMEOUT = 300 # sn
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32]
+
+
+# OCR Servisi
+# Motorlar süreç boyunca sıcak tutulur. HTTP iş parçacıkları yalnızca istekleri kuyruğa koyup yanıtı bekler;
+# tek bir toplu iş parçacığı kuyruktan küçük toplular oluşturur ve motorları yalnızca o çağırır.
+class OcrRequest:
+    def __init__(self, image_file, image_bytes):
+        self.image_file = image_file
+        self.image_bytes = image_bytes
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.records = None
+        self.batch_size = 0
+        self.queue_seconds = 0.0
+
+
+class ResponseStore:
+    # OrderedRecordWriter'ın depo arayüzü: kayıtlar yanıt için toplanır ve sonuç deposuna da yazılır.
+    # Tüm yanıtlar aynı kayıt yazıcı iş parçacığında yazıldığından ortak depo için kilit gerekmez.
+    def __init__(self, result_store):
+        self.result_store = result_store
+        self.records = {}
+
+    def append(self, key, record):
+        self.records[key] = record
+        if self.result_store is not None:
+            self.result_store.append(key, record)
+
+
+class OcrService:
+    def __init__(self, engine_names, llm_stage, result_store=None, batch_size=MAX_BATCH_SIZE,
+                 batch_wait_ms=MAX_BATCH_WAIT_MS, queue_size=MAX_QUEUE_SIZE):
+        self.engine_names = engine_names
+        self.llm_stage = llm_stage
+        self.result_store = result_store
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait_ms / 1000.0
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.last_batch_size = 0
+        self.batch_size_counts = {}
+        # fsync'li depo yazımları ne toplu iş ne de LLM döngüsü iş parçacığını bekletir
+        self._record_writer = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="record-writer")
+        self._thread = threading.Thread(target=self._run, name="ocr-batcher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def submit(self, image_file, image_bytes):
+        request = OcrRequest(image_file, image_bytes)
+        self.queue.put_nowait(request) # Kuyruk doluysa queue.Full yükselir
+        dococr.run_metrics.increment("requests")
+        return request
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.perf_counter() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._process_batch(batch)
+            except Exception as e:
+                print(f"Hata: Toplu OCR işlenemedi: {e}")
+                for request in batch:
+                    request.done.set()
+
+    def _process_batch(self, batch):
+        batch_start = time.perf_counter()
+        self.last_batch_size = len(batch)
+        self.batch_size_counts[len(batch)] = self.batch_size_counts.get(len(batch), 0) + 1
+        dococr.run_metrics.increment("batches")
+        dococr.run_metrics.increment("batched_images", len(batch))
+        loaded = []
+        for request in batch:
+            request.batch_size = len(batch)
+            request.queue_seconds = batch_start - request.enqueued_at
+            dococr.run_metrics.add_span("queue_wait", request.queue_seconds)
+            page, result = dococr.load_ocr_page((request.image_file, None, None), self.engine_names,
+                                                image_bytes=request.image_bytes)
+            request.image_bytes = None
+            if page is None:
+                request.records = {}
+                request.done.set()
+            else:
+                loaded.append((request, page))
+
+        dococr.run_batched_engines([page for _, page in loaded], self.engine_names)
+        for request, page in loaded:
+            ocr_result = dococr.process_ocr_page(page)
+            print(f"\n--- {request.image_file} İşleniyor (toplu iş: {len(batch)} resim) ---")
+            response_store = ResponseStore(self.result_store)
+            record_writer = dococr.OrderedRecordWriter(response_store, metrics=dococr.run_metrics)
+            dococr.extract_fields_for_result(ocr_result, record_writer, self.llm_stage)
+            # OCR LLM'i beklemez: her istek kendi LLM sonuçları gelince ayrı ayrı yanıtlanır
+            record_writer.flush_when_done(functools.partial(self._complete, request, response_store), self._record_writer)
+            dococr.run_metrics.merge(dococr.ocr_metrics.snapshot(reset=True))
+            dococr.run_metrics.increment("images")
+            print(f"    -> Resim OCR süresi: {ocr_result['elapsed']:.2f} sn")
+        dococr.run_metrics.add_span("batch", time.perf_counter() - batch_start)
+
+    def close(self):
+        # LLM aşaması kapatıldıktan sonra çağrılır; kuyruktaki yazımlar depo kapanmadan biter
+        self._record_writer.shutdown(wait=True)
+
+    @staticmethod
+    def _complete(request, response_store):
+        request.records = response_store.records
+        request.done.set()
+
+    def metrics_text(self):
+        lines = [dococr.run_metrics.to_prometheus().rstrip("\n"),
+                 "# HELP dococr_queue_depth Kuyrukta bekleyen istek sayısı.", "# TYPE dococr_queue_depth gauge",
+                 f"dococr_queue_depth {self.queue.qsize()}",
+                 "# TYPE dococr_queue_capacity gauge", f"dococr_queue_capacity {self.queue.maxsize}",
+                 "# TYPE dococr_last_batch_size gauge", f"dococr_last_batch_size {self.last_batch_size}",
+                 "# HELP dococr_batch_size Toplu iş başına resim sayısı.", "# TYPE dococr_batch_size histogram"]
+        sizes = dict(self.batch_size_counts)
+        for bucket in BATCH_SIZE_BUCKETS:
+            lines.append(f'dococr_batch_size_bucket{{le="{bucket}"}} '
+                         f'{sum(count for size, count in sizes.items() if size <= bucket)}')
+        lines.append(f'dococr_batch_size_bucket{{le="+Inf"}} {sum(sizes.values())}')
+        lines.append(f"dococr_batch_size_sum {sum(size * count for size, count in sizes.items())}")
+        lines.append(f"dococr_batch_size_count {sum(sizes.values())}")
+        return "\n".join(lines) + "\n"
+
+
+# HTTP Arayüzü
+# POST /ocr?filename=fatura.png  (gövde: resim baytları) -> {anahtar: kayıt} (main.py'nin yazdığı kayıtlar)
+# GET /metrics -> Prometheus metni, GET /health -> {"durum": "hazir"}
+class OcrRequestHandler(BaseHTTPRequestHandler):
+    service = None
+
+    def _send(self, status, body, content_type="application/json; charset=utf-8", headers=None):
+        payload = body if isinstance(body, bytes) else body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_json(self, status, data, headers=None):
+        self._send(status, json.dumps(data, ensure_ascii=False, indent=4), headers=headers)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/metrics":
+            self._send(200, self.service.metrics_text(), "text/plain; version=0.0.4; charset=utf-8")
+        elif path == "/health":
+            self._send_json(200, {"durum": "hazir", "motorlar": self.service.engine_names,
+                                  "kuyruk": self.service.queue.qsize()})
+        else:
+            self._send_json(404, {"hata": "Bulunamadı"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/ocr":
+            self._send_json(404, {"hata": "Bulunamadı"})
+            return
+        content_length = int(self.headers.get("Content-Length") or 0)
+        if content_length <= 0:
+            self._send_json(400, {"hata": "Gövdede resim baytları bekleniyor."})
+            return
+        if content_length > MAX_UPLOAD_BYTES:
+            self._send_json(413, {"hata": f"Resim {MAX_UPLOAD_BYTES} bayttan büyük olamaz."})
+            return
+        image_bytes = self.rfile.read(content_length)
+        filename = os.path.basename(parse_qs(url.query).get("filename", [""])[0])
+        if not filename.lower().endswith(dococr.IMAGE_EXTENSIONS):
+            filename = f"yukleme_{uuid.uuid4().hex[:8]}.png"
+        try:
+            request = self.service.submit(filename, image_bytes)
+        except queue.Full:
+            self._send_json(503, {"hata": "Kuyruk dolu, daha sonra tekrar deneyin."}, headers={"Retry-After": "1"})
+            return
+        if not request.done.wait(REQUEST_TIMEOUT):
+            self._send_json(504, {"hata": "OCR zaman aşımına uğradı."})
+            return
+        headers = {"X-DocOCR-Batch-Size": str(request.batch_size),
+                   "X-DocOCR-Queue-Seconds": f"{request.queue_seconds:.3f}"}
+        if not request.records:
+            self._send_json(422, {"hata": f"{filename} çözümlenemedi veya işlenemedi."}, headers=headers)
+            return
+        self._send_json(200, request.records, headers=headers)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="DocOCR yerel OCR sunucusu: motorları sıcak tutar, istekleri toplu işler.")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--engines", default=",".join(dococr.DEFAULT_OCR_ENGINES),
+                        help=f"Çalıştırılacak OCR motorları, virgülle ayrılmış (varsayılan: {','.join(dococr.DEFAULT_OCR_ENGINES)}).")
+    parser.add_argument("--batch-size", type=int, default=MAX_BATCH_SIZE,
+                        help="Bir toplu işte en fazla resim sayısı.")
+    parser.add_argument("--batch-wait-ms", type=int, default=MAX_BATCH_WAIT_MS,
+                        help="İlk istekten sonra topluyu doldurmak için en fazla bekleme (ms).")
+    parser.add_argument("--queue-size", type=int, default=MAX_QUEUE_SIZE,
+                        help="Kuyrukta bekleyebilecek en fazla istek.")
+    parser.add_argument("--llm-backend", choices=["gemini", "stub", "none"], default=dococr.LLM_BACKEND,
+                        help="LLM çıkarım arka ucu.")
+    parser.add_argument("--llm-concurrency", type=int, default=dococr.LLM_CONCURRENCY,
+                        help="Aynı anda gönderilecek en fazla LLM isteği.")
+    parser.add_argument("--no-llm-cache", action="store_true", help="LLM yanıt önbelleğini kullanma.")
+    parser.add_argument("--preprocess", action="store_true", default=dococr.PREPROCESS_ENABLED,
+                        help="Görüntüleri motorlardan önce normalleştir.")
+    parser.add_argument("--detect-once", metavar="DEDEKTOR", default=dococr.SHARED_DETECTOR,
+                        help="Metin bölgelerini tek bir dedektörle bul; diğer motorlar yalnızca tanıma yapsın.")
+    parser.add_argument("--fuse", action="store_true", default=dococr.FUSION_ENABLED,
+                        help="Motorların sonuçlarını birleşik bir kayıtta birleştir.")
+    parser.add_argument("--annotations", choices=["png", "jpg", "none"], default="none",
+                        help="İşaretlenmiş resimlerin biçimi (sunucuda varsayılan: none).")
+    parser.add_argument("--no-store", action="store_true",
+                        help=f"Kayıtları {dococr.OUTPUT_RESULTS_FILE} dosyasına yazma, yalnızca yanıtla döndür.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    engine_names = dococr.select_ocr_engines([e.strip() for e in args.engines.split(",") if e.strip()])
+    if not engine_names:
+        print("Hata: Çalıştırılabilecek OCR motoru yok.")
+        return
+    dococr.run_metrics.enabled = True
+    dococr.configure_ocr_process({"metrics": True, "preprocess": dococr.get_preprocess_config(args.preprocess),
+                                  "shared_detector": dococr.select_shared_detector(args.detect_once),
+                                  "fusion": args.fuse, "annotation_format": args.annotations})
+    print(f"Motorlar yükleniyor: {', '.join(engine_names)}")
+    warm_start = time.perf_counter()
+    dococr.warm_up_engines(engine_names)
+    print(f"Motorlar {time.perf_counter() - warm_start:.2f} sn içinde hazır.")
+
+    result_store = None
+    if not args.no_store:
+        result_store = dococr.JsonlResultStore(dococr.OUTPUT_RESULTS_FILE).open()
+    llm_cache = None
+    if dococr.USE_LLM_CACHE and not args.no_llm_cache:
+        llm_cache = dococr.DiskLruCache(dococr.LLM_CACHE_DIR, dococr.LLM_CACHE_MAX_BYTES)
+    llm_stage = dococr.LlmExtractionStage(dococr.create_llm_backend(args.llm_backend), args.llm_concurrency,
+                                          cache=llm_cache, metrics=dococr.run_metrics)
+    service = OcrService(engine_names, llm_stage, result_store, args.batch_size, args.batch_wait_ms, args.queue_size)
+    service.start()
+    OcrRequestHandler.service = service
+    httpd = ThreadingHTTPServer((args.host, args.port), OcrRequestHandler)
+    httpd.daemon_threads = True
+    print(f"DocOCR sunucusu http://{args.host}:{args.port} adresinde dinliyor "
+          f"(toplu iş: en fazla {service.batch_size} resim / {args.batch_wait_ms} ms).")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\nSunucu durduruluyor...")
+    finally:
+        httpd.server_close()
+        llm_stage.close()
+        service.close()
+        dococr._annotation_writer.close()
+        if result_store is not None:
+            result_store.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])